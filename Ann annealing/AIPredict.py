@@ -1,22 +1,33 @@
+import time
+from collections import OrderedDict
 import numpy as np
-from tensorflow.keras.models import load_model
-from sklearn.preprocessing import MinMaxScaler
-from joblib import load
-
-# 在程序启动时加载归一化器
-scaler_values = load('scaler_values.joblib')
-scaler_outputs = load('scaler_outputs.joblib')
-
-# 加载模型
-model = load_model('model.h5')
+from AI_Model.trajectory import build_future_matrix, build_future_temperature
+from model_registry import registry, split_backend
 
 class AI_Controller:
-    def __init__(self, setpoint, output_limits=(0, 3.85), log_function=None, max_change_rate=0.05, heating_rate=1.0):
+    def __init__(self, setpoint, output_limits=(0, 3.85), log_function=None, max_change_rate=0.05, heating_rate=1.0, backend="keras", cache_size=256, temperature_quantum=1.0, use_lookup_table=False, table_range=(0, 600)):
         self.setpoint = setpoint
         self.output_limits = output_limits
         self.log_function = log_function
         self.max_change_rate = max_change_rate  # 最大变化率
         self.heating_rate = heating_rate  # 使用传递的加热速率
+        split_backend(backend)  # 校验后端名
+        self.backend = backend  # 推理后端："keras"、"numpy" 或 "numpy-float32"
+
+        # 预测结果 LRU 缓存，键为 (量化温度, setpoint, 加热速率, 模型版本)
+        self.cache_size = cache_size  # 为 0 时不使用缓存
+        self.temperature_quantum = temperature_quantum  # 温度量化步长 (°C)
+        self._cache = OrderedDict()
+        self._cache_version = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+
+        # 每次运行预先计算的查找表：每个整数红外温度对应的预测电流
+        self.use_lookup_table = use_lookup_table
+        self.table_range = table_range  # 查找表覆盖的红外温度范围 (°C)
+        self.lookup_table = None
+        self._lookup_key = None
 
     def ai_predict(self, current_value):
         """
@@ -29,46 +40,112 @@ class AI_Controller:
         - 预测的电流值 (float)
         """
         try:
-            ### 1. 构建未来温度矩阵 (20维) ###
-            # 初始化未来温度矩阵
-            future_temperature = np.zeros((1, 20))
-            future_temperature[0, 0] = current_value
-
-            # 根据 current_value 和 self.setpoint 计算梯度并填充未来温度矩阵
-            for i in range(1, 20):
+            if self.use_lookup_table:
+                prediction = self.lookup(current_value)
+                if prediction is not None:
+                    return prediction
+
+            if self.cache_size <= 0:
+                return self._predict_one(current_value)
+
+            # 模型或归一化器文件更新后版本号变化，旧缓存全部作废
+            registry.get(self.backend)
+            version = registry.version(self.backend)
+            if version != self._cache_version:
+                self.clear_cache()
+                self._cache_version = version
+
+            quantized = round(current_value / self.temperature_quantum)
+            key = (quantized, self.setpoint, self.heating_rate, version)
+            prediction = self._cache.get(key)
+            if prediction is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return prediction
+
+            self.cache_misses += 1
+            prediction = self._predict_one(quantized * self.temperature_quantum)
+            self._cache[key] = prediction
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.cache_evictions += 1
+            return prediction
 
-                # 计算当前值与 setpoint 的距离
-                distance_to_setpoint = abs(current_value - self.setpoint)
+        except Exception as e:
+            print(f"AI Prediction failed: {e}")
+            # 在预测失败时，返回当前电流值
+            return current_value
 
-                # 根据距离调整梯度
-                if distance_to_setpoint > 5 + self.setpoint / 20 * self.heating_rate ** 1.5:
-                    
-                    gradient = self.heating_rate if current_value < self.setpoint else -self.heating_rate / 2
-                else:
-                    gradient = self.heating_rate / 2
+    def _predict_one(self, current_value):
+        ### 1. 构建未来温度矩阵 (20维) ###
+        future_temperature = build_future_temperature(current_value, self.setpoint, self.heating_rate)
 
-                # 计算下一个值
-                next_value = future_temperature[0, i-1] + gradient
-                if (gradient > 0 and next_value > self.setpoint) or (gradient < 0 and next_value < self.setpoint):
-                    future_temperature[0, i] = self.setpoint
-                else:
-                    future_temperature[0, i] = next_value
+        ### 2. 使用模型进行预测（模型在第一次使用时由 registry 加载） ###
+        ### 3. 预测结果已反归一化为电流值 ###
+        prediction = registry.predict(self.backend, future_temperature)
 
-            # 对未来温度矩阵进行归一化
-            future_values_scaled = scaler_values.transform(future_temperature)
+        ### 4. 将预测值限制为三位小数 ###
+        prediction = np.round(prediction, 3)
 
-            ### 2. 使用模型进行预测 ###
-            prediction_scaled = model.predict(future_values_scaled, verbose=0)
+        return prediction[0, 0]
 
-            ### 3. 反归一化预测结果 ###
-            prediction = scaler_outputs.inverse_transform(prediction_scaled)
+    def build_lookup_table(self):
+        """一次批量计算 table_range 内所有整数红外温度的预测电流，返回耗时 (s)"""
+        start = time.perf_counter()
+        t_min, t_max = self.table_range
+        temperatures = np.arange(int(t_min), int(t_max) + 1)
+        self.lookup_table = self.predict_batch(temperatures)
+        self._lookup_key = (self.setpoint, self.heating_rate, registry.version(self.backend))
+        return time.perf_counter() - start
 
-            ### 4. 将预测值限制为三位小数 ###
-            prediction = np.round(prediction, 3)
+    def lookup(self, current_value):
+        """
+        从查找表读取预测电流，非整数温度（如传感器失效时外推的温度）线性插值。
+        setpoint、加热速率或模型版本变化时自动重建；超出表范围时返回 None。
+        """
+        registry.get(self.backend)
+        if self._lookup_key != (self.setpoint, self.heating_rate, registry.version(self.backend)):
+            elapsed = self.build_lookup_table()
+            print(f"AI lookup table built: {len(self.lookup_table)} entries in {elapsed * 1000:.1f} ms")
+
+        position = current_value - int(self.table_range[0])
+        if position < 0 or position > len(self.lookup_table) - 1:
+            return None
+        index = int(position)
+        if index == position:
+            return self.lookup_table[index]
+        fraction = position - index
+        return round(self.lookup_table[index] + fraction * (self.lookup_table[index + 1] - self.lookup_table[index]), 3)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def cache_info(self):
+        """返回缓存命中、未命中和淘汰次数"""
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'evictions': self.cache_evictions,
+            'size': len(self._cache),
+            'max_size': self.cache_size,
+        }
+
+    def predict_batch(self, current_values, setpoints=None, heating_rates=None):
+        """
+        对一批状态进行一次前向计算。
 
-            return prediction[0, 0]
+        参数:
+        - current_values: 当前温度数组 (N,)
+        - setpoints: 每行的目标温度，默认使用 self.setpoint
+        - heating_rates: 每行的加热速率，默认使用 self.heating_rate
 
-        except Exception as e:
-            print(f"AI Prediction failed: {e}")
-            # 在预测失败时，返回当前电流值
-            return current_value
+        返回:
+        - 预测的电流值数组 (N,)，保留三位小数
+        """
+        if setpoints is None:
+            setpoints = self.setpoint
+        if heating_rates is None:
+            heating_rates = self.heating_rate
+        future_temperature = build_future_matrix(current_values, setpoints, heating_rates)
+        prediction = registry.predict(self.backend, future_temperature)
+        return np.round(prediction[:, 0], 3)
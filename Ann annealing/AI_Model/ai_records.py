@@ -0,0 +1,230 @@
+'''
+AI 控制记录的二进制格式（替代 ai_log.txt）：
+文件头之后是定长的 NumPy 结构化记录，只追加写入；可以直接内存映射读取，训练时无需逐行解析文本。
+原文本日志中的 "#" 行和空行分别对应 RUN_START 和 SEGMENT_BREAK 标记记录。
+
+用法:
+- python ai_records.py convert ai_log.txt ai_log.airec   文本日志转换为二进制
+- python ai_records.py dump ai_log.airec [ai_log.txt]    二进制日志转换回文本
+'''
+import os
+import re
+import struct
+import sys
+import time
+import numpy as np
+
+MAGIC = b'AIREC\x00\x01\x00'
+HEADER_SIZE = 16  # MAGIC (8) + 记录长度 (4) + 保留 (4)
+
+# 记录类型
+SAMPLE = 0
+RUN_START = 1  # 对应 "# Setpoint: ..., Heating Rate: ..." 行，current_value 为 setpoint，output 为加热速率
+SEGMENT_BREAK = 2  # 对应空行或无法解析的行，表示数据间断
+
+RECORD_DTYPE = np.dtype([
+    ('kind', 'u1'),
+    ('run', 'u4'),  # 文件内第几次运行（RUN_START 计数）
+    ('wall_time', 'f8'),  # time.time()，转换的文本日志中为 NaN
+    ('monotonic', 'f8'),  # time.monotonic()，转换的文本日志中为 NaN
+    ('current_value', 'f8'),  # 红外温度 (°C)
+    ('output', 'f8'),  # 电流 (A)
+    ('voltage', 'f8'),  # 电压 (V)，未测量时为 NaN
+    ('interval', 'f8'),  # 与同一段内上一条样本的时间间隔 (s)
+])
+
+_SETPOINT_RE = re.compile(r'Setpoint:\s*([-+0-9.eE]+).*?Heating Rate:\s*([-+0-9.eE]+)')
+_TIMESTAMP_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} - ')  # log.log_to_file 写在每行开头的时间戳
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def parse_log_line(line):
+    """
+    解析文本日志中的一行样本，兼容 "Voltage: 25.000"、旧格式 "Voltage 25.000" 和 "Voltage: Not measured"；
+    行首可以带 log_to_file 写入的 "YYYY-mm-dd HH:MM:SS - " 时间戳。
+
+    返回:
+    - (current_value, output, voltage, time_interval)，电压不是数值时为 NaN；格式不正确时返回 None
+    """
+    fields = {}
+    for part in _TIMESTAMP_RE.sub('', line.strip()).split(', '):
+        key, sep, value = part.partition(': ')
+        if not sep:
+            key, _, value = part.rpartition(' ')
+        fields[key.strip()] = value.strip()
+    try:
+        current_value = float(fields['Current Value'])
+        output = float(fields['Output'])
+        interval_str = fields['Time Interval'].replace(' s', '').replace('s', '').strip()
+    except (KeyError, ValueError):
+        return None
+    time_interval = _to_float(interval_str) if interval_str else 0.0
+    if np.isnan(time_interval):
+        return None
+    return current_value, output, _to_float(fields.get('Voltage', 'nan')), time_interval
+
+
+class AIRecordLog:
+    """只追加的二进制记录写入器，由控制循环调用"""
+
+    def __init__(self, path):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        if exists:
+            records = open_records(path)
+            self.run = int(np.count_nonzero(records['kind'] == RUN_START))
+            # 截掉上次异常退出时写了一半的记录
+            valid_size = HEADER_SIZE + len(records) * RECORD_DTYPE.itemsize
+            del records
+            if os.path.getsize(path) != valid_size:
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_size)
+        else:
+            self.run = 0
+        self._file = open(path, 'ab')
+        if not exists:
+            self._file.write(MAGIC + struct.pack('<II', RECORD_DTYPE.itemsize, 0))
+            self._file.flush()
+        self._record = np.zeros(1, dtype=RECORD_DTYPE)
+        self._last_time = None  # 同一段内上一条样本的单调时间
+
+    def _write(self, kind, current_value=np.nan, output=np.nan, voltage=np.nan, interval=np.nan):
+        record = self._record
+        record['kind'] = kind
+        record['run'] = self.run
+        record['wall_time'] = time.time()
+        record['monotonic'] = time.monotonic()
+        record['current_value'] = current_value
+        record['output'] = output
+        record['voltage'] = voltage
+        record['interval'] = interval
+        self._file.write(record.tobytes())
+        self._file.flush()
+
+    def start_run(self, setpoint, heating_rate):
+        """开始新的一次运行（原文本日志中的 "# Setpoint" 行）"""
+        self.run += 1
+        self._last_time = None
+        self._write(RUN_START, setpoint, heating_rate)
+
+    def segment_break(self):
+        """数据间断（原文本日志中的空行）"""
+        self._last_time = None
+        self._write(SEGMENT_BREAK)
+
+    def append(self, current_value, output, voltage):
+        """记录一次 AI 计算；voltage 不是数值（如 "Not measured"）时记为 NaN"""
+        now = time.monotonic()
+        interval = 0.0 if self._last_time is None else now - self._last_time
+        self._last_time = now
+        if isinstance(voltage, str) or voltage is None:
+            voltage = np.nan
+        self._write(SAMPLE, current_value, output, voltage, interval)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def is_record_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_records(path):
+    """以只读内存映射打开记录文件，末尾不完整的记录被忽略"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an AI record log")
+    itemsize = struct.unpack('<I', header[8:12])[0]
+    if itemsize != RECORD_DTYPE.itemsize:
+        raise ValueError(f"Unsupported record size {itemsize} in {path}")
+    count = (os.path.getsize(path) - HEADER_SIZE) // itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def segment_ids(records):
+    """每条记录所在的段号：每个 RUN_START 或 SEGMENT_BREAK 标记开始新的一段"""
+    return np.cumsum(records['kind'] != SAMPLE)
+
+
+def to_entries(records):
+    """转换为 data.process_data 使用的列表：样本为 (current_value, output, voltage, time_interval)，标记为 None"""
+    entries = []
+    for kind, current_value, output, voltage, interval in zip(
+            records['kind'].tolist(), records['current_value'].tolist(), records['output'].tolist(),
+            records['voltage'].tolist(), records['interval'].tolist()):
+        entries.append((current_value, output, voltage, interval) if kind == SAMPLE else None)
+    return entries
+
+
+def read_text_log(path):
+    """把文本日志解析为记录数组；"# Setpoint" 行转为 RUN_START，其余 "#" 行、空行和无法解析的行转为 SEGMENT_BREAK"""
+    rows = []
+    run = 0
+    with open(path, 'r') as file:
+        for line in file:
+            stripped = line.strip()
+            if stripped.startswith('#'):
+                match = _SETPOINT_RE.search(stripped)
+                if match:
+                    run += 1
+                    rows.append((RUN_START, run, np.nan, np.nan, float(match.group(1)), float(match.group(2)),
+                                 np.nan, np.nan))
+                else:
+                    rows.append((SEGMENT_BREAK, run, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan))
+                continue
+            sample = parse_log_line(stripped) if stripped else None
+            if sample is None:
+                rows.append((SEGMENT_BREAK, run, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan))
+            else:
+                rows.append((SAMPLE, run, np.nan, np.nan) + sample)
+    return np.array(rows, dtype=RECORD_DTYPE)
+
+
+def convert_text_log(text_path, record_path):
+    """把文本日志转换为二进制记录文件，返回记录条数"""
+    records = read_text_log(text_path)
+    with open(record_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<II', RECORD_DTYPE.itemsize, 0))
+        f.write(records.tobytes())
+    return len(records)
+
+
+def write_text_log(records, text_path):
+    """把记录写回原文本日志格式，便于人工查看"""
+    with open(text_path, 'w') as f:
+        for record in records:
+            kind = record['kind']
+            if kind == RUN_START:
+                f.write(f"# Setpoint: {record['current_value']}, Heating Rate: {record['output']}\n")
+            elif kind == SEGMENT_BREAK:
+                f.write("\n")
+            else:
+                voltage = "Not measured" if np.isnan(record['voltage']) else f"{record['voltage']:.3f}"
+                f.write(f"Current Value: {record['current_value']:.2f}, Output: {record['output']:.3f}, "
+                        f"Voltage: {voltage}, Time Interval: {record['interval']:.2f} s\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == 'convert':
+        start = time.perf_counter()
+        count = convert_text_log(sys.argv[2], sys.argv[3])
+        print(f"Converted {count} records to {sys.argv[3]} in {time.perf_counter() - start:.2f} s")
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'dump':
+        records = open_records(sys.argv[2])
+        text_path = sys.argv[3] if len(sys.argv) >= 4 else os.path.splitext(sys.argv[2])[0] + '.txt'
+        write_text_log(records, text_path)
+        print(f"Wrote {len(records)} records to {text_path}")
+    else:
+        print(__doc__)
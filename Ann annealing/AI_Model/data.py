@@ -1,14 +1,42 @@
 '''
 提取、整理数据用于机器学习模型训练
+
+基准测试: python data.py benchmark [行数]   比较逐行实现与向量化实现的耗时并核对结果
+流式构建: python data.py build ai_log.airec [outputs.npy future_values.npy]   逐块读取日志直接写入 .npy，内存占用固定
 '''
+import io
+import os
+import sys
+import time
+from itertools import islice
 import numpy as np
+from ai_records import (is_record_file, open_records, to_entries, parse_log_line, RECORD_DTYPE, SAMPLE, RUN_START,
+                        SEGMENT_BREAK)
 
-def process_data(file_path):
-    data = []
+HORIZON = 20  # 未来数据的时长 (s)
+FUTURE_TIMES = np.arange(1, HORIZON + 1, 1)  # 1到20秒的整数时间点
+CHUNK_ROWS = 65536  # 向量化构建时每批处理的数据点数，限制临时矩阵的内存
+CHUNK_LINES = 200000  # 流式读取日志时每块的行数
 
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
+# 数据点作废的原因及批量汇总时的说明
+SKIP_REASONS = {
+    'interrupted': "future window interrupted by a blank/comment line",
+    'non_positive': "non-positive time interval in the future window",
+    'insufficient': f"less than {HORIZON} s of future data",
+    'no_points': "no future point within the window for interpolation",
+}
 
+
+def parse_log_lines(lines):
+    """
+    解析若干行文本日志。
+
+    返回:
+    - (data, bad)：data 中样本为 (current_value, output, voltage, time_interval)，空行、注释行和格式不正确的行为 None
+      （数据间断）；bad 为格式不正确的行在 lines 中的下标
+    """
+    data = []
+    bad = []
     # 读取数据时，保留空行和注释行，用于标示数据间断
     for index, line in enumerate(lines):
         stripped_line = line.strip()
@@ -18,24 +46,454 @@ def process_data(file_path):
             data.append(None)
             continue
 
-        parts = stripped_line.split(', ')
-        if len(parts) < 4:
-            print(f"Skipping line {index} due to unexpected format: {stripped_line}")
-            data.append(None)  # 格式不正确的行也作为间断
-            continue
+        # 电压为 "Not measured" 时记为 NaN，不再使整行作废
+        sample = parse_log_line(stripped_line)
+        if sample is None:
+            bad.append(index)  # 格式不正确的行也作为间断
+        data.append(sample)
+    return data, bad
 
-        try:
-            current_value = float(parts[0].split('Current Value: ')[1])
-            output = float(parts[1].split('Output: ')[1])
-            voltage = float(parts[2].split('Voltage ')[1])  # 解析 Voltage
-            time_interval_str = parts[3].split('Time Interval: ')[1].replace(' s', '').strip()
-            time_interval = float(time_interval_str) if time_interval_str else 0.0
-            data.append((current_value, output, voltage, time_interval))  # 存储 Voltage
-        except (IndexError, ValueError) as e:
-            print(f"Error parsing line {index}: {stripped_line} - {e}")
-            data.append(None)  # 如果解析出错，也作为间断
-            continue
 
+def iter_log_entries(file_path, chunk_lines=CHUNK_LINES, verbose=True):
+    """逐块读取文本日志，每次产出不超过 chunk_lines 行解析后的列表（格式同 parse_log_lines）"""
+    bad_count, first_bad = 0, None
+    index = 0
+    with open(file_path, 'r') as file:
+        while True:
+            lines = list(islice(file, chunk_lines))
+            if not lines:
+                break
+            data, bad = parse_log_lines(lines)
+            if bad and first_bad is None:
+                first_bad = (index + bad[0], lines[bad[0]].strip())
+            bad_count += len(bad)
+            index += len(lines)
+            yield data
+    if bad_count and verbose:
+        print(f"Skipped {bad_count} lines with unexpected format (first at line {first_bad[0]}: {first_bad[1]})")
+
+
+def load_log_entries(file_path, verbose=True):
+    """
+    读取 AI 控制记录，二进制记录文件（ai_records.py）和文本日志均可。
+    样本为 (current_value, output, voltage, time_interval)，空行、注释行和格式不正确的行为 None（数据间断）
+    """
+    if is_record_file(file_path):
+        return to_entries(open_records(file_path))
+    data = []
+    for chunk in iter_log_entries(file_path, verbose=verbose):
+        data.extend(chunk)
+    return data
+
+
+def entries_to_arrays(data):
+    """
+    把 load_log_entries 返回的列表转换为数组。
+
+    返回:
+    - (values, outputs, intervals, is_sample)，间断处 (None) 的数值为 NaN、is_sample 为 False
+    """
+    gap = (np.nan, np.nan, np.nan, np.nan)
+    rows = np.array([gap if entry is None else entry for entry in data], dtype=float).reshape(-1, 4)
+    is_sample = np.fromiter((entry is not None for entry in data), dtype=bool, count=len(data))
+    return rows[:, 0], rows[:, 1], rows[:, 3], is_sample
+
+
+def record_arrays(records):
+    """二进制记录转换为数组 (values, outputs, intervals, is_sample)"""
+    return (np.array(records['current_value']), np.array(records['output']), np.array(records['interval']),
+            records['kind'] == SAMPLE)
+
+
+def iter_log_arrays(file_path, chunk_lines=CHUNK_LINES, verbose=True):
+    """逐块读取 AI 控制记录，每次产出不超过 chunk_lines 行的数组 (values, outputs, intervals, is_sample)"""
+    if is_record_file(file_path):
+        records = open_records(file_path)
+        for start in range(0, len(records), chunk_lines):
+            yield record_arrays(records[start:start + chunk_lines])
+        return
+    for chunk in iter_log_entries(file_path, chunk_lines, verbose):
+        yield entries_to_arrays(chunk)
+
+
+def load_log_arrays(file_path, verbose=True):
+    """读取 AI 控制记录为数组 (values, outputs, intervals, is_sample)；二进制记录文件直接按列读取，不经过逐行列表"""
+    if is_record_file(file_path):
+        return record_arrays(open_records(file_path))
+    chunks = list(iter_log_arrays(file_path, verbose=verbose))
+    if not chunks:
+        return entries_to_arrays([])
+    return tuple(np.concatenate(columns) for columns in zip(*chunks))
+
+
+def last_log_arrays(file_path):
+    """只读取日志的最后一行（逐行实现中第 0 个数据点的窗口从最后一行开始），返回数组形式"""
+    if is_record_file(file_path):
+        return record_arrays(open_records(file_path)[-1:])
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        block = 4096
+        while True:
+            start = max(size - block, 0)
+            f.seek(start)
+            lines = io.StringIO(f.read().decode(errors='replace'), newline=None).readlines()
+            if len(lines) >= 2 or start == 0:
+                break
+            block *= 2
+    return entries_to_arrays(parse_log_lines(lines[-1:])[0])
+
+
+def _collect_future(values, intervals, is_sample, i):
+    """
+    按逐行实现的规则收集第 i 个数据点的未来数据（从第 i-1 行开始，i=0 时从最后一行开始）。
+    向量化实现只在 i=0 和少数边界情况下调用。
+
+    返回:
+    - (未来 20 秒的插值, None)，数据点作废时为 (None, 原因)
+    """
+    n = len(values)
+    time_accumulated_future = 0.0
+    times_future = []
+    values_future = []
+    for j in range(i - 1, n):
+        if not is_sample[j]:
+            return None, 'interrupted'
+        time_interval = intervals[j]
+        if time_interval <= 0:
+            return None, 'non_positive'
+        time_accumulated_future += time_interval
+        if time_accumulated_future > HORIZON:
+            break
+        times_future.append(time_accumulated_future)
+        values_future.append(values[j])
+    if time_accumulated_future < HORIZON:
+        return None, 'insufficient'
+    if len(times_future) < 1:
+        return None, 'no_points'
+    return np.interp(FUTURE_TIMES, times_future, values_future, left=values_future[0],
+                     right=values_future[-1]), None
+
+
+def _interp_rows(times, values, points):
+    """
+    逐行插值到 FUTURE_TIMES，结果与对每一行调用 np.interp 完全一致。
+    times / values: (r, W)，第 k 行只有前 points[k] 个点有效：有效的 times 在 (0, 20] 内严格递增，之后的都大于 20
+    """
+    count, width = times.shape
+    x = FUTURE_TIMES.astype(float)
+    base = np.arange(count)[:, None]
+
+    # 与 np.interp 相同：j 为满足 times[j] <= x 的最大下标，在 [times[j], times[j+1]] 区间内线性插值。
+    # x 为整数，times[j] <= x 等价于 ceil(times[j]) <= x，按 ceil 计数再累加即可得到每个 x 的 j
+    slots = np.minimum(np.ceil(times), HORIZON + 1).astype(np.intp)
+    slots += base * (HORIZON + 2)
+    counts = np.bincount(slots.ravel(), minlength=count * (HORIZON + 2)).reshape(count, HORIZON + 2)
+    j = np.cumsum(counts[:, :HORIZON + 1], axis=1)[:, 1:] - 1
+
+    flat_times, flat_values = times.ravel(), values.ravel()
+    current = np.clip(j, 0, max(width - 2, 0)) + base * width
+    t_j, t_n = flat_times[current], flat_times[current + 1]
+    v_j, v_n = flat_values[current], flat_values[current + 1]
+    with np.errstate(all='ignore'):
+        slope = (v_n - v_j) / (t_n - t_j)
+        result = slope * (x - t_j) + v_j
+        retry = np.isnan(result)
+        if retry.any():
+            # 一个方向得到 NaN 时从另一端计算，两端相等时直接取该值
+            result[retry] = (slope * (x - t_n) + v_n)[retry]
+            same = np.isnan(result) & (v_j == v_n)
+            result[same] = v_j[same]
+    result = np.where(t_j == x, v_j, result)
+    result = np.where(j < 0, values[:, :1], result)
+    v_last = flat_values[base[:, 0] * width + points - 1][:, None]
+    return np.where(j >= points[:, None] - 1, v_last, result)
+
+
+class SkipSummary:
+    """按原因累计作废的数据点，只保存数量和第一个下标，内存不随日志长度增长"""
+
+    def __init__(self, counts=None, first=None):
+        self.counts = dict.fromkeys(SKIP_REASONS, 0)
+        self.counts.update(counts or {})
+        self.first = dict(first or {})
+
+    def add(self, reason, indices, offset=0):
+        if len(indices):
+            self.counts[reason] += len(indices)
+            self.first.setdefault(reason, int(indices[0]) + offset)
+
+    def report(self):
+        for reason, count in self.counts.items():
+            if count:
+                print(f"Skipped {count} data points: {SKIP_REASONS[reason]} (first at index {self.first[reason]}).")
+
+
+def _window_rows(values, intervals, is_sample, at_end=True):
+    """
+    为下标 >= 1 的数据点构建训练行（第 i 个数据点的窗口从第 i-1 行开始）。
+
+    按间断和非正时间间隔把数据分成连续段，用累计时间的 searchsorted 确定 20 秒窗口的宽度，
+    再在窗口内按顺序累加时间（与逐行实现的浮点累加顺序一致），最后整批插值到 1..20 秒。
+    at_end=False 表示后面还有数据：窗口一直延伸到末尾、还不能确定的数据点不处理，留到下一块。
+
+    返回:
+    - (rows, future_values, skipped, pending)：rows 为有效数据点的下标，skipped 为 [(原因, 下标数组)]，
+      pending 为第一个未处理的数据点下标（全部处理完时为 None），之后的数据点都未处理
+    """
+    n = len(values)
+    reason_names = list(SKIP_REASONS)
+    skipped = []
+    valid_rows = [np.zeros(0, dtype=np.int64)]
+    future_rows = [np.zeros((0, HORIZON))]
+    pending = None
+
+    # good: 可以计入窗口的行；run_length[s]: 从 s 开始连续 good 的行数
+    candidates = np.flatnonzero(is_sample[1:]) + 1
+    good = is_sample & (intervals > 0)
+    good_intervals = np.where(good, intervals, 0.0)
+    breaks = np.append(np.flatnonzero(~good), n)
+    run_length = breaks[np.searchsorted(breaks, np.arange(n))] - np.arange(n)
+    # 按全局累计时间估计窗口宽度并留出余量；真正的边界在下面按顺序累加确定
+    cumulative = np.cumsum(good_intervals)
+    before = np.concatenate(([0.0], cumulative[:-1]))
+    window_end = np.searchsorted(cumulative, before + HORIZON, side='right')
+    widths = np.maximum(np.minimum(window_end - np.arange(n) + 3, run_length), 1)
+    padding = np.zeros(int(widths.max(initial=1)))
+    padded_intervals = np.concatenate((good_intervals, padding))
+    padded_values = np.concatenate((values, padding))
+
+    for chunk_start in range(0, len(candidates), CHUNK_ROWS):
+        indices = candidates[chunk_start:chunk_start + CHUNK_ROWS]
+        starts = indices - 1
+        lengths = run_length[starts]
+        width = int(widths[starts].max())
+        interval_windows = np.lib.stride_tricks.sliding_window_view(padded_intervals, width)
+        value_windows = np.lib.stride_tricks.sliding_window_view(padded_values, width)
+        accumulated = np.cumsum(interval_windows[starts], axis=1)  # 连续段之外的间隔为 0，累计时间单调不减
+
+        # 第一个累计超过 20 秒的位置；它在连续段内时，之前的点就是窗口内的点
+        exceeded = accumulated > HORIZON
+        points = exceeded.argmax(axis=1)
+        has_end = exceeded[:, -1] & (points < lengths)
+
+        # 连续段在窗口内结束（未到末尾）：按结束处的行判断作废原因
+        run_end = starts + lengths
+        at_eof = run_end >= n
+        ended = ~has_end & (lengths <= width) & ~at_eof
+        gap_is_break = ~is_sample[np.minimum(run_end, n - 1)]
+        reasons = np.full(len(starts), -1)
+        reasons[ended & gap_is_break] = reason_names.index('interrupted')
+        reasons[ended & ~gap_is_break] = reason_names.index('non_positive')
+        reasons[has_end & (points == 0)] = reason_names.index('no_points')
+
+        valid = has_end & (points > 0)
+        future = np.full((len(starts), HORIZON), np.nan)
+        if valid.any():
+            future[valid] = _interp_rows(accumulated[valid], value_windows[starts[valid]], points[valid])
+
+        # 连续段到末尾（正好累计满 20 秒时仍有效），以及估计的窗口宽度不够（累计时间的舍入差异）时，按原规则逐个处理
+        fallback = ~has_end & ((lengths > width) | at_eof)
+        # 后面还有数据时，连续段一直到末尾的数据点留到下一块（之后的数据点同样如此）
+        if not at_end and (~has_end & at_eof).any():
+            stop = int(np.argmax(~has_end & at_eof))
+            pending = int(indices[stop])
+            indices, reasons, valid, future, fallback = (
+                array[:stop] for array in (indices, reasons, valid, future, fallback))
+
+        for k in np.flatnonzero(fallback):
+            result, reason = _collect_future(values, intervals, is_sample, indices[k])
+            if reason is None:
+                future[k] = result
+                valid[k] = True
+            else:
+                reasons[k] = reason_names.index(reason)
+
+        for code, reason in enumerate(reason_names):
+            skipped.append((reason, indices[reasons == code]))
+        valid_rows.append(indices[valid])
+        future_rows.append(future[valid])
+        if pending is not None:
+            break
+
+    return np.concatenate(valid_rows), np.concatenate(future_rows), skipped, pending
+
+
+def build_training_matrices(values, outputs, intervals, is_sample, verbose=True):
+    """
+    向量化构建训练矩阵，结果与逐行实现 process_entries_loop 相同；作废的数据点按原因批量汇总输出。
+
+    返回:
+    - (outputs_matrix_array, future_values_matrix_array)
+    """
+    values = np.asarray(values, dtype=float)
+    outputs = np.asarray(outputs, dtype=float)
+    intervals = np.asarray(intervals, dtype=float)
+    is_sample = np.asarray(is_sample, dtype=bool)
+    skipped = SkipSummary()
+    output_rows = []
+    future_rows = []
+
+    # i=0 时逐行实现从最后一行开始收集（下标 -1），单独按原规则处理
+    if len(values) and is_sample[0]:
+        future, reason = _collect_future(values, intervals, is_sample, 0)
+        if reason is None:
+            output_rows.append(outputs[:1])
+            future_rows.append(future[None, :])
+        else:
+            skipped.add(reason, [0])
+
+    window_rows, window_futures, reasons, _ = _window_rows(values, intervals, is_sample)
+    window_outputs = outputs[window_rows]
+    for reason, indices in reasons:
+        skipped.add(reason, indices)
+    outputs_matrix_array = np.concatenate(output_rows + [window_outputs]).reshape(-1, 1)
+    future_values_matrix_array = np.concatenate(future_rows + [window_futures])
+    if len(future_values_matrix_array) == 0:
+        future_values_matrix_array = np.array([])  # 与逐行实现一致，没有有效数据点时为空的一维数组
+
+    if verbose:
+        skipped.report()
+        print('outputs_matrix_array shape:', outputs_matrix_array.shape)
+        print('future_values_matrix_array shape:', future_values_matrix_array.shape)
+
+    return outputs_matrix_array, future_values_matrix_array
+
+
+def build_run_windows(values, outputs, intervals, is_sample, skipped=None):
+    """
+    为一段独立的数据（一次运行或一个文件）构建训练行，窗口不会越过这段数据的边界；
+    与 process_data 不同，第 0 行前面没有数据，不从最后一行绕回。作废的数据点计入 skipped（SkipSummary）。
+
+    返回:
+    - (rows, outputs (k, 1), future_values (k, 20))：rows 为有效数据点在这段数据中的下标
+    """
+    outputs = np.asarray(outputs, dtype=float)
+    rows, future_values, reasons, _ = _window_rows(np.asarray(values, dtype=float), np.asarray(intervals, dtype=float),
+                                                   np.asarray(is_sample, dtype=bool))
+    if skipped is not None:
+        for reason, indices in reasons:
+            skipped.add(reason, indices)
+    return rows, outputs[rows].reshape(-1, 1), future_values
+
+
+def process_data(file_path, verbose=True):
+    values, outputs, intervals, is_sample = load_log_arrays(file_path, verbose)
+    return build_training_matrices(values, outputs, intervals, is_sample, verbose)
+
+
+class WindowStream:
+    """
+    逐块构建训练行的状态，iter_training_batches 和 dataset_cache.py 共用。
+    carry 为还不能确定的窗口所需的行 (values, outputs, intervals, is_sample)，offset 为 carry 第一行在整个日志中的下标；
+    这两项和 skipped 可以保存下来，日志追加后从断点继续。
+    """
+
+    def __init__(self, carry=None, offset=0, skipped=None):
+        self.carry = carry
+        self.offset = offset
+        self.skipped = skipped or SkipSummary()
+
+    def feed(self, chunk):
+        """处理新的一块数据，返回其中已经能确定的训练行 (outputs (k, 1), future_values (k, 20))"""
+        buffer = chunk if self.carry is None else [np.concatenate(pair) for pair in zip(self.carry, chunk)]
+        window_rows, window_futures, reasons, pending = _window_rows(buffer[0], buffer[2], buffer[3], at_end=False)
+        window_outputs = buffer[1][window_rows]
+        for reason, indices in reasons:
+            self.skipped.add(reason, indices, self.offset)
+        # 保留未处理的数据点的窗口起点之后的行；全部处理完时只保留最后一行（下一块第一个数据点的窗口起点）
+        keep = len(buffer[0]) - 1 if pending is None else pending - 1
+        self.carry = [column[keep:].copy() for column in buffer]
+        self.offset += keep
+        return window_outputs.reshape(-1, 1), window_futures
+
+    def finish(self, skipped=None):
+        """
+        日志到此结束：处理 carry 中剩下的数据点，返回 (outputs, future_values)。
+        不改变状态，日志之后再追加时仍可继续 feed；作废的数据点计入 skipped（默认为 self.skipped）
+        """
+        if self.carry is None:
+            return np.zeros((0, 1)), np.zeros((0, HORIZON))
+        window_rows, window_futures, reasons, _ = _window_rows(self.carry[0], self.carry[2], self.carry[3])
+        window_outputs = self.carry[1][window_rows]
+        for reason, indices in reasons:
+            (skipped or self.skipped).add(reason, indices, self.offset)
+        return window_outputs.reshape(-1, 1), window_futures
+
+
+def start_window_stream(first_chunk, last_row):
+    """
+    开始一个日志的 WindowStream，返回 (stream, first_chunk)。
+    逐行实现中第 0 个数据点的窗口依次是最后一行、第 0 行、第 1 行……：第 0 行是样本时把最后一行接在最前面，按相同规则处理
+    """
+    if len(first_chunk[0]) and first_chunk[3][0]:
+        return WindowStream(offset=-1), [np.concatenate(pair) for pair in zip(last_row, first_chunk)]
+    return WindowStream(), first_chunk
+
+
+def iter_training_batches(file_path, chunk_lines=CHUNK_LINES, verbose=True):
+    """
+    流式构建训练数据：逐块读取日志，每块产出一批 (outputs (k, 1), future_values (k, 20))，
+    按顺序拼接后与 process_data 的结果相同。
+    块之间只保留最后一个还不能确定的 20 秒窗口，内存占用取决于 chunk_lines，与日志长度无关。
+    """
+    stream = None
+    for chunk in iter_log_arrays(file_path, chunk_lines, verbose):
+        if stream is None:
+            stream, chunk = start_window_stream(chunk, last_log_arrays(file_path) if chunk[3][0] else None)
+        window_outputs, window_futures = stream.feed(chunk)
+        if len(window_outputs):
+            yield window_outputs, window_futures
+    if stream is not None:
+        window_outputs, window_futures = stream.finish()
+        if len(window_outputs):
+            yield window_outputs, window_futures
+        if verbose:
+            stream.skipped.report()
+
+
+def write_npy_header(file, shape):
+    # NumPy 的 .npy 文件头为第 0 维的增长预留了空间，写完数据后可以原地改写行数
+    file.seek(0)
+    np.lib.format.write_array_header_1_0(file, {'descr': '<f8', 'fortran_order': False, 'shape': shape})
+
+
+def write_dataset_files(file_path, outputs_path='outputs_matrix.npy', future_values_path='future_values_matrix.npy',
+                        chunk_lines=CHUNK_LINES, verbose=True):
+    """
+    流式构建训练数据并直接写入一对 .npy 文件（先写临时文件，完成后替换），返回数据点数。
+    之后可用 load_dataset_files 以内存映射方式读取。
+    """
+    count = 0
+    paths = [(outputs_path, 1), (future_values_path, HORIZON)]
+    files = [open(path + '.tmp', 'wb') for path, _ in paths]
+    try:
+        for file, (_, columns) in zip(files, paths):
+            write_npy_header(file, (0, columns))
+        for outputs, future_values in iter_training_batches(file_path, chunk_lines, verbose):
+            files[0].write(np.ascontiguousarray(outputs, dtype='<f8').tobytes())
+            files[1].write(np.ascontiguousarray(future_values, dtype='<f8').tobytes())
+            count += len(outputs)
+        for file, (_, columns) in zip(files, paths):
+            data_end = file.tell()
+            write_npy_header(file, (count, columns))
+            file.seek(data_end)
+    finally:
+        for file in files:
+            file.close()
+    for path, _ in paths:
+        os.replace(path + '.tmp', path)
+    if verbose:
+        print(f"Wrote {count} data points to {outputs_path} and {future_values_path}")
+    return count
+
+
+def load_dataset_files(outputs_path='outputs_matrix.npy', future_values_path='future_values_matrix.npy'):
+    """以只读内存映射方式读取 write_dataset_files 写出的 (outputs_matrix_array, future_values_matrix_array)"""
+    return np.load(outputs_path, mmap_mode='r'), np.load(future_values_path, mmap_mode='r')
+
+
+def process_entries_loop(data, verbose=True):
+    """原逐行实现（O(N·W) 的 Python 循环），保留用于基准测试和核对向量化实现的结果"""
     # 准备输出和未来值的矩阵
     outputs_matrix = []
     future_values_matrix = []
@@ -61,12 +519,14 @@ def process_data(file_path):
             if data[j] is None:
                 # 在收集过程中遇到间断，当前数据点作废
                 valid_future = False
-                print(f"Data point at index {i} is invalid due to future interruption at index {j}.")
+                if verbose:
+                    print(f"Data point at index {i} is invalid due to future interruption at index {j}.")
                 break
 
             time_interval = data[j][3]
             if time_interval <= 0:
-                print(f"Data point at index {j} has non-positive time interval: {time_interval}. Skipping future data collection.")
+                if verbose:
+                    print(f"Data point at index {j} has non-positive time interval: {time_interval}. Skipping future data collection.")
                 valid_future = False
                 break
 
@@ -82,7 +542,8 @@ def process_data(file_path):
         # 检查未来数据是否达到20秒
         if time_accumulated_future < 20:
             valid_future = False
-            print(f"Data point at index {i} has insufficient future data: accumulated {time_accumulated_future} s.")
+            if verbose:
+                print(f"Data point at index {i} has insufficient future data: accumulated {time_accumulated_future} s.")
 
         # 检查未来数据的有效性
         if not valid_future:
@@ -90,7 +551,8 @@ def process_data(file_path):
 
         # 检查是否有足够的数据进行插值
         if len(times_future) < 1:
-            print(f"Insufficient data for interpolation at index {i}.")
+            if verbose:
+                print(f"Insufficient data for interpolation at index {i}.")
             continue
 
         try:
@@ -114,11 +576,58 @@ def process_data(file_path):
     outputs_matrix_array = np.array(outputs_matrix).reshape(-1, 1)
     future_values_matrix_array = np.array(future_values_matrix)
 
-    print('outputs_matrix_array shape:', outputs_matrix_array.shape)
-    print('future_values_matrix_array shape:', future_values_matrix_array.shape)
+    if verbose:
+        print('outputs_matrix_array shape:', outputs_matrix_array.shape)
+        print('future_values_matrix_array shape:', future_values_matrix_array.shape)
 
     return outputs_matrix_array, future_values_matrix_array
 
+
+def synthetic_records(lines, seed=0):
+    """生成与控制程序记录格式相同的模拟记录：每 3000 行左右一次运行，偶有间断，段内第一条样本时间间隔为 0"""
+    rng = np.random.default_rng(seed)
+    records = np.zeros(lines, dtype=RECORD_DTYPE)
+    records['kind'] = SAMPLE
+    records['interval'] = np.round(rng.uniform(0.45, 0.75, lines), 2)
+    records['current_value'] = np.round(25 + np.cumsum(rng.normal(0.3, 1.0, lines)) % 500, 2)
+    records['output'] = np.round(rng.uniform(0, 3, lines), 3)
+    records['voltage'] = np.round(rng.uniform(0, 30, lines), 3)
+    markers = np.flatnonzero(rng.random(lines) < 1 / 3000)
+    records['kind'][markers] = np.where(rng.random(len(markers)) < 0.7, RUN_START, SEGMENT_BREAK)
+    records['kind'][0] = RUN_START
+    for field in ('current_value', 'output', 'voltage', 'interval'):
+        records[field][records['kind'] != SAMPLE] = np.nan
+    first = np.flatnonzero(records['kind'][:-1] != SAMPLE) + 1
+    records['interval'][first[records['kind'][first] == SAMPLE]] = 0.0
+    return records
+
+
+def benchmark(lines=2_000_000):
+    """在 lines 行的模拟日志上比较逐行实现与向量化实现"""
+    records = synthetic_records(lines)
+    entries = to_entries(records)
+
+    start = time.perf_counter()
+    expected = process_entries_loop(entries, verbose=False)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    arrays = entries_to_arrays(entries)
+    convert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = build_training_matrices(*arrays, verbose=False)
+    vector_time = time.perf_counter() - start
+
+    same = all(np.array_equal(a, b, equal_nan=True) for a, b in zip(expected, result))
+    print(f"Lines: {lines}, training rows: {len(result[0])}, identical results: {'yes' if same else 'NO'}")
+    print(f"{'row loop':<28}{loop_time:>10.2f} s")
+    print(f"{'vectorized (arrays)':<28}{vector_time:>10.2f} s  {loop_time / vector_time:>8.1f}x")
+    print(f"{'vectorized (+ list convert)':<28}{vector_time + convert_time:>10.2f} s  "
+          f"{loop_time / (vector_time + convert_time):>8.1f}x")
+    return same
+
+
 def save_matrix_to_file(outputs_matrix_array, future_values_matrix_array, output_file_path):
     # 保存所有矩阵到文本文件
     with open(output_file_path, 'w') as f:
@@ -130,6 +639,13 @@ def save_matrix_to_file(outputs_matrix_array, future_values_matrix_array, output
         f.write("\n")
 
 if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == 'benchmark':
+        benchmark(int(sys.argv[2]) if len(sys.argv) >= 3 else 2_000_000)
+        sys.exit(0)
+    if len(sys.argv) >= 3 and sys.argv[1] == 'build':
+        write_dataset_files(sys.argv[2], *sys.argv[3:5])
+        sys.exit(0)
+
     # 示例用法
     file_path = 'new_experiment_log.txt'
     output_file_path = 'matrix_output.txt'  # 保存到程序所在的文件夹
@@ -140,6 +656,6 @@ if __name__ == "__main__":
     # 调用 save_matrix_to_file 函数
     save_matrix_to_file(outputs_matrix, future_values_matrix, output_file_path)
 
-    print('outputs_matrix_length:', len(outputs_matrix), 
+    print('outputs_matrix_length:', len(outputs_matrix),
           'future_values_matrix_length:', len(future_values_matrix))
     print("Matrices saved to:", output_file_path)
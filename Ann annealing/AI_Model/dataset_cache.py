@@ -0,0 +1,308 @@
+'''
+训练数据的增量缓存：日志只追加了新内容时，只处理新增部分，把新的训练行追加到缓存中。
+
+每个日志在缓存目录下对应一个子目录：
+- outputs.npy / future_values.npy: 已经确定的训练行（与 process_data 的结果逐行相同）
+- meta.json: 按段记录日志内容的字节范围、SHA-256，以及段末的 WindowStream 状态（未完成的 20 秒窗口）；
+  第 0 行是样本时还记录它的窗口所用的日志最后一行的哈希，最后一行改变（截断、不完整的末行）时缓存作废
+再次读取时逐段核对哈希（只读字节，比解析快得多）：内容未变的段直接复用，从最后一个未变的段末状态继续处理；
+日志最后不完整的一行和末尾还不能确定的窗口每次临时处理，不写入缓存。
+
+用法: python dataset_cache.py [日志文件] [缓存目录]
+'''
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import numpy as np
+from ai_records import is_record_file, HEADER_SIZE, RECORD_DTYPE
+from data import (HORIZON, CHUNK_LINES, SkipSummary, WindowStream, start_window_stream, parse_log_lines,
+                  entries_to_arrays, record_arrays, last_log_arrays, write_npy_header, process_data)
+
+CACHE_VERSION = 1  # 训练行的构建规则改变时加 1，旧缓存全部作废
+SEGMENT_BYTES = 16 * 1024 * 1024  # 每段日志的大小，日志中间被修改时从所在段重新处理
+HASH_BLOCK = 1024 * 1024
+MATRICES = (('outputs.npy', 1), ('future_values.npy', HORIZON))
+
+
+def _header_size(columns):
+    buffer = io.BytesIO()
+    write_npy_header(buffer, (0, columns))
+    return buffer.tell()
+
+
+def _hash_range(file, start, end):
+    digest = hashlib.sha256()
+    file.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = file.read(min(HASH_BLOCK, remaining))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    return digest.hexdigest()
+
+
+def _arrays_digest(arrays):
+    """数组形式的若干行的 SHA-256（用于核对第 0 个数据点的窗口所用的最后一行）"""
+    digest = hashlib.sha256()
+    for column in arrays:
+        digest.update(np.ascontiguousarray(column, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def _complete_end(file, size, record_format):
+    """只含完整记录（二进制）或完整行（文本）的日志长度"""
+    if record_format:
+        return HEADER_SIZE + (size - HEADER_SIZE) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize
+    position = size
+    while position > 0:
+        start = max(position - HASH_BLOCK, 0)
+        file.seek(start)
+        newline = file.read(position - start).rfind(b'\n')
+        if newline >= 0:
+            return start + newline + 1
+        position = start
+    return 0
+
+
+def _read_chunks(file, start, end, record_format, chunk_lines):
+    """从字节偏移 start 读到 end，产出 (读到的位置, 原始字节, 数组)"""
+    file.seek(start)
+    position = start
+    if record_format and position == 0:
+        raw = file.read(HEADER_SIZE)
+        position = HEADER_SIZE
+        yield position, raw, None, 0
+    while position < end:
+        if record_format:
+            count = min(chunk_lines, (end - position) // RECORD_DTYPE.itemsize)
+            raw = file.read(count * RECORD_DTYPE.itemsize)
+            arrays = record_arrays(np.frombuffer(raw, dtype=RECORD_DTYPE))
+            position += len(raw)
+            yield position, raw, arrays, 0
+            continue
+        lines = []
+        while len(lines) < chunk_lines and position < end:
+            line = file.readline()
+            lines.append(line)
+            position += len(line)
+        data, bad = parse_log_lines([line.decode(errors='replace') for line in lines])
+        yield position, b''.join(lines), entries_to_arrays(data), len(bad)
+
+
+class DatasetCache:
+    def __init__(self, log_path, cache_dir=None, chunk_lines=CHUNK_LINES):
+        """
+        log_path: AI 控制记录（ai_log.airec 或文本日志）
+        cache_dir: 缓存根目录，默认为日志所在目录下的 dataset_cache
+        """
+        self.log_path = os.path.abspath(log_path)
+        cache_dir = cache_dir or os.path.join(os.path.dirname(self.log_path), 'dataset_cache')
+        key = hashlib.sha1(self.log_path.encode()).hexdigest()[:12]
+        self.directory = os.path.join(cache_dir, f"{os.path.basename(log_path)}-{key}")
+        self.meta_path = os.path.join(self.directory, 'meta.json')
+        self.chunk_lines = chunk_lines
+        self.record_format = False
+        self.wrapped = False  # 第 0 行是样本（它的窗口从日志最后一行开始）
+        self.wrap_digest = None  # 第 0 行是样本时，它的窗口所用的最后一行的哈希
+
+    def _read_meta(self, record_format):
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (meta.get('version') != CACHE_VERSION or meta.get('horizon') != HORIZON
+                or meta.get('record_format') != record_format):
+            return None
+        return meta
+
+    def _write_meta(self, meta):
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _valid_segments(self, meta, file, data_end):
+        """逐段核对日志内容，返回内容未变的前若干段"""
+        valid = []
+        if meta is None:
+            return valid
+        rows = min(self._stored_rows(path, columns) for path, columns in self._matrix_paths())
+        for segment in meta['segments']:
+            if (segment['end'] > data_end or segment['state']['rows'] > rows
+                    or _hash_range(file, segment['start'], segment['end']) != segment['sha256']):
+                break
+            valid.append(segment)
+        return valid
+
+    def _matrix_paths(self):
+        return [(os.path.join(self.directory, name), columns) for name, columns in MATRICES]
+
+    @staticmethod
+    def _stored_rows(path, columns):
+        if not os.path.exists(path):
+            return 0
+        return (os.path.getsize(path) - _header_size(columns)) // (8 * columns)
+
+    @staticmethod
+    def _resize(path, columns, rows):
+        """把缓存的矩阵截断到 rows 行（多出的是上次中断时写了一半的数据）"""
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        with open(path, mode) as f:
+            f.truncate(_header_size(columns) + rows * 8 * columns)
+            write_npy_header(f, (rows, columns))
+
+    @staticmethod
+    def _state(stream, position, rows, bad_lines):
+        state = {'position': position, 'rows': rows, 'bad_lines': bad_lines, 'stream': None}
+        if stream is not None:
+            carry = None if stream.carry is None else [column.tolist() for column in stream.carry]
+            state['stream'] = {'offset': stream.offset, 'carry': carry,
+                               'skipped': {'counts': stream.skipped.counts, 'first': stream.skipped.first}}
+        return state
+
+    @staticmethod
+    def _restore(state):
+        """恢复段末的 WindowStream；还没有读到任何数据行时为 None"""
+        if state is None:
+            return None
+        carry = state['carry']
+        if carry is not None:
+            carry = [np.array(column, dtype=bool if index == 3 else float) for index, column in enumerate(carry)]
+        return WindowStream(carry, state['offset'], SkipSummary(**state['skipped']))
+
+    def update(self, verbose=True):
+        """
+        把日志中尚未缓存的完整内容处理并追加到缓存，返回 (stream, position, rows, bad_lines)：
+        处理到 position 为止的状态，供 load 处理不完整的末尾
+        """
+        start_time = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        self.record_format = record_format = is_record_file(self.log_path)
+        with open(self.log_path, 'rb') as file:
+            size = file.seek(0, os.SEEK_END)
+            data_end = _complete_end(file, size, record_format)
+            meta = self._read_meta(record_format)
+            segments = self._valid_segments(meta, file, data_end)
+            # 第 0 行是样本时它的窗口从日志最后一行开始，日志一变就要全部重新处理
+            if segments and meta.get('wrapped') and segments[-1]['end'] != data_end:
+                segments = []
+            # 内容未变，但最后一行可能不同（在段末截断、不完整的末行出现或消失），第 0 行的窗口随之改变
+            if segments and meta.get('wrapped') and (
+                    _arrays_digest(last_log_arrays(self.log_path)) != meta.get('wrap_sha256')):
+                segments = []
+            if segments:
+                state = segments[-1]['state']
+                stream, position = self._restore(state['stream']), state['position']
+                rows, bad_lines = state['rows'], state['bad_lines']
+            else:
+                stream, position, rows, bad_lines = None, 0, 0, 0
+            reused_rows = rows
+            self.wrapped = bool(segments and meta.get('wrapped'))
+            self.wrap_digest = meta.get('wrap_sha256') if self.wrapped else None
+            for path, columns in self._matrix_paths():
+                self._resize(path, columns, rows)
+
+            processed_from = position
+            matrix_files = [open(path, 'r+b') for path, _ in self._matrix_paths()]
+            try:
+                for matrix_file in matrix_files:
+                    matrix_file.seek(0, os.SEEK_END)
+                segment_start, digest = position, hashlib.sha256()
+                for position, raw, arrays, bad in _read_chunks(file, position, data_end, record_format,
+                                                               self.chunk_lines):
+                    digest.update(raw)
+                    if arrays is not None:
+                        bad_lines += bad
+                        if stream is None:
+                            self.wrapped = bool(arrays[3][0])
+                            last_row = last_log_arrays(self.log_path) if self.wrapped else None
+                            self.wrap_digest = _arrays_digest(last_row) if self.wrapped else None
+                            stream, arrays = start_window_stream(arrays, last_row)
+                        outputs, future_values = stream.feed(arrays)
+                        matrix_files[0].write(np.ascontiguousarray(outputs, dtype='<f8').tobytes())
+                        matrix_files[1].write(np.ascontiguousarray(future_values, dtype='<f8').tobytes())
+                        rows += len(outputs)
+                    if position - segment_start >= SEGMENT_BYTES or position >= data_end:
+                        for matrix_file in matrix_files:
+                            matrix_file.flush()
+                        segments.append({'start': segment_start, 'end': position, 'sha256': digest.hexdigest(),
+                                         'state': self._state(stream, position, rows, bad_lines)})
+                        segment_start, digest = position, hashlib.sha256()
+                for matrix_file, (_, columns) in zip(matrix_files, MATRICES):
+                    write_npy_header(matrix_file, (rows, columns))
+            finally:
+                for matrix_file in matrix_files:
+                    matrix_file.close()
+
+        self._write_meta({'version': CACHE_VERSION, 'horizon': HORIZON, 'record_format': record_format,
+                          'log_path': self.log_path, 'wrapped': self.wrapped, 'wrap_sha256': self.wrap_digest,
+                          'segments': segments})
+        if verbose:
+            print(f"Dataset cache: reused {reused_rows} rows, processed {position - processed_from} new bytes "
+                  f"(+{rows - reused_rows} rows) in {time.perf_counter() - start_time:.2f} s")
+        return stream, position, rows, bad_lines
+
+    def load(self, verbose=True):
+        """更新缓存并返回 (outputs_matrix_array, future_values_matrix_array)，与 process_data(log_path) 相同"""
+        stream, position, rows, bad_lines = self.update(verbose)
+        rest = b''
+        if not self.record_format:
+            with open(self.log_path, 'rb') as file:
+                file.seek(position)
+                rest = file.read()  # 最后不完整的一行
+        if rest and self.wrapped:
+            # 第 0 个数据点的窗口要从这一行开始，缓存的结果不适用
+            return process_data(self.log_path, verbose)
+
+        outputs_matrix_array, future_values_matrix_array = (np.load(path) for path, _ in self._matrix_paths())
+        # 不完整的末行和末尾还不能确定的窗口：在状态的副本上临时处理，不写入缓存
+        tail = None
+        if stream is not None:
+            tail = WindowStream(stream.carry, stream.offset, SkipSummary(stream.skipped.counts, stream.skipped.first))
+        extra = []
+        if rest:
+            data, bad = parse_log_lines([rest.decode(errors='replace')])
+            bad_lines += len(bad)
+            arrays = entries_to_arrays(data)
+            if tail is None:
+                tail, arrays = start_window_stream(arrays, arrays)
+            extra.append(tail.feed(arrays))
+        if tail is not None:
+            extra.append(tail.finish())
+        if extra:
+            outputs_matrix_array = np.concatenate([outputs_matrix_array] + [outputs for outputs, _ in extra])
+            future_values_matrix_array = np.concatenate([future_values_matrix_array] + [future for _, future in extra])
+        if len(future_values_matrix_array) == 0:
+            future_values_matrix_array = np.array([])  # 与 process_data 一致
+
+        if verbose:
+            if bad_lines:
+                print(f"Skipped {bad_lines} lines with unexpected format")
+            if tail is not None:
+                tail.skipped.report()
+            print('outputs_matrix_array shape:', outputs_matrix_array.shape)
+            print('future_values_matrix_array shape:', future_values_matrix_array.shape)
+        return outputs_matrix_array, future_values_matrix_array
+
+    def clear(self):
+        """删除这个日志的缓存"""
+        for path in [self.meta_path] + [path for path, _ in self._matrix_paths()]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def load_training_data(log_path, cache_dir=None, verbose=True):
+    """通过增量缓存读取训练数据，结果与 process_data(log_path) 相同"""
+    return DatasetCache(log_path, cache_dir).load(verbose)
+
+
+if __name__ == "__main__":
+    log_path = sys.argv[1] if len(sys.argv) > 1 else 'new_experiment_log.txt'
+    cache_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    load_training_data(log_path, cache_dir)
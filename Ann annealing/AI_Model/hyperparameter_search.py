@@ -0,0 +1,264 @@
+'''
+退火 ANN 的超参数搜索（successive halving）：
+随机抽取一批配置（网络宽度和深度、第一层激活函数、学习率、batch size），
+每一轮用交叉验证在较少的训练轮数下评估全部配置，只保留 CV MSE 最低的 1/eta 进入下一轮，下一轮的训练轮数乘以 eta。
+各配置在独立的进程中并行训练；每个配置的推理延迟在主进程中用 NumPy 前向计算依次测量，避免进程之间互相干扰。
+每次评估的配置、CV MSE、训练时间和推理延迟都记录在 SQLite 结果库中，最后列出精度与延迟的 Pareto 前沿。
+
+用法:
+- python hyperparameter_search.py run [--trials N] [--workers N] [--max-latency 微秒] [日志文件或 dataset.npz]
+- python hyperparameter_search.py show [search_id]
+'''
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from model import MAX_EPOCHS, PATIENCE, VALIDATION_FRACTION, share_arrays, train_fold
+from numpy_model import BASE_DIR, NumpyModel
+from quantize import measure_latency
+from sklearn.model_selection import KFold
+
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, 'hyperparameter_search.sqlite')
+
+SEARCH_SPACE = {
+    'width': (16, 32, 64, 128),  # 第一隐藏层神经元数，之后每层减半（至少 4 个）
+    'depth': (1, 2, 3, 4),  # 隐藏层数
+    'first_activation': ('swish', 'relu'),  # 之后的隐藏层都用 relu，与 model.py 相同
+    'learning_rate': (1e-4, 1e-2),  # 在此范围内按对数均匀抽取
+    'batch_size': (32, 64, 128, 256),
+}
+# 输入固定为未来 20 秒的温度：控制器（build_future_matrix、AIPredict、NumpyModel）只支持这一输入宽度
+LATENCY_ROWS = 1000  # 测量整批推理延迟的行数
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    search_id TEXT NOT NULL,
+    config_id INTEGER NOT NULL,
+    rung INTEGER NOT NULL,
+    epochs INTEGER NOT NULL,
+    config TEXT NOT NULL,
+    cv_mse REAL,
+    mse_std REAL,
+    best_epoch INTEGER,
+    train_seconds REAL,
+    latency REAL,
+    batch_latency REAL,
+    samples INTEGER,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS trials_search ON trials (search_id, rung);
+"""
+
+
+def sample_config(rng):
+    """从 SEARCH_SPACE 中随机抽取一个配置"""
+    low, high = SEARCH_SPACE['learning_rate']
+    return {
+        'width': int(rng.choice(SEARCH_SPACE['width'])),
+        'depth': int(rng.choice(SEARCH_SPACE['depth'])),
+        'first_activation': str(rng.choice(SEARCH_SPACE['first_activation'])),
+        'learning_rate': float(math.exp(rng.uniform(math.log(low), math.log(high)))),
+        'batch_size': int(rng.choice(SEARCH_SPACE['batch_size'])),
+    }
+
+
+def config_layers(config):
+    """配置对应的 (units, activations)"""
+    units = tuple(max(4, config['width'] >> k) for k in range(config['depth']))
+    activations = (config['first_activation'],) + ('relu',) * (config['depth'] - 1)
+    return units, activations
+
+
+def run_trial(task):
+    """
+    在工作进程中依次训练一个配置的各折。
+
+    返回:
+    - {'cv_mse', 'mse_std', 'best_epoch', 'train_seconds', 'weights'（最后一折的 NumPy 权重，用于测量延迟）}
+    """
+    config = task['config']
+    units, activations = config_layers(config)
+    results = []
+    for fold, (train_index, test_index) in enumerate(task['folds']):
+        results.append(train_fold({
+            'fold': fold, 'train_index': train_index, 'test_index': test_index,
+            'future_values': task['future_values'], 'outputs': task['outputs'],
+            'learning_rate': config['learning_rate'], 'batch_size': config['batch_size'],
+            'units': units, 'activations': activations,
+            'max_epochs': task['epochs'], 'patience': task['patience'],
+            'validation_fraction': VALIDATION_FRACTION, 'threads': task['threads'],
+            'export': fold == len(task['folds']) - 1,
+        }))
+    mse_scores = [result['mse'] for result in results]
+    return {
+        'cv_mse': float(np.mean(mse_scores)),
+        'mse_std': float(np.std(mse_scores)),
+        'best_epoch': int(np.median([result['best_epoch'] for result in results])),
+        'train_seconds': float(sum(result['seconds'] for result in results)),
+        'weights': results[-1]['weights'],
+    }
+
+
+class TrialStore:
+    """SQLite 结果库，每次评估（一个配置在一轮中的交叉验证）一行"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def add(self, search_id, config_id, rung, epochs, config, result, samples):
+        self._db.execute(
+            "INSERT INTO trials (search_id, config_id, rung, epochs, config, cv_mse, mse_std, best_epoch, "
+            "train_seconds, latency, batch_latency, samples, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (search_id, config_id, rung, epochs, json.dumps(config, sort_keys=True), result['cv_mse'],
+             result['mse_std'], result['best_epoch'], result['train_seconds'], result['latency'],
+             result['batch_latency'], samples, time.time()))
+        self._db.commit()
+
+    def searches(self):
+        """[(search_id, 评估次数, 开始时间)]，按时间排序"""
+        return self._db.execute("SELECT search_id, COUNT(*), MIN(created) FROM trials GROUP BY search_id "
+                                "ORDER BY MIN(created)").fetchall()
+
+    def trials(self, search_id):
+        """某次搜索的全部评估记录（字典列表），config 已解析"""
+        cursor = self._db.execute("SELECT * FROM trials WHERE search_id = ? ORDER BY rung, cv_mse", (search_id,))
+        columns = [column[0] for column in cursor.description]
+        trials = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        for trial in trials:
+            trial['config'] = json.loads(trial['config'])
+        return trials
+
+    def close(self):
+        self._db.close()
+
+
+def _rank_key(result, max_latency):
+    """先按是否超出延迟上限、再按 CV MSE 排序；训练发散（MSE 为 NaN）的排在最后"""
+    over = max_latency is not None and result['latency'] > max_latency
+    return over, result['cv_mse'] if np.isfinite(result['cv_mse']) else math.inf
+
+
+def successive_halving(future_values_matrix_array, outputs_matrix_array, n_trials=27, eta=3, min_epochs=10,
+                       max_epochs=MAX_EPOCHS, n_splits=3, workers=None, max_latency=None, seed=0,
+                       store_path=DEFAULT_DB_PATH, verbose=True):
+    """
+    运行一次 successive halving 搜索，返回 search_id。
+    max_latency: 单行推理延迟上限 (s)，超出的配置只在其余配置都被淘汰后才会晋级
+    """
+    future_values_matrix_array = np.asarray(future_values_matrix_array, dtype=float)
+    outputs_matrix_array = np.asarray(outputs_matrix_array, dtype=float).reshape(-1, 1)
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    rng = np.random.default_rng(seed)
+    search_id = f"search-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    folds = list(KFold(n_splits=n_splits, shuffle=True, random_state=42).split(future_values_matrix_array))
+    latency_rows = future_values_matrix_array[:LATENCY_ROWS]
+    store = TrialStore(store_path)
+    start_time = time.perf_counter()
+
+    candidates = list(enumerate(sample_config(rng) for _ in range(n_trials)))
+    rung, epochs = 0, min_epochs
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = share_arrays(tmp_dir, future_values=future_values_matrix_array, outputs=outputs_matrix_array)
+        # TensorFlow 不支持 fork 后继续使用，工作进程用 spawn 启动
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                tasks = [dict(paths, config=config, folds=folds, epochs=epochs, patience=PATIENCE, threads=threads)
+                         for _, config in candidates]
+                results = list(pool.map(run_trial, tasks))
+                for (config_id, config), result in zip(candidates, results):
+                    numpy_model = NumpyModel(*result.pop('weights'))
+                    result['latency'], result['batch_latency'] = measure_latency(numpy_model, latency_rows)
+                    store.add(search_id, config_id, rung, epochs, config, result, len(future_values_matrix_array))
+                    if verbose:
+                        print(f"Rung {rung} ({epochs} epochs) config {config_id}: CV MSE {result['cv_mse']:.6g}, "
+                              f"latency {result['latency'] * 1e6:.1f} us, {result['train_seconds']:.1f} s {config}")
+                if len(candidates) == 1 or epochs >= max_epochs:
+                    break
+                order = sorted(range(len(candidates)), key=lambda i: _rank_key(results[i], max_latency))
+                candidates = [candidates[i] for i in order[:max(1, len(candidates) // eta)]]
+                rung, epochs = rung + 1, min(max_epochs, epochs * eta)
+    store.close()
+    if verbose:
+        print(f"Search {search_id} finished in {time.perf_counter() - start_time:.1f} s with {workers} workers; "
+              f"results in {store_path}")
+    return search_id
+
+
+def pareto_front(trials):
+    """每个配置取其最高一轮的结果，返回在 CV MSE 和单行延迟上都不被其他配置超越的结果（按延迟排序）"""
+    latest = {}
+    for trial in trials:
+        if trial['config_id'] not in latest or trial['rung'] > latest[trial['config_id']]['rung']:
+            latest[trial['config_id']] = trial
+    front = []
+    for trial in sorted(latest.values(), key=lambda t: (t['latency'], t['cv_mse'])):
+        if np.isfinite(trial['cv_mse']) and (not front or trial['cv_mse'] < front[-1]['cv_mse']):
+            front.append(trial)
+    return front
+
+
+def show_search(search_id=None, store_path=DEFAULT_DB_PATH):
+    """打印某次搜索（默认为最近一次）每一轮的最佳结果和 Pareto 前沿"""
+    store = TrialStore(store_path)
+    searches = store.searches()
+    if not searches:
+        print(f"No searches recorded in {store_path}")
+        store.close()
+        return
+    search_id = search_id or searches[-1][0]
+    trials = store.trials(search_id)
+    store.close()
+
+    print(f"Search {search_id}: {len(trials)} evaluations")
+    for rung in sorted({trial['rung'] for trial in trials}):
+        best = min((trial for trial in trials if trial['rung'] == rung),
+                   key=lambda t: t['cv_mse'] if np.isfinite(t['cv_mse']) else math.inf)
+        print(f"Rung {rung} ({best['epochs']} epochs): best CV MSE {best['cv_mse']:.6g}, config {best['config']}")
+    print("Pareto front (latency vs CV MSE):")
+    print(f"{'latency (us)':>13}{'batch (ms)':>12}{'CV MSE':>12}{'train (s)':>11}  config")
+    for trial in pareto_front(trials):
+        print(f"{trial['latency'] * 1e6:>13.1f}{trial['batch_latency'] * 1e3:>12.2f}{trial['cv_mse']:>12.6g}"
+              f"{trial['train_seconds']:>11.1f}  {trial['config']}")
+
+
+def _pop_option(args, name, convert):
+    if name not in args:
+        return None
+    index = args.index(name)
+    value = convert(args[index + 1])
+    del args[index:index + 2]
+    return value
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    command = args.pop(0) if args else 'run'
+    if command == 'show':
+        show_search(args[0] if args else None)
+    elif command == 'run':
+        n_trials = _pop_option(args, '--trials', int) or 27
+        workers = _pop_option(args, '--workers', int)
+        max_latency = _pop_option(args, '--max-latency', float)
+        file_path = args[0] if args else 'new_experiment_log.txt'
+        if file_path.endswith('.npz'):
+            from ingest import load_dataset
+            outputs_matrix_array, future_values_matrix_array, _, _ = load_dataset(file_path)
+        else:
+            from dataset_cache import load_training_data
+            outputs_matrix_array, future_values_matrix_array = load_training_data(file_path)
+        search_id = successive_halving(future_values_matrix_array, outputs_matrix_array, n_trials=n_trials,
+                                       workers=workers, max_latency=max_latency * 1e-6 if max_latency else None)
+        show_search(search_id)
+    else:
+        print(__doc__)
@@ -0,0 +1,207 @@
+'''
+并行导入多个日志的训练数据：每个文件（temperature_log 则是每次运行）在进程池中独立构建 20 秒窗口，
+窗口不会跨文件；合并后的每个训练样本都记录来源（文件、运行、setpoint）。
+
+支持的来源:
+- AI 控制记录 ai_log.airec / ai_log.txt，RUN_START（"# Setpoint" 行）分隔运行
+- temperature_log 目录下每次运行的 CSV，_partN 与主文件合并为同一次运行
+  （CSV 记录的是校准后的实际温度，导入时换算回红外温度，与 AI 控制记录和模型输入一致；手动调电流的行不导入）
+main_ai 的每次运行同时写入 ai_log.airec 和 temperature_log，两者一起导入会把同一次运行算两遍
+（并分到不同的交叉验证折中），因此默认只导入 AI 控制记录；--temperature-log 用于没有 AI 控制记录的运行。
+同名的 .airec 和文本日志（ai_records.py dump / convert 的结果）只导入 .airec。
+红外 setpoint 超过 590°C 的运行不导入：此时红外读数不可靠，main_ai 也不使用 AI 控制。
+
+用法: python ingest.py [--workers N] [--output dataset.npz] [--temperature-log] [路径 ...]
+路径可以是文件、目录或通配符；默认为 Ann annealing 目录下的 AI 控制记录，--temperature-log 时加上 temperature_log 目录
+'''
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import ai_records
+from data import HORIZON, SKIP_REASONS, SkipSummary, build_run_windows
+from run_archive import DEFAULT_LOG_DIR, group_run_files, read_run_csv
+
+ANN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+AI_LOG_PATTERNS = ('*.airec', '*ai_log*.txt')  # 在目录中查找 AI 控制记录时使用，同名文件只取靠前的格式
+MAX_INFRARED_SETPOINT = 590.0  # 与 main_ai 相同：超过时红外失灵，改为阶梯升温
+
+
+def actual_to_infrared(temperature):
+    """实际温度换算为红外温度（main_ai 中 实际温度 = 红外温度 * 0.88 + 9.87 的逆运算）"""
+    return (temperature - 9.87) / 0.88
+
+PROVENANCE_DTYPE = np.dtype([
+    ('source', 'i4'),  # 在 sources 列表中的下标
+    ('run', 'i4'),  # AI 控制记录中的运行编号（第一个 RUN_START 之前为 0）；CSV 为 0
+    ('setpoint', 'f8'),  # 未知时为 NaN
+    ('heating_rate', 'f8'),
+    ('row', 'i8'),  # 数据点在文件（CSV 为合并后的运行）中的行号
+])
+
+
+def discover_sources(paths, min_age=60.0):
+    """
+    把文件、目录和通配符展开为导入单元列表 [(kind, name, files)]。
+    kind 为 'ai'（AI 控制记录）或 'csv'（temperature_log 的一次运行）；
+    目录中最近 min_age 秒内修改过的运行视为仍在写入，跳过
+    """
+    sources = []
+    seen = set()
+
+    def add(kind, name, files):
+        if name not in seen:
+            seen.add(name)
+            sources.append((kind, name, tuple(files)))
+
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                stems = set()
+                for ai_pattern in AI_LOG_PATTERNS:
+                    for file in sorted(glob.glob(os.path.join(path, ai_pattern))):
+                        # ai_log.airec 和由它导出（或转换出它）的 ai_log.txt 是同一批运行
+                        stem = os.path.splitext(file)[0]
+                        if stem not in stems:
+                            stems.add(stem)
+                            add('ai', file, [file])
+                for name, files in group_run_files(path, min_age=min_age).items():
+                    add('csv', os.path.join(path, name), files)
+            elif path.endswith('.csv'):
+                add('csv', os.path.splitext(path)[0], [path])
+            elif os.path.exists(path):
+                add('ai', path, [path])
+            else:
+                print(f"Skipping {pattern}: not found")
+    return sources
+
+
+def _ai_log_arrays(path):
+    """AI 控制记录的数组，以及每一行的运行编号和每次运行的 (setpoint, heating_rate)"""
+    records = ai_records.open_records(path) if ai_records.is_record_file(path) else ai_records.read_text_log(path)
+    kind = np.asarray(records['kind'])
+    run = np.cumsum(kind == ai_records.RUN_START)  # 与记录中的 run 字段相同，文本日志也适用
+    starts = kind == ai_records.RUN_START
+    setpoints = np.concatenate(([np.nan], np.asarray(records['current_value'])[starts]))
+    heating_rates = np.concatenate(([np.nan], np.asarray(records['output'])[starts]))
+    arrays = (np.array(records['current_value']), np.array(records['output']), np.array(records['interval']),
+              kind == ai_records.SAMPLE)
+    return arrays, run, setpoints, heating_rates
+
+
+def _csv_run_arrays(files):
+    """
+    temperature_log 一次运行的数组，温度和 setpoint 换算为红外温度；
+    时间间隔取 Monotonic 列的差（旧文件没有该列时用 Timestamp）
+    """
+    samples, meta = read_run_csv(files)
+    times = samples[:, 1] if np.isfinite(samples[:, 1]).any() else samples[:, 0]
+    intervals = np.diff(times, prepend=times[:1])  # 第一行为 0，与 AI 控制记录中每段第一条样本相同
+    temperature, output = actual_to_infrared(samples[:, 2]), samples[:, 3]
+    # 手动调电流的行当作间断：电流不是模型给出的
+    is_sample = np.isfinite(temperature) & np.isfinite(output) & ~meta['manual']
+    arrays = (temperature, output, intervals, is_sample)
+    run = np.zeros(len(samples), dtype=np.int64)
+    return arrays, run, np.array([actual_to_infrared(meta['setpoint'])]), np.array([meta['heating_rate']])
+
+
+def build_source(source):
+    """
+    在工作进程中构建一个导入单元的训练行。
+
+    返回:
+    - (outputs (k, 1), future_values (k, 20), provenance（source 字段待合并时填写）, 作废统计 counts, 行数,
+      高温运行中未导入的数据点数)
+    """
+    kind, _, files = source
+    arrays, run, setpoints, heating_rates = _csv_run_arrays(files) if kind == 'csv' else _ai_log_arrays(files[0])
+    # 高温运行的行当作间断处理：不产生训练行，窗口也不会跨入这些行
+    high_temperature = (setpoints > MAX_INFRARED_SETPOINT)[run]
+    dropped = int(np.count_nonzero(arrays[3] & high_temperature))
+    arrays = arrays[:3] + (arrays[3] & ~high_temperature,)
+    skipped = SkipSummary()
+    rows, outputs, future_values = build_run_windows(*arrays, skipped=skipped)
+    provenance = np.zeros(len(rows), dtype=PROVENANCE_DTYPE)
+    provenance['run'] = run[rows]
+    provenance['setpoint'] = setpoints[run[rows]]
+    provenance['heating_rate'] = heating_rates[run[rows]]
+    provenance['row'] = rows
+    return outputs, future_values, provenance, skipped.counts, len(arrays[0]), dropped
+
+
+def ingest_logs(paths, workers=None, min_age=60.0, verbose=True):
+    """
+    并行导入多个日志，返回 (outputs_matrix_array, future_values_matrix_array, provenance, sources)。
+    workers: 进程数，默认为 CPU 核数；为 1 时在当前进程中依次处理
+    sources: 导入单元名称列表，provenance['source'] 为其中的下标
+    """
+    start_time = time.perf_counter()
+    sources = discover_sources(paths, min_age)
+    results = [None] * len(sources)
+    # 大文件先提交，避免最后只剩一个大文件在处理
+    order = sorted(range(len(sources)), key=lambda i: -sum(os.path.getsize(f) for f in sources[i][2]))
+    if workers == 1:
+        for index in order:
+            results[index] = build_source(sources[index])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {index: pool.submit(build_source, sources[index]) for index in order}
+            for index, future in futures.items():
+                results[index] = future.result()
+
+    skipped = SkipSummary()
+    lines = high_temperature = 0
+    for index, result in enumerate(results):
+        result[2]['source'] = index
+        for reason, count in result[3].items():
+            skipped.counts[reason] += count
+        lines += result[4]
+        high_temperature += result[5]
+    outputs_matrix_array = np.concatenate([np.zeros((0, 1))] + [result[0] for result in results])
+    future_values_matrix_array = np.concatenate([np.zeros((0, HORIZON))] + [result[1] for result in results])
+    provenance = np.concatenate([np.zeros(0, dtype=PROVENANCE_DTYPE)] + [result[2] for result in results])
+
+    if verbose:
+        for reason, count in skipped.counts.items():
+            if count:
+                print(f"Skipped {count} data points: {SKIP_REASONS[reason]}")
+        if high_temperature:
+            print(f"Skipped {high_temperature} data points: infrared setpoint above {MAX_INFRARED_SETPOINT:g}")
+        elapsed = time.perf_counter() - start_time
+        print(f"Ingested {len(sources)} sources ({lines} lines, {len(provenance)} data points) in {elapsed:.2f} s "
+              f"with {workers or os.cpu_count()} workers")
+    return outputs_matrix_array, future_values_matrix_array, provenance, [name for _, name, _ in sources]
+
+
+def save_dataset(path, outputs_matrix_array, future_values_matrix_array, provenance, sources):
+    np.savez(path, outputs=outputs_matrix_array, future_values=future_values_matrix_array, provenance=provenance,
+             sources=np.array(sources, dtype=str))
+
+
+def load_dataset(path):
+    """读取 save_dataset 保存的数据，返回 (outputs_matrix_array, future_values_matrix_array, provenance, sources)"""
+    with np.load(path) as data:
+        return data['outputs'], data['future_values'], data['provenance'], data['sources'].tolist()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    workers = None
+    output_path = 'dataset.npz'
+    if '--workers' in args:
+        index = args.index('--workers')
+        workers = int(args[index + 1])
+        del args[index:index + 2]
+    if '--output' in args:
+        index = args.index('--output')
+        output_path = args[index + 1]
+        del args[index:index + 2]
+    include_temperature_log = '--temperature-log' in args
+    if include_temperature_log:
+        args.remove('--temperature-log')
+    dataset = ingest_logs(args or [ANN_DIR] + ([DEFAULT_LOG_DIR] if include_temperature_log else []), workers)
+    save_dataset(output_path, *dataset)
+    print(f"Saved to {output_path}")
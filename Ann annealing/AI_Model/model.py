@@ -1,67 +1,238 @@
 '''
 机器训练模型
+
+交叉验证的各折在独立的进程中并行训练：每折只用训练部分拟合归一化器，并从训练部分中留出一部分作为验证集，
+用于早停和在验证误差不再下降时降低学习率；测试部分只用于评估。
+最后按各折的最佳轮数在全部数据上重新训练，model.h5、两个归一化器和 NumPy 权重 model_weights.npz 一起保存。
+
+用法: python model.py [--workers N] [日志文件或 ingest.py 生成的 dataset.npz]
 '''
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Input
 from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.model_selection import KFold
 from sklearn.metrics import mean_squared_error
-from data import process_data  # 导入 process_data 函数
+from dataset_cache import load_training_data  # 通过增量缓存调用 process_data
+from numpy_model import NumpyModel, fold_scalers, keras_dense_weights
 from joblib import dump, load
 
-def create_model(input_dim):
-    model = Sequential([
-        Input(shape=(input_dim,)),  # 使用 Input 层定义输入形状
-        Dense(64, activation='swish'),  # 增加神经元数量并使用 swish 激活函数
-        Dense(32, activation='relu'),
-        Dense(16, activation='relu'),
-        Dense(1, activation='linear')
-    ])
+LEARNING_RATE = 0.001  # 初始学习率，验证误差停滞时减半
+MIN_LEARNING_RATE = 0.00001
+MAX_EPOCHS = 500
+PATIENCE = 20  # 验证误差连续 PATIENCE 轮没有下降时停止
+BATCH_SIZE = 64
+VALIDATION_FRACTION = 0.1  # 每折训练部分中留作验证集的比例
+UNITS = (64, 32, 16)  # 各隐藏层神经元数
+HIDDEN_ACTIVATIONS = ('swish', 'relu', 'relu')
+
+MODEL_FILE = 'model.h5'
+SCALER_VALUES_FILE = 'scaler_values.joblib'
+SCALER_OUTPUTS_FILE = 'scaler_outputs.joblib'
+WEIGHTS_FILE = 'model_weights.npz'  # --backend numpy 使用的权重（归一化器已折叠）
+
+def create_model(input_dim, learning_rate=LEARNING_RATE, units=UNITS, activations=HIDDEN_ACTIVATIONS):
+    model = Sequential(
+        [Input(shape=(input_dim,))]  # 使用 Input 层定义输入形状
+        + [Dense(n, activation=activation) for n, activation in zip(units, activations)]
+        + [Dense(1, activation='linear')]
+    )
     # 使用均方误差作为损失函数
-    model.compile(optimizer=Adam(learning_rate=0.00005), loss='mean_squared_error')  # 调整学习率
+    model.compile(optimizer=Adam(learning_rate=learning_rate), loss='mean_squared_error')
     return model
 
-def cross_validate_model(future_values_matrix_array, outputs_matrix_array, n_splits=5):
-    # 对 future_values_matrix_array 进行归一化
+def training_callbacks(monitor, patience=PATIENCE):
+    """早停（恢复最佳权重）和学习率衰减"""
+    return [
+        EarlyStopping(monitor=monitor, patience=patience, restore_best_weights=True),
+        ReduceLROnPlateau(monitor=monitor, factor=0.5, patience=max(1, patience // 4), min_lr=MIN_LEARNING_RATE),
+    ]
+
+def _limit_threads(threads):
+    """限制工作进程中 TensorFlow 的线程数，避免多个进程争抢 CPU"""
+    if not threads:
+        return
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:  # TensorFlow 已初始化（在当前进程中依次训练时）
+        pass
+
+def _load_array(array):
+    """并行训练时数据以 .npy 文件传给工作进程，以内存映射方式读取"""
+    return np.load(array, mmap_mode='r') if isinstance(array, str) else array
+
+def train_fold(task):
+    """
+    训练并评估一折，在工作进程中运行。
+    task 中可选的 units / activations 指定网络结构；
+    export 为真时结果中附带折叠了归一化器的 NumPy 权重 (weights, biases, activations)
+
+    返回:
+    - {'fold', 'mse'（测试部分的 MSE，原始输出单位）, 'best_epoch', 'epochs', 'seconds'}
+    """
+    start_time = time.perf_counter()
+    _limit_threads(task['threads'])
+    future_values = _load_array(task['future_values'])
+    outputs = _load_array(task['outputs'])
+    train_index, test_index = task['train_index'], task['test_index']
+
+    # 归一化器只用训练部分拟合，测试部分的数据不参与
+    scaler_values = MinMaxScaler().fit(future_values[train_index])
+    scaler_outputs = MinMaxScaler().fit(outputs[train_index])
+    X_train = scaler_values.transform(future_values[train_index])
+    y_train = scaler_outputs.transform(outputs[train_index])
+    X_test = scaler_values.transform(future_values[test_index])
+
+    # 从训练部分中随机留出验证集，用于早停和学习率衰减
+    order = np.random.default_rng(task['fold']).permutation(len(train_index))
+    validation_size = max(1, int(len(order) * task['validation_fraction']))
+    fit_rows, validation_rows = order[validation_size:], order[:validation_size]
+
+    model = create_model(X_train.shape[1], task['learning_rate'], task.get('units', UNITS),
+                         task.get('activations', HIDDEN_ACTIVATIONS))
+    history = model.fit(X_train[fit_rows], y_train[fit_rows], validation_data=(X_train[validation_rows], y_train[validation_rows]),
+                        epochs=task['max_epochs'], batch_size=task['batch_size'], verbose=0,
+                        callbacks=training_callbacks('val_loss', task['patience']))
+
+    predictions = scaler_outputs.inverse_transform(model.predict(X_test, batch_size=len(X_test), verbose=0))
+    result = {
+        'fold': task['fold'],
+        'mse': float(mean_squared_error(outputs[test_index], predictions)),
+        'best_epoch': int(np.argmin(history.history['val_loss'])) + 1,
+        'epochs': len(history.history['loss']),
+        'seconds': time.perf_counter() - start_time,
+    }
+    if task.get('export'):
+        weights, biases, activations = keras_dense_weights(model)
+        weights, biases = fold_scalers(weights, biases, activations, scaler_values, scaler_outputs)
+        result['weights'] = (weights, biases, activations)
+    return result
+
+def share_arrays(tmp_dir, **arrays):
+    """把数组各写一次 .npy，返回 {名称: 路径}，工作进程以内存映射方式读取，不必为每个任务复制"""
+    paths = {}
+    for name, array in arrays.items():
+        paths[name] = os.path.join(tmp_dir, f'{name}.npy')
+        np.save(paths[name], array)
+    return paths
+
+def save_model_files(model, scaler_values, scaler_outputs, output_dir='.'):
+    """先写临时文件再依次替换，model.h5、两个归一化器和 NumPy 权重总是来自同一次训练"""
+    weights, biases, activations = keras_dense_weights(model)
+    weights, biases = fold_scalers(weights, biases, activations, scaler_values, scaler_outputs)
+    numpy_model = NumpyModel(weights, biases, activations)
+    files = [(MODEL_FILE, lambda path: model.save(path)),
+             (SCALER_VALUES_FILE, lambda path: dump(scaler_values, path)),
+             (SCALER_OUTPUTS_FILE, lambda path: dump(scaler_outputs, path)),
+             (WEIGHTS_FILE, lambda path: numpy_model.save(path))]
+    temporary = []
+    for name, save in files:
+        stem, ext = os.path.splitext(name)
+        tmp_path = os.path.join(output_dir, f"{stem}.tmp{ext}")  # 保留扩展名，Keras 按扩展名选择 HDF5 格式
+        save(tmp_path)
+        temporary.append((tmp_path, os.path.join(output_dir, name)))
+    for tmp_path, path in temporary:
+        os.replace(tmp_path, path)
+
+def train_final_model(future_values_matrix_array, outputs_matrix_array, epochs, learning_rate=LEARNING_RATE,
+                      batch_size=BATCH_SIZE, patience=PATIENCE, output_dir='.'):
+    """
+    用全部数据拟合归一化器并训练 epochs 轮，保存模型、归一化器和 NumPy 权重。
+    与各折相同，留出 VALIDATION_FRACTION 的数据按验证误差衰减学习率，使交叉验证得到的轮数对应相同的学习率安排
+    """
     scaler_values = MinMaxScaler()
     future_values_scaled = scaler_values.fit_transform(future_values_matrix_array)
-    dump(scaler_values, 'scaler_values.joblib')  # 保存归一化器
-
-    # 对 outputs_matrix_array 进行归一化
     scaler_outputs = MinMaxScaler()
     outputs_scaled = scaler_outputs.fit_transform(outputs_matrix_array)
-    dump(scaler_outputs, 'scaler_outputs.joblib')  # 保存归一化器
 
-    # 初始化 KFold
-    kf = KFold(n_splits=n_splits, shuffle=True, random_state=42)
-    mse_scores = []
+    order = np.random.default_rng(0).permutation(len(future_values_scaled))
+    validation_size = max(1, int(len(order) * VALIDATION_FRACTION))
+    fit_rows, validation_rows = order[validation_size:], order[:validation_size]
+    model = create_model(future_values_scaled.shape[1], learning_rate)
+    model.fit(future_values_scaled[fit_rows], outputs_scaled[fit_rows],
+              validation_data=(future_values_scaled[validation_rows], outputs_scaled[validation_rows]),
+              epochs=epochs, batch_size=batch_size, verbose=0,
+              callbacks=training_callbacks('val_loss', patience)[1:])  # 只保留学习率衰减，轮数已由交叉验证确定
+    save_model_files(model, scaler_values, scaler_outputs, output_dir)
+    return model
 
-    for train_index, test_index in kf.split(future_values_scaled):
-        X_train, X_test = future_values_scaled[train_index], future_values_scaled[test_index]
-        y_train, y_test = outputs_scaled[train_index], outputs_scaled[test_index]
+def cross_validate_model(future_values_matrix_array, outputs_matrix_array, n_splits=5, workers=None,
+                         learning_rate=LEARNING_RATE, max_epochs=MAX_EPOCHS, patience=PATIENCE, batch_size=BATCH_SIZE,
+                         output_dir='.'):
+    """
+    并行交叉验证，然后按各折最佳轮数的中位数在全部数据上训练最终模型。
+    workers: 进程数，默认为 min(折数, CPU 核数)；为 1 时在当前进程中依次训练
 
-        # 创建和训练模型
-        model = create_model(X_train.shape[1])
-        model.fit(X_train, y_train, epochs=200, batch_size=64, verbose=0)
+    返回:
+    - (各折结果列表, 最终模型的训练轮数)
+    """
+    future_values_matrix_array = np.asarray(future_values_matrix_array, dtype=float)
+    outputs_matrix_array = np.asarray(outputs_matrix_array, dtype=float).reshape(-1, 1)
+    workers = workers or min(n_splits, os.cpu_count() or 1)
+    start_time = time.perf_counter()
 
-        # 预测和评估
-        predictions = model.predict(X_test)
-        mse = mean_squared_error(y_test, predictions)
-        mse_scores.append(mse)
+    # 初始化 KFold
+    kf = KFold(n_splits=n_splits, shuffle=True, random_state=42)
+    tasks = [{
+        'fold': fold, 'train_index': train_index, 'test_index': test_index,
+        'future_values': future_values_matrix_array, 'outputs': outputs_matrix_array,
+        'learning_rate': learning_rate, 'max_epochs': max_epochs, 'patience': patience, 'batch_size': batch_size,
+        'validation_fraction': VALIDATION_FRACTION, 'threads': None,
+    } for fold, (train_index, test_index) in enumerate(kf.split(future_values_matrix_array))]
 
-    # 保存模型
-    model.save('model.h5')
+    if workers == 1:
+        results = [train_fold(task) for task in tasks]
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = share_arrays(tmp_dir, future_values=future_values_matrix_array, outputs=outputs_matrix_array)
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            for task in tasks:
+                task.update(paths, threads=threads)
+            # TensorFlow 不支持 fork 后继续使用，工作进程用 spawn 启动
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                results = list(pool.map(train_fold, tasks))
 
+    for result in results:
+        print(f"Fold {result['fold'] + 1}: MSE {result['mse']:.6g}, best epoch {result['best_epoch']} "
+              f"of {result['epochs']}, {result['seconds']:.1f} s")
+    mse_scores = [result['mse'] for result in results]
     print(f"Cross-validated MSE scores: {mse_scores}")
     print(f"Average MSE: {np.mean(mse_scores)}")
+    print(f"Cross-validation took {time.perf_counter() - start_time:.1f} s with {workers} workers")
+
+    epochs = int(np.median([result['best_epoch'] for result in results]))
+    final_start = time.perf_counter()
+    train_final_model(future_values_matrix_array, outputs_matrix_array, epochs, learning_rate, batch_size, patience,
+                      output_dir)
+    print(f"Final model trained on all data for {epochs} epochs in {time.perf_counter() - final_start:.1f} s, "
+          f"saved to {os.path.join(output_dir, MODEL_FILE)}")
+    return results, epochs
 
 if __name__ == "__main__":
+    args = sys.argv[1:]
+    workers = None
+    if '--workers' in args:
+        index = args.index('--workers')
+        workers = int(args[index + 1])
+        del args[index:index + 2]
     # 从 data.py 中获取 future_values_matrix_array 和 outputs_matrix_array
-    file_path = 'new_experiment_log.txt'
-    output_file_path = 'matrix_output.txt'
-    outputs_matrix_array, future_values_matrix_array = process_data(file_path)
+    file_path = args[0] if args else 'new_experiment_log.txt'
+    if file_path.endswith('.npz'):
+        from ingest import load_dataset
+        outputs_matrix_array, future_values_matrix_array, _, _ = load_dataset(file_path)
+    else:
+        # 日志只追加了新内容时只处理新增部分（见 dataset_cache.py）
+        outputs_matrix_array, future_values_matrix_array = load_training_data(file_path)
 
     # 进行交叉验证
-    cross_validate_model(future_values_matrix_array, outputs_matrix_array)
+    cross_validate_model(future_values_matrix_array, outputs_matrix_array, workers=workers)
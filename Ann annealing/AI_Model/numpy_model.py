@@ -0,0 +1,167 @@
+'''
+纯 NumPy 推理引擎：
+从 model.h5 导出 Dense 权重，并把 scaler_values / scaler_outputs 的 MinMax 归一化折叠进首层和末层，
+控制循环只需要 NumPy 即可完成前向计算，不再导入 TensorFlow。
+'''
+import os
+import numpy as np
+
+# 默认文件位置（Ann annealing 主目录）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODEL_PATH = os.path.join(BASE_DIR, 'model.h5')
+DEFAULT_SCALER_VALUES_PATH = os.path.join(BASE_DIR, 'scaler_values.joblib')
+DEFAULT_SCALER_OUTPUTS_PATH = os.path.join(BASE_DIR, 'scaler_outputs.joblib')
+DEFAULT_WEIGHTS_PATH = os.path.join(BASE_DIR, 'model_weights.npz')
+
+
+def swish(x):
+    # sigmoid(x) = 0.5 * (1 + tanh(x / 2))，避免 exp 溢出
+    return x * 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def relu(x):
+    return np.maximum(x, 0.0)
+
+
+def linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    'swish': swish,
+    'silu': swish,
+    'relu': relu,
+    'linear': linear,
+}
+
+# 推理精度：权重、偏置和计算都使用该精度。
+# NumPy 的 float16 和整数矩阵乘法不走 BLAS，比 float32 慢几倍到上百倍，因此不提供 float16 / int8
+PRECISIONS = ('float64', 'float32')
+
+
+class NumpyModel:
+    """
+    Dense 网络的 NumPy 前向计算。
+    输入为未归一化的未来温度矩阵 (N, 20)，输出为反归一化后的电流 (N, 1)。
+    """
+
+    def __init__(self, weights, biases, activations, precision='float64'):
+        if not (len(weights) == len(biases) == len(activations)):
+            raise ValueError("weights, biases and activations must have the same length")
+        for name in activations:
+            if name not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {name}")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported precision: {precision}")
+        self.precision = precision
+        self.dtype = np.float64 if precision == 'float64' else np.float32
+        self.weights = [np.asarray(w, dtype=self.dtype) for w in weights]
+        self.biases = [np.asarray(b, dtype=self.dtype) for b in biases]
+        self.activations = list(activations)
+        self._functions = [ACTIVATIONS[name] for name in self.activations]
+
+    @property
+    def input_dim(self):
+        return self.weights[0].shape[0]
+
+    def predict(self, x):
+        """前向计算，x 可以是 (input_dim,) 或 (N, input_dim)"""
+        h = np.atleast_2d(np.asarray(x, dtype=self.dtype))
+        for w, b, f in zip(self.weights, self.biases, self._functions):
+            h = f(h @ w + b)
+        return h
+
+    def save(self, path=DEFAULT_WEIGHTS_PATH):
+        arrays = {'activations': np.array(self.activations)}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f'W{i}'] = w
+            arrays[f'b{i}'] = b
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path=DEFAULT_WEIGHTS_PATH, precision='float64'):
+        with np.load(path, allow_pickle=False) as data:
+            activations = [str(a) for a in data['activations']]
+            weights = [data[f'W{i}'] for i in range(len(activations))]
+            biases = [data[f'b{i}'] for i in range(len(activations))]
+        return cls(weights, biases, activations, precision)
+
+
+def fold_scalers(weights, biases, activations, scaler_values, scaler_outputs):
+    """
+    把 MinMaxScaler 折叠进首层和末层权重。
+    scaler.transform(X) = X * scale_ + min_，inverse_transform(Y) = (Y - min_) / scale_
+    """
+    weights = [np.asarray(w, dtype=np.float64).copy() for w in weights]
+    biases = [np.asarray(b, dtype=np.float64).copy() for b in biases]
+    if activations[-1] != 'linear':
+        raise ValueError("Output scaler can only be folded into a linear output layer")
+
+    x_scale = np.asarray(scaler_values.scale_, dtype=np.float64)
+    x_min = np.asarray(scaler_values.min_, dtype=np.float64)
+    biases[0] = biases[0] + x_min @ weights[0]
+    weights[0] = x_scale[:, None] * weights[0]
+
+    y_scale = np.asarray(scaler_outputs.scale_, dtype=np.float64)
+    y_min = np.asarray(scaler_outputs.min_, dtype=np.float64)
+    weights[-1] = weights[-1] / y_scale[None, :]
+    biases[-1] = (biases[-1] - y_min) / y_scale
+    return weights, biases
+
+
+def keras_dense_weights(model):
+    """取出 Keras 模型中各 Dense 层的 (weights, biases, activations)"""
+    from tensorflow.keras.layers import Dense
+
+    weights, biases, activations = [], [], []
+    for layer in model.layers:
+        if not isinstance(layer, Dense):
+            continue
+        w, b = layer.get_weights()
+        weights.append(w)
+        biases.append(b)
+        activations.append(layer.get_config()['activation'])
+    return weights, biases, activations
+
+
+def export_model(model_path=DEFAULT_MODEL_PATH,
+                 scaler_values_path=DEFAULT_SCALER_VALUES_PATH,
+                 scaler_outputs_path=DEFAULT_SCALER_OUTPUTS_PATH,
+                 weights_path=DEFAULT_WEIGHTS_PATH):
+    """从 Keras 模型和归一化器导出 NumPy 权重文件（仅导出时需要 TensorFlow）"""
+    from tensorflow.keras.models import load_model
+    from joblib import load
+
+    model = load_model(model_path, compile=False)
+    scaler_values = load(scaler_values_path)
+    scaler_outputs = load(scaler_outputs_path)
+
+    weights, biases, activations = keras_dense_weights(model)
+    weights, biases = fold_scalers(weights, biases, activations, scaler_values, scaler_outputs)
+    numpy_model = NumpyModel(weights, biases, activations)
+    numpy_model.save(weights_path)
+    return model, scaler_values, scaler_outputs, numpy_model
+
+
+def compare_with_keras(model, scaler_values, scaler_outputs, numpy_model, x):
+    """返回 Keras 与 NumPy 两种实现输出的最大绝对误差 (A)"""
+    keras_output = scaler_outputs.inverse_transform(model.predict(scaler_values.transform(x), verbose=0))
+    numpy_output = numpy_model.predict(x)
+    return float(np.max(np.abs(keras_output - numpy_output)))
+
+
+if __name__ == "__main__":
+    from trajectory import build_future_matrix
+
+    model, scaler_values, scaler_outputs, numpy_model = export_model()
+    print("Weights saved to:", DEFAULT_WEIGHTS_PATH)
+    print("Layers:", [w.shape for w in numpy_model.weights], numpy_model.activations)
+
+    # 在典型工况上校验两种实现的一致性
+    temperatures = np.arange(0, 601, 5)
+    setpoints = np.array([150, 300, 450])
+    heating_rates = np.array([0.8, 1.0, 1.5])
+    t, s, r = np.meshgrid(temperatures, setpoints, heating_rates, indexing='ij')
+    x = build_future_matrix(t.ravel(), s.ravel(), r.ravel())
+    max_error = compare_with_keras(model, scaler_values, scaler_outputs, numpy_model, x)
+    print(f"Max abs difference vs Keras on {len(x)} states: {max_error:.2e} A")
@@ -5,29 +5,12 @@ import numpy as np
 from tensorflow.keras.models import load_model
 from sklearn.preprocessing import MinMaxScaler
 from joblib import load
+from trajectory import build_future_matrix
+
+def predict(current_value, setpoint, heating_rate=1.0):
+    # 与 AI_Controller 使用同一套未来温度轨迹
+    input_matrix = build_future_matrix(current_value, setpoint, heating_rate)
 
-def predict(current_value, setpoint):
-    input_matrix = np.zeros((1, 20))
-    input_matrix[0, 0] = current_value
-
-    # 根据 current_value 和 self.setpoint 计算梯度
-    for i in range(1, 20):
-        # 计算当前值与 setpoint 的距离
-        distance_to_setpoint = abs(input_matrix[0, i-1] - setpoint)
-
-        # 根据距离调整梯度
-        if distance_to_setpoint > 15:
-            gradient = 0.8 if current_value < setpoint else -0.5
-        else:
-            gradient = 0.2
-
-        # 计算下一个值
-        next_value = input_matrix[0, i-1] + gradient
-        if (gradient > 0 and next_value > setpoint) or (gradient < 0 and next_value < setpoint):
-            input_matrix[0, i] = setpoint
-        else:
-            input_matrix[0, i] = next_value
-    
     print(input_matrix)
 
     # 对输入矩阵进行归一化
@@ -54,7 +37,8 @@ if __name__ == "__main__":
 
     current_value = 302
     setpoint = 302
+    heating_rate = 1.0
 
-    prediction = predict(current_value, setpoint)
+    prediction = predict(current_value, setpoint, heating_rate)
     print(prediction)
 
@@ -0,0 +1,92 @@
+'''
+NumPy 推理各精度 (float64 / float32) 的精度与延迟验证：
+以 Keras 模型（model.h5 + 归一化器）为基准，在 data.py 生成的数据集上比较最大电流误差 (A) 和推理延迟；
+未安装 TensorFlow 时退而以 float64 NumPy 模型为基准。
+电源电流分辨率为 1 mA，最大误差低于该值时才建议在控制中启用对应精度。
+float16 / int8 在 NumPy 中没有加速（矩阵乘法不走 BLAS），不再提供。
+'''
+import os
+import sys
+import time
+import numpy as np
+from numpy_model import (NumpyModel, PRECISIONS, DEFAULT_WEIGHTS_PATH, DEFAULT_MODEL_PATH,
+                         DEFAULT_SCALER_VALUES_PATH, DEFAULT_SCALER_OUTPUTS_PATH)
+from trajectory import build_future_matrix
+
+CURRENT_RESOLUTION = 0.001  # 电源电流分辨率 (A)
+
+
+def measure_latency(model, x, repeats=200):
+    """返回单行推理的中位延迟和整批推理的中位延迟 (s)"""
+    row = x[:1]
+    single = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(row)
+        single.append(time.perf_counter() - start)
+    batch = []
+    for _ in range(max(repeats // 20, 3)):
+        start = time.perf_counter()
+        model.predict(x)
+        batch.append(time.perf_counter() - start)
+    return float(np.median(single)), float(np.median(batch))
+
+
+def keras_reference(x, model_path=DEFAULT_MODEL_PATH, scaler_values_path=DEFAULT_SCALER_VALUES_PATH,
+                    scaler_outputs_path=DEFAULT_SCALER_OUTPUTS_PATH):
+    """Keras 模型对 x 的预测电流；未安装 TensorFlow 时返回 None"""
+    try:
+        from tensorflow.keras.models import load_model
+    except ImportError:
+        return None
+    from joblib import load
+    model = load_model(model_path, compile=False)
+    scaler_values = load(scaler_values_path)
+    scaler_outputs = load(scaler_outputs_path)
+    prediction_scaled = model.predict(scaler_values.transform(x), batch_size=len(x), verbose=0)
+    return scaler_outputs.inverse_transform(prediction_scaled)
+
+
+def evaluate_precisions(x, weights_path=DEFAULT_WEIGHTS_PATH, precisions=PRECISIONS, reference=None):
+    """
+    对每种精度返回 (精度, 最大误差 A, 单行延迟 s, 整批延迟 s)。
+    reference: 基准预测（通常为 keras_reference 的结果），为 None 时以 float64 NumPy 模型为基准
+    """
+    if reference is None:
+        reference = NumpyModel.load(weights_path, 'float64').predict(x)
+    results = []
+    for precision in precisions:
+        model = NumpyModel.load(weights_path, precision)
+        max_error = float(np.max(np.abs(model.predict(x).astype(np.float64) - reference)))
+        single, batch = measure_latency(model, x)
+        results.append((precision, max_error, single, batch))
+    return results
+
+
+def load_dataset(file_path):
+    """从实验日志读取未来温度矩阵；日志不存在时使用典型控制工况网格"""
+    if os.path.exists(file_path):
+        from data import process_data
+        _, future_values_matrix_array = process_data(file_path)
+        if len(future_values_matrix_array):
+            return future_values_matrix_array
+    print(f"No usable data in {file_path}, using a grid of controller states instead.")
+    t, s, r = np.meshgrid(np.arange(0, 601), [150, 300, 450], [0.8, 1.0, 1.5], indexing='ij')
+    return build_future_matrix(t.ravel(), s.ravel(), r.ravel())
+
+
+if __name__ == "__main__":
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'new_experiment_log.txt'
+    x = load_dataset(file_path)
+    reference = keras_reference(x)
+    if reference is None:
+        print("TensorFlow is not installed; errors are relative to the float64 NumPy model, not Keras.")
+    results = evaluate_precisions(x, reference=reference)
+
+    baseline_single, baseline_batch = results[0][2], results[0][3]
+    print(f"Samples: {len(x)}")
+    print(f"Reference: {'Keras' if reference is not None else 'NumPy float64'}")
+    print(f"{'precision':<10}{'max error (A)':>15}{'1-row (us)':>12}{'batch (ms)':>12}{'speedup':>10}  within 1 mA")
+    for precision, max_error, single, batch in results:
+        print(f"{precision:<10}{max_error:>15.2e}{single * 1e6:>12.1f}{batch * 1e3:>12.2f}"
+              f"{baseline_batch / batch:>9.2f}x  {'yes' if max_error < CURRENT_RESOLUTION else 'NO'}")
@@ -0,0 +1,192 @@
+'''
+退火运行归档：把 temperature_log 下每次运行的 CSV 合并成一个内存映射的数组文件，
+另存每次运行的偏移量和元数据（setpoint、加热速率、是否自动测试、开始时间）。
+- samples.f8: float64 数组，每行 (wall_time, monotonic, temperature, output, voltage)，电压未测量时为 NaN
+- runs.npy: 每次运行一条结构化记录
+新运行增量追加；RunArchive.run(i) 直接返回内存映射上的切片，不复制数据。
+
+用法: python run_archive.py [temperature_log 目录] [归档目录]
+'''
+import csv
+import glob
+import os
+import re
+import sys
+import time
+from datetime import datetime
+import numpy as np
+
+COLUMNS = ('wall_time', 'monotonic', 'temperature', 'output', 'voltage')
+RUN_DTYPE = np.dtype([
+    ('name', 'U64'),  # CSV 文件名（不含扩展名和 _partN）
+    ('offset', 'i8'),  # 在 samples 中的起始行
+    ('length', 'i8'),  # 行数
+    ('setpoint', 'f8'),
+    ('heating_rate', 'f8'),
+    ('auto_test', 'i1'),  # 1 / 0，未知为 -1
+    ('start_time', 'f8'),  # 第一条记录的 Unix 时间
+])
+
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'temperature_log')
+_HEADER_RE = re.compile(r'Setpoint:\s*([-+0-9.eE]+).*?Heating Rate:\s*([-+0-9.eE]+)(?:.*?main_aototest:\s*(\w+))?')
+_PART_RE = re.compile(r'_part\d+$')
+
+
+def _parse_timestamp(text):
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    return np.nan
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def read_run_csv(paths):
+    """
+    读取一次运行的 CSV（按顺序传入主文件和 _partN 文件）。
+
+    返回:
+    - (samples, meta)：samples 为 (n, 5) 数组，meta 为 setpoint / heating_rate / auto_test 字典，
+      以及 manual（每行是否为手动调电流，没有 Mode 列的旧文件全部为 False）
+    """
+    meta = {'setpoint': np.nan, 'heating_rate': np.nan, 'auto_test': -1}
+    rows = []
+    manual = []
+    for path in paths:
+        header = ['Timestamp', 'Temperature', 'Output', 'Voltage']
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if not row:
+                    continue
+                if row[0].startswith('#'):
+                    match = _HEADER_RE.search(','.join(row))
+                    if match:
+                        meta['setpoint'] = float(match.group(1))
+                        meta['heating_rate'] = float(match.group(2))
+                        if match.group(3) is not None:
+                            meta['auto_test'] = 1 if match.group(3) == 'True' else 0
+                    continue
+                if row[0] == 'Timestamp':
+                    header = row
+                    continue
+                values = dict(zip(header, row))
+                rows.append((_parse_timestamp(values.get('Timestamp', '')), _to_float(values.get('Monotonic')),
+                             _to_float(values.get('Temperature')), _to_float(values.get('Output')),
+                             _to_float(values.get('Voltage'))))
+                manual.append(values.get('Mode') == 'manual')
+    meta['manual'] = np.array(manual, dtype=bool)
+    return np.array(rows, dtype=float).reshape(-1, len(COLUMNS)), meta
+
+
+def group_run_files(log_dir, prefix="temperature_log", min_age=60.0):
+    """
+    按运行分组 CSV 文件：{运行名: [主文件, _part1, ...]}。
+    min_age: 最近 min_age 秒内修改过的运行视为仍在写入，暂不归档
+    """
+    now = time.time()
+    groups = {}
+    for path in sorted(glob.glob(os.path.join(log_dir, f"{prefix}_*.csv"))):
+        name = _PART_RE.sub('', os.path.splitext(os.path.basename(path))[0])
+        groups.setdefault(name, []).append(path)
+    for name in list(groups):
+        paths = sorted(groups[name], key=lambda p: (len(p), p))  # 主文件在前，_part1、_part2 ... 依次排列
+        if any(now - os.path.getmtime(p) < min_age for p in paths):
+            del groups[name]
+        else:
+            groups[name] = paths
+    return groups
+
+
+class RunArchive:
+    def __init__(self, archive_dir=None):
+        """以只读方式打开归档；samples 为内存映射"""
+        self.archive_dir = archive_dir or os.path.join(DEFAULT_LOG_DIR, 'archive')
+        runs_path = os.path.join(self.archive_dir, 'runs.npy')
+        self.runs = np.load(runs_path) if os.path.exists(runs_path) else np.zeros(0, dtype=RUN_DTYPE)
+        total = int((self.runs['offset'] + self.runs['length']).max()) if len(self.runs) else 0
+        if total:
+            self.samples = np.memmap(os.path.join(self.archive_dir, 'samples.f8'), dtype='f8', mode='r',
+                                     shape=(total, len(COLUMNS)))
+        else:
+            self.samples = np.zeros((0, len(COLUMNS)))
+
+    def __len__(self):
+        return len(self.runs)
+
+    def run(self, index):
+        """第 index 次运行的数据 (n, 5)，内存映射上的视图"""
+        record = self.runs[index]
+        return self.samples[record['offset']:record['offset'] + record['length']]
+
+    def column(self, index, name):
+        """第 index 次运行的某一列（同样不复制数据）"""
+        return self.run(index)[:, COLUMNS.index(name)]
+
+    def find(self, setpoint=None, heating_rate=None, auto_test=None, tolerance=1e-6):
+        """按元数据筛选运行，返回运行序号数组"""
+        mask = np.ones(len(self.runs), dtype=bool)
+        if setpoint is not None:
+            mask &= np.abs(self.runs['setpoint'] - setpoint) <= tolerance
+        if heating_rate is not None:
+            mask &= np.abs(self.runs['heating_rate'] - heating_rate) <= tolerance
+        if auto_test is not None:
+            mask &= self.runs['auto_test'] == int(auto_test)
+        return np.flatnonzero(mask)
+
+
+def build_archive(log_dir=DEFAULT_LOG_DIR, archive_dir=None, min_age=60.0):
+    """
+    把尚未归档的运行追加到归档中，返回新追加的运行数。
+    先追加数据再原子替换 runs.npy，中途中断时多写的数据在下次追加前截掉。
+    """
+    archive_dir = archive_dir or os.path.join(log_dir, 'archive')
+    os.makedirs(archive_dir, exist_ok=True)
+    runs_path = os.path.join(archive_dir, 'runs.npy')
+    samples_path = os.path.join(archive_dir, 'samples.f8')
+    runs = np.load(runs_path) if os.path.exists(runs_path) else np.zeros(0, dtype=RUN_DTYPE)
+    total = int((runs['offset'] + runs['length']).max()) if len(runs) else 0
+    row_bytes = 8 * len(COLUMNS)
+
+    if os.path.exists(samples_path) and os.path.getsize(samples_path) != total * row_bytes:
+        with open(samples_path, 'r+b') as f:
+            f.truncate(total * row_bytes)
+
+    archived = set(runs['name'].tolist())
+    new_runs = []
+    with open(samples_path, 'ab') as f:
+        for name, paths in group_run_files(log_dir, min_age=min_age).items():
+            if name in archived:
+                continue
+            samples, meta = read_run_csv(paths)
+            if len(samples) == 0:
+                continue
+            f.write(np.ascontiguousarray(samples, dtype='<f8').tobytes())
+            new_runs.append((name, total, len(samples), meta['setpoint'], meta['heating_rate'], meta['auto_test'],
+                             samples[0, 0]))
+            total += len(samples)
+        f.flush()
+        os.fsync(f.fileno())
+
+    if new_runs:
+        runs = np.concatenate([runs, np.array(new_runs, dtype=RUN_DTYPE)])
+        tmp_path = runs_path + '.tmp.npy'
+        np.save(tmp_path, runs)
+        os.replace(tmp_path, runs_path)
+    return len(new_runs)
+
+
+if __name__ == "__main__":
+    log_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOG_DIR
+    archive_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    start = time.perf_counter()
+    added = build_archive(log_dir, archive_dir)
+    archive = RunArchive(archive_dir or os.path.join(log_dir, 'archive'))
+    print(f"Archived {added} new runs in {time.perf_counter() - start:.2f} s; "
+          f"{len(archive)} runs, {len(archive.samples)} samples in {archive.archive_dir}")
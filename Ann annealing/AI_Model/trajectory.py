@@ -0,0 +1,49 @@
+'''
+未来温度轨迹生成（AI 控制与离线评估共用）
+'''
+import numpy as np
+
+HORIZON = 20  # 未来温度向量长度（模型输入维度）
+
+
+def build_future_matrix(current_values, setpoints, heating_rates=1.0, horizon=HORIZON):
+    """
+    一次性构建 (N, horizon) 的未来温度矩阵。
+
+    参数:
+    - current_values: 当前温度，标量或长度为 N 的数组
+    - setpoints: 目标温度，标量或长度为 N 的数组
+    - heating_rates: 加热速率 (°C/s)，标量或长度为 N 的数组
+
+    返回:
+    - future_temperature: (N, horizon) 数组，第 0 列为当前温度
+    """
+    current_values, setpoints, heating_rates = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(current_values, dtype=float)),
+        np.atleast_1d(np.asarray(setpoints, dtype=float)),
+        np.atleast_1d(np.asarray(heating_rates, dtype=float)),
+    )
+
+    # 距离 setpoint 较远时按加热速率升温（或以一半速率降温），接近时按一半速率趋近
+    distance_to_setpoint = np.abs(current_values - setpoints)
+    threshold = 5 + setpoints / 20 * heating_rates ** 1.5
+    gradient = np.where(
+        distance_to_setpoint > threshold,
+        np.where(current_values < setpoints, heating_rates, -heating_rates / 2),
+        heating_rates / 2,
+    )
+
+    # 线性外推后在越过 setpoint 的位置截断（第 0 列保持当前温度不变）
+    steps = np.arange(horizon)
+    ramp = current_values[:, None] + gradient[:, None] * steps
+    clamped = np.where(
+        gradient[:, None] > 0, np.minimum(ramp, setpoints[:, None]),
+        np.where(gradient[:, None] < 0, np.maximum(ramp, setpoints[:, None]), ramp)
+    )
+    clamped[:, 0] = current_values
+    return clamped
+
+
+def build_future_temperature(current_value, setpoint, heating_rate=1.0, horizon=HORIZON):
+    """构建单个状态的 (1, horizon) 未来温度矩阵"""
+    return build_future_matrix(current_value, setpoint, heating_rate, horizon)
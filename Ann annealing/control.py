@@ -1,17 +1,25 @@
 # control.py
+import os
+import sys
 import pyvisa
-import time
+from latency import stage
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.scpi import SCPISession
+from common.instrument_broker import open_instrument
 
 class PowerControl:
     def __init__(self):
-        self.rm = pyvisa.ResourceManager()
-        self.instrument = self.rm.open_resource('USB0::0x2EC7::0x320C::804634011797110022::2::INSTR')
+        # 代理进程运行时通过代理访问电源（并取得独占租约），否则直接打开 VISA 资源
+        self.instrument, self.rm = open_instrument('USB0::0x2EC7::0x320C::804634011797110022::2::INSTR', "Ann annealing")
+        self.session = SCPISession(self.instrument)  # 只发送改变了的参数，电压和电流合并为一条消息
         self.stop_requested = False
+        self.monitor = None  # 可选的 LatencyMonitor，用于统计各指令耗时
 
     def set_power(self, voltage, current, duration):
         try:
-            self.instrument.write(f'VOLT {voltage}')
-            self.instrument.write(f'CURR {current}')
+            with stage(self.monitor, 'set_power'):
+                self.session.set({'VOLT': voltage, 'CURR': current})
             # Duration控制可以通过sleep或外部计时控制，但在此方法中不进行时间控制
         except pyvisa.VisaIOError as e:
             print(f"VISA I/O Error: {e}")
@@ -19,23 +27,23 @@ class PowerControl:
             print(f"An unexpected error occurred: {e}")
 
     def start_output(self):
-        self.instrument.write('OUTP ON')
+        self.session.set({'OUTP': 'ON'}, force=True)
 
     def stop_output(self):
-        self.instrument.write('OUTP OFF')
+        self.session.set({'OUTP': 'OFF'}, force=True)
 
     def get_voltage(self):
+        with stage(self.monitor, 'get_voltage'):
+            return self._get_voltage()
+
+    def _get_voltage(self):
         # 查询设备电压
         try:
-            # 发送查询命令
-            self.instrument.write("MEAS:VOLT?")
-
-            # 读取返回值
-            raw_voltage = self.instrument.read() # 返回的可能是字符串，例如 "12.345\n"
-            time.sleep(0.2)
+            # 发送查询命令并读取返回值（终止符和超时由会话配置）
+            raw_voltage = self.session.query("MEAS:VOLT?")
 
             # 处理返回值
-            voltage = float(raw_voltage.strip())  # 去掉换行符并转换为浮点数
+            voltage = float(raw_voltage)
 
         except ValueError:
             print(f"Error: Received invalid voltage value: {raw_voltage}")
@@ -48,17 +56,17 @@ class PowerControl:
         return voltage
 
     def get_current(self):
+        with stage(self.monitor, 'get_current'):
+            return self._get_current()
+
+    def _get_current(self):
         # 查询设备电流
         try:
-            # 发送查询命令
-            self.instrument.write("MEAS:CURR?")
-
-            # 读取返回值
-            raw_current = self.instrument.read()  # 返回的可能是字符串，例如 "1.234\n"
-            time.sleep(0.2)
+            # 发送查询命令并读取返回值（终止符和超时由会话配置）
+            raw_current = self.session.query("MEAS:CURR?")
 
             # 处理返回值
-            current = float(raw_current.strip())  # 去掉换行符并转换为浮点数
+            current = float(raw_current)
 
         except ValueError:
             print(f"Error: Received invalid current value: {raw_current}")
@@ -71,6 +79,7 @@ class PowerControl:
         return current
 
     def close(self):
+        print(self.session.summary())
         if self.instrument:
             self.instrument.close()
         if self.rm:
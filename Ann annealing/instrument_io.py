@@ -0,0 +1,129 @@
+'''
+仪器 I/O 流水线：每台仪器由一个专用线程独占访问，控制线程只提交指令或读取缓冲区。
+- 红外温度由 IRAcquisitionThread 持续采集，控制线程直接取环形缓冲区中的最新样本
+- 电压/电流回读在电源线程中以低优先级执行，不阻塞电流输出
+'''
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from latency import stage
+
+# 指令优先级（数值越小越先执行）
+ACTUATE = 0
+READ = 1
+READBACK = 2
+
+
+class DeviceWorker:
+    """独占一台仪器的工作线程，按优先级依次执行提交的指令"""
+
+    def __init__(self, name):
+        self.name = name
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"{name}-io", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, priority=READBACK, not_before=None):
+        """
+        提交指令，返回 Future。
+        not_before: 单调时钟时间，指令不会早于该时间开始执行
+        """
+        if self._closed:
+            raise RuntimeError(f"{self.name} worker is closed")
+        future = Future()
+        self._queue.put((priority, next(self._counter), fn, args, not_before, future))
+        return future
+
+    def _run(self):
+        while True:
+            priority, _, fn, args, not_before, future = self._queue.get()
+            if fn is None:
+                break
+            if not_before is not None:
+                delay = not_before - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    def close(self, warn_after=5.0):
+        """
+        执行完已提交的指令后结束线程，一直等到线程真正退出才返回：
+        之后调用方会直接访问仪器，不能与线程中仍在进行的通信重叠。超过 warn_after 秒时打印提示
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put((READBACK + 1, next(self._counter), None, (), None, None))
+        self._thread.join(warn_after)
+        while self._thread.is_alive():
+            print(f"Waiting for the {self.name} I/O thread to finish its current command...")
+            self._thread.join(warn_after)
+
+
+class IOPipeline:
+    def __init__(self, power_control, acquisition, monitor=None, max_age=None):
+        """
+        参数:
+        - acquisition: 已启动的 IRAcquisitionThread
+        - max_age: 温度样本的最大允许年龄 (s)，默认为采集周期的 3 倍，更旧的样本视为读取失败
+        """
+        self.power_control = power_control
+        self.acquisition = acquisition
+        self.monitor = monitor
+        self.max_age = max_age if max_age is not None else 3 * acquisition.period
+        self.power_worker = DeviceWorker("power")
+        self._sample_time = None  # 最近一次取用的温度样本的采样时间（单调时钟）
+        self._voltage_future = None
+        self.latest_voltage = None
+
+    def get_temperature(self):
+        """返回缓冲区中的最新红外温度，不访问设备；样本读取失败或过旧时返回 None"""
+        sample = self.acquisition.buffer.latest()
+        if sample is None:
+            return None
+        _, self._sample_time, _, value = sample
+        if value != value or time.monotonic() - self._sample_time > self.max_age:  # NaN 表示读取失败
+            return None
+        return float(value)
+
+    def set_power(self, voltage, current):
+        """异步设置电源输出（最高优先级）"""
+        sample_time = self._sample_time
+
+        def actuate():
+            if sample_time is not None and self.monitor is not None:
+                self.monitor.record('sense_to_actuate', time.monotonic() - sample_time)
+            self.power_control.set_power(voltage, current, 0)
+
+        return self.power_worker.submit(actuate, priority=ACTUATE)
+
+    def request_voltage(self):
+        """异步读取电压，结果由 take_voltage 取出"""
+        if self._voltage_future is None:
+            self._voltage_future = self.power_worker.submit(self.power_control.get_voltage, priority=READBACK)
+
+    def take_voltage(self):
+        """返回本周期新到的电压读数，尚未到达时返回 "Not measured\""""
+        future = self._voltage_future
+        if future is None or not future.done():
+            return "Not measured"
+        self._voltage_future = None
+        try:
+            self.latest_voltage = future.result()
+        except Exception as e:
+            print(f"Voltage readback failed: {e}")
+            self.latest_voltage = None
+        return self.latest_voltage
+
+    def close(self):
+        """等待已提交的指令执行完毕并结束工作线程"""
+        with stage(self.monitor, 'io_drain'):
+            self.power_worker.close()
@@ -0,0 +1,119 @@
+'''
+红外温度采集：由唯一的采集线程独占串口，带时间戳的样本写入 NumPy 环形缓冲区，
+GUI、控制循环和温度记录器只读取缓冲区，不再直接访问设备。
+'''
+import threading
+import time
+import numpy as np
+from scheduler import FixedRateScheduler
+
+
+class SampleRingBuffer:
+    """
+    单写多读的环形缓冲区。
+    写线程先写入槽位再递增序号；读线程读取后检查序号，若槽位在读取过程中被覆盖则重读，因此不需要加锁。
+    读取失败的样本以 NaN 记录。
+    """
+
+    def __init__(self, capacity=7200):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity)  # 单调时钟 (s)
+        self.wall_times = np.zeros(capacity)  # time.time() (s)
+        self.values = np.full(capacity, np.nan)
+        self._count = 0  # 已写入的样本总数（即下一个样本的序号）
+
+    @property
+    def count(self):
+        return self._count
+
+    def append(self, timestamp, wall_time, value):
+        index = self._count % self.capacity
+        self.timestamps[index] = timestamp
+        self.wall_times[index] = wall_time
+        self.values[index] = np.nan if value is None else value
+        self._count += 1
+
+    def latest(self):
+        """返回最新样本 (序号, 单调时间, 墙上时间, 数值)，没有样本时返回 None"""
+        while True:
+            count = self._count
+            if count == 0:
+                return None
+            index = (count - 1) % self.capacity
+            sample = (count - 1, self.timestamps[index], self.wall_times[index], self.values[index])
+            if self._count - count < self.capacity - 1:
+                return sample
+
+    def window(self, n=None, seconds=None):
+        """
+        返回最近的样本 (单调时间, 墙上时间, 数值) 数组副本，按时间先后排列。
+        n: 最多返回的样本数；seconds: 只返回最近若干秒内的样本
+        """
+        while True:
+            count = self._count
+            size = min(count, self.capacity - 1)
+            if n is not None:
+                size = min(size, n)
+            indices = np.arange(count - size, count) % self.capacity
+            timestamps = self.timestamps[indices]
+            wall_times = self.wall_times[indices]
+            values = self.values[indices]
+            if self._count - count < self.capacity - size:
+                break
+        if seconds is not None and size:
+            keep = timestamps >= timestamps[-1] - seconds
+            timestamps, wall_times, values = timestamps[keep], wall_times[keep], values[keep]
+        return timestamps, wall_times, values
+
+
+class IRAcquisitionThread(threading.Thread):
+    def __init__(self, sensor, period=0.5, buffer=None):
+        """
+        参数:
+        - sensor: TemperatureSensor，之后只由本线程调用
+        - period: 采集周期 (s)。原来 GUI 定时器和控制循环各读一次（约 2 次/秒），默认保持相同的跳变滤波节奏
+        """
+        super().__init__(name="ir-acquisition", daemon=True)
+        self.sensor = sensor
+        self.period = period
+        self.buffer = buffer if buffer is not None else SampleRingBuffer()
+        self._stop_event = threading.Event()
+        self._new_sample = threading.Condition()
+
+    def run(self):
+        scheduler = FixedRateScheduler(period=self.period)
+        scheduler.start()
+        while not self._stop_event.is_set():
+            try:
+                value = self.sensor.get_temperature()
+            except Exception as e:
+                print(f"IR acquisition error: {e}")
+                value = None
+            self.buffer.append(time.monotonic(), time.time(), value)
+            with self._new_sample:
+                self._new_sample.notify_all()
+            scheduler.wait(self._stop_event.is_set)
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def wait_for_sample(self, after, timeout=None):
+        """等待序号大于 after 的新样本，返回是否等到"""
+        with self._new_sample:
+            return self._new_sample.wait_for(lambda: self.buffer.count - 1 > after, timeout)
+
+    def latest_temperature(self, max_age=None):
+        """
+        返回最新的红外温度；最新样本读取失败或比 max_age 秒更旧时返回 None。
+        """
+        sample = self.buffer.latest()
+        if sample is None:
+            return None
+        _, timestamp, _, value = sample
+        if np.isnan(value):
+            return None
+        if max_age is not None and time.monotonic() - timestamp > max_age:
+            return None
+        return float(value)
@@ -0,0 +1,100 @@
+'''
+控制周期延迟统计：分阶段计时、滚动 p50/p95/p99、超时周期计数，并逐条写入每次运行的 CSV。
+'''
+import csv
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import numpy as np
+
+
+class LatencyMonitor:
+    def __init__(self, filename_prefix="latency", period=1.0, window=600, log_dir=None):
+        """
+        参数:
+        - period: 控制周期 (s)，单个周期的处理时间超过该值记为超时
+        - window: 每个阶段保留的最近样本数，用于计算滚动分位数
+        """
+        if log_dir is None:
+            log_dir = os.path.join(os.path.dirname(__file__), 'temperature_log')
+        os.makedirs(log_dir, exist_ok=True)
+        current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.filename = os.path.join(log_dir, f"{filename_prefix}_{current_time}.csv")
+
+        self.period = period
+        self.window = window
+        self.samples = {}  # 阶段名 -> deque[秒]
+        self.counts = {}
+        self.tick = 0
+        self.overruns = 0
+        self._tick_start = None
+        self._lock = threading.Lock()
+
+        self._file = open(self.filename, mode='w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['Tick', 'Timestamp', 'Thread', 'Stage', 'Duration (ms)'])
+
+    @contextmanager
+    def stage(self, name):
+        """记录 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.window)
+                self.counts[name] = 0
+            self.samples[name].append(seconds)
+            self.counts[name] += 1
+            if self._file is not None:
+                self._writer.writerow([self.tick, f"{time.time():.3f}", threading.current_thread().name,
+                                       name, f"{seconds * 1000:.3f}"])
+
+    def start_tick(self):
+        self._tick_start = time.perf_counter()
+
+    def end_tick(self):
+        """结束一个控制周期，返回该周期的处理时间 (s)"""
+        if self._tick_start is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._tick_start
+        self._tick_start = None
+        if elapsed > self.period:
+            self.overruns += 1
+        self.record('tick', elapsed)
+        self.tick += 1
+        return elapsed
+
+    def percentiles(self, name):
+        """返回阶段最近样本的 (p50, p95, p99)，单位 s"""
+        with self._lock:
+            values = np.array(self.samples.get(name, ()))
+        if len(values) == 0:
+            return None
+        return tuple(np.percentile(values, [50, 95, 99]))
+
+    def summary(self):
+        lines = [f"Latency summary: {self.tick} ticks, {self.overruns} overruns (> {self.period:.2f} s)"]
+        for name in list(self.samples):
+            p50, p95, p99 = self.percentiles(name)
+            lines.append(f"  {name:<14} n={self.counts[name]:<6} p50={p50 * 1000:8.2f} ms  "
+                         f"p95={p95 * 1000:8.2f} ms  p99={p99 * 1000:8.2f} ms")
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def stage(monitor, name):
+    """monitor 为 None 时不计时"""
+    return monitor.stage(name) if monitor is not None else nullcontext()
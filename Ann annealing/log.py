@@ -6,32 +6,9 @@ def log_to_file(log_filename, data):
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         file.write(f"{timestamp} - {data}\n")
 
-# 添加一个全局变量来存储上一次记录的时间
-last_log_time = None
+# AI 计算记录写入二进制记录文件（AI_Model/ai_records.py），时间间隔由记录器按单调时钟计算
+AI_LOG_FILENAME = "ai_log.airec"
 
-def log_ai_computation(log_filename, current_value, output, voltage):
-    global last_log_time
-    current_time = datetime.datetime.now()
-    
-    # 计算时间间隔
-    if last_log_time is not None:
-        time_interval = (current_time - last_log_time).total_seconds()
-    else:
-        time_interval = 0  # 第一次记录时没有前一个时间
-    
-    # 更新上一次记录的时间
-    last_log_time = current_time
-
-    # 判断 voltage 的类型并格式化
-    if isinstance(voltage, str):
-        voltage_str = voltage  # 如果是字符串，直接使用
-    else:
-        voltage_str = f"{voltage:.3f}"  # 如果是数值，保留三位小数
-
-    log_data = (
-        f"Current Value: {current_value:.2f}, "
-        f"Output: {output:.3f}, "
-        f"Voltage: {voltage_str}, "
-        f"Time Interval: {time_interval:.2f} s"
-    )
-    log_to_file(log_filename, log_data)
+def log_ai_computation(ai_log, current_value, output, voltage):
+    """ai_log: AIRecordLog；voltage 为 "Not measured" 等字符串时记为 NaN"""
+    ai_log.append(current_value, output, voltage)
@@ -0,0 +1,137 @@
+'''
+滚动时域前瞻控制：
+每个控制周期在满足 max_change_rate 和 output_limits 的前提下枚举一组候选电流轨迹
+（第一步变化量 × 后续每步变化量），用网络批量计算的维持电流构成一阶温度代理模型预测未来温度，
+选择跟踪误差最小的轨迹并只施加第一步。
+'''
+import time
+import numpy as np
+from model_registry import registry
+
+
+class LookaheadController:
+    def __init__(self, ai, horizon=10, n_candidates=21, n_slopes=11, plant_gain=10.0, gain_limits=(1.0, 100.0),
+                 gain_smoothing=0.1, move_weight=0.1, dt=1.0):
+        """
+        参数:
+        - ai: AI_Controller 实例（提供 setpoint、加热速率、输出限制和批量预测）
+        - horizon: 前瞻步数（每步 dt 秒）
+        - n_candidates: 第一步电流变化量的候选个数（均匀分布在 ±max_change_rate 内）
+        - n_slopes: 之后每步电流变化量的候选个数（同样在 ±max_change_rate 内）
+        - plant_gain: 代理模型增益初值 (°C/s/A)，dT/dt = gain * (I - I_hold(T))
+        - gain_limits: 在线估计增益的上下限
+        - gain_smoothing: 在线估计增益的遗忘系数（指数加权最小二乘）
+        - move_weight: 电流变化量的惩罚权重
+        """
+        self.ai = ai
+        self.horizon = horizon
+        self.n_candidates = n_candidates
+        self.n_slopes = n_slopes
+        self.plant_gain = plant_gain
+        self.gain_limits = gain_limits
+        self.gain_smoothing = gain_smoothing
+        self.move_weight = move_weight
+        self.dt = dt
+
+        self._hold_temperatures = None
+        self._hold_currents = None
+        self._hold_key = None
+
+        # 增益的指数加权最小二乘估计：gain = Σ(ΔT·e) / Σ(e²·dt)，以初值作为先验
+        self._gain_num = plant_gain * 0.01
+        self._gain_den = 0.01
+
+        self._last_temperature = None
+        self._last_current = None
+        self._last_time = None
+        self.last_step_time = 0.0  # 最近一次 step 的计算耗时 (s)
+
+    def hold_current(self, temperatures):
+        """
+        维持各温度所需的电流：未来温度轨迹恒为当前温度时网络给出的电流。
+        在 table_range 上批量计算一次，之后插值。
+        """
+        key = (self.ai.backend, registry.version(self.ai.backend))
+        if self._hold_key != key:
+            t_min, t_max = self.ai.table_range
+            self._hold_temperatures = np.arange(int(t_min), int(t_max) + 1, dtype=float)
+            self._hold_currents = self.ai.predict_batch(self._hold_temperatures, setpoints=self._hold_temperatures)
+            self._hold_key = key
+        return np.interp(temperatures, self._hold_temperatures, self._hold_currents)
+
+    def policy(self, temperature):
+        """AI 控制器对当前温度给出的目标电流（启用查找表时直接查表）"""
+        if self.ai.use_lookup_table:
+            prediction = self.ai.lookup(temperature)
+            if prediction is not None:
+                return prediction
+        return self.ai.predict_batch([temperature])[0]
+
+    def update_gain(self, temperature, now):
+        """根据上一周期施加的电流和实际温升在线修正代理模型增益"""
+        if self._last_temperature is None:
+            return
+        dt = now - self._last_time
+        if dt <= 0:
+            return
+        error = self._last_current - self.hold_current(self._last_temperature)
+        forget = 1.0 - self.gain_smoothing
+        self._gain_num = forget * self._gain_num + (temperature - self._last_temperature) * error
+        self._gain_den = forget * self._gain_den + error * error * dt
+        if self._gain_den > 1e-6:
+            self.plant_gain = float(np.clip(self._gain_num / self._gain_den, *self.gain_limits))
+
+    def step(self, temperature, current):
+        """
+        计算本周期应施加的电流。
+
+        参数:
+        - temperature: 当前红外温度 (°C)
+        - current: 当前电流 (A)
+
+        返回:
+        - 下一步电流 (A)，已满足变化率和输出限制
+        """
+        start = time.perf_counter()
+        now = time.monotonic()
+        self.update_gain(temperature, now)
+
+        low, high = self.ai.output_limits
+        max_change_rate = self.ai.max_change_rate
+
+        # 参考轨迹：按设定加热速率直线趋近 setpoint，到达后保持
+        steps = np.arange(1, self.horizon + 1) * self.dt * self.ai.heating_rate
+        if temperature < self.ai.setpoint:
+            reference = np.minimum(temperature + steps, self.ai.setpoint)
+        else:
+            reference = np.maximum(temperature - steps, self.ai.setpoint)
+
+        # 候选第一步：±max_change_rate 内均匀分布，并包含按变化率截断后的 AI 原始预测
+        ai_move = np.clip(self.policy(temperature) - current, -max_change_rate, max_change_rate)
+        moves = np.unique(np.append(np.linspace(-max_change_rate, max_change_rate, self.n_candidates), ai_move))
+        slopes = np.linspace(-max_change_rate, max_change_rate, self.n_slopes)
+        first_moves, later_moves = np.meshgrid(moves, slopes, indexing='ij')
+        first_moves = first_moves.ravel()
+        later_moves = later_moves.ravel()
+
+        # 所有候选轨迹一起模拟
+        previous = np.full(len(first_moves), float(current))
+        temperatures = np.full(len(first_moves), float(temperature))
+        cost = np.zeros(len(first_moves))
+        for k in range(self.horizon):
+            currents = np.clip(previous + (first_moves if k == 0 else later_moves), low, high)
+            if k == 0:
+                first_currents = currents
+            temperatures = temperatures + self.dt * self.plant_gain * (currents - self.hold_current(temperatures))
+            cost += (temperatures - reference[k]) ** 2
+            cost += self.move_weight * ((currents - previous) / max_change_rate) ** 2
+            previous = currents
+
+        best = int(np.argmin(cost))
+        next_current = round(float(first_currents[best]), 3)
+
+        self._last_temperature = temperature
+        self._last_current = next_current
+        self._last_time = now
+        self.last_step_time = time.perf_counter() - start
+        return next_current
@@ -6,13 +6,20 @@ from PyQt5.QtCore import QTimer
 import control
 import temperature
 from AIPredict import AI_Controller
-from log import log_ai_computation
+from model_registry import registry
+from lookahead import LookaheadController
+from latency import LatencyMonitor, stage
+from scheduler import FixedRateScheduler
+from instrument_io import IOPipeline
+from ir_acquisition import IRAcquisitionThread
+from log import log_ai_computation, AI_LOG_FILENAME
+from AI_Model.ai_records import AIRecordLog
 from table import ControlPanel
 from temperature_logger import TemperatureLogger  # 导入温度记录器
 import numpy as np
 
 class PowerControlPanel(QWidget):
-    def __init__(self, auto_input=False, auto_voltage=25.0, auto_current=0.0, auto_temperature=0.0, auto_time=0.0, auto_heating_rate=1.0):
+    def __init__(self, auto_input=False, auto_voltage=25.0, auto_current=0.0, auto_temperature=0.0, auto_time=0.0, auto_heating_rate=1.0, ai_backend="keras", use_lookup_table=False, use_lookahead=False, control_period=1.0):
         super().__init__()
 
         # 自动测试模式标志
@@ -24,10 +31,15 @@ class PowerControlPanel(QWidget):
         # 创建电源控制和温度传感器实例
         self.power_control = control.PowerControl()
         self.temperature_sensor = temperature.TemperatureSensor()
+        # 红外传感器只由采集线程访问，其余线程读取环形缓冲区
+        self.ir_acquisition = IRAcquisitionThread(self.temperature_sensor)
+        self.ir_acquisition.start()
 
-        # 初始化温度记录器和记录线程
+        # AI 计算记录（二进制，只追加）
+        self.ai_log = AIRecordLog(AI_LOG_FILENAME)
+
+        # 初始化温度记录器（样本由控制循环写入）
         self.temperature_logger = None
-        self.temperature_thread = None  # 记录温度的线程
 
         # 初始化参数
         self.voltage = auto_voltage  # 默认电压为 25V
@@ -57,6 +69,14 @@ class PowerControlPanel(QWidget):
 
         # 创建 AI 控制器实例
         self.ai = None
+        self.ai_backend = ai_backend  # AI 推理后端："keras"、"numpy" 或 "numpy-float32"
+        self.use_lookup_table = use_lookup_table  # 是否使用预先计算的控制查找表（第一个控制周期在控制线程中构建）
+        self.use_lookahead = use_lookahead  # 是否使用滚动时域前瞻控制
+        self.lookahead = None
+        self.latency = None  # 每次 AI 运行的控制周期延迟统计
+        self.scheduler = None  # AI 控制循环的固定频率调度器
+        self.control_period = control_period  # AI 控制周期 (s)
+        self.io = None  # AI 控制循环的仪器 I/O 流水线
 
         # 记录温度数据的变量
         self.last_valid_temperature = None      # 上一次有效温度（经过校正后的实际温度）
@@ -84,6 +104,9 @@ class PowerControlPanel(QWidget):
         if self.recovery_mode:
             print("运行恢复模式：将通过控制循环执行关闭操作")
             QTimer.singleShot(1000, self.start_recovery_control)  # 延迟1秒后启动恢复控制
+        else:
+            # 在 GUI 启动的同时后台加载并预热 AI 模型，避免第一个控制周期变慢
+            registry.warm_up(self.ai_backend)
 
     def auto_set_parameters(self):
         """自动设置参数, 我跑AI的时候用的"""
@@ -96,30 +119,38 @@ class PowerControlPanel(QWidget):
         self.start_control()
 
     def start_temperature_logging(self):
-        """启动温度记录线程，同时记录电流和电压"""
-        if self.temperature_logger is None or self.temperature_thread is None:
+        """创建温度记录器，控制循环每个周期通过 record_sample 写入温度、电流和电压"""
+        if self.temperature_logger is None:
             header_info = (f"# Setpoint: {self.target_temperature}, Heating Rate: {self.heating_rate}, "
                            f"Called from main_aototest: {'--auto-input' in sys.argv}")
             self.temperature_logger = TemperatureLogger("temperature_log", header_info)
-            self.temperature_thread = threading.Thread(
-                target=self.temperature_logger.start_logging,
-                args=(self.get_current_temperature, self.get_current_current, self.get_current_voltage, 1)
-            )
-            self.temperature_thread.start()
+            self.temperature_logger.start()
 
     def stop_temperature_logging(self):
-        """停止温度记录线程"""
-        if self.temperature_logger is not None:
-            self.temperature_logger.stop()  # 请求停止记录器
-            if self.temperature_thread is not None:
-                self.temperature_thread.join()
-                print("Temperature logging has stopped.")
-            self.temperature_logger = None
-            self.temperature_thread = None
+        """写入剩余记录并关闭温度记录文件"""
+        temperature_logger, self.temperature_logger = self.temperature_logger, None
+        if temperature_logger is not None:
+            temperature_logger.stop()
+            print("Temperature logging has stopped.")
+
+    def record_sample(self, temperature=None, mode="ai"):
+        """
+        把本周期的温度、电流和电压交给温度记录器；temperature 为 None 时取缓冲区中的最新温度。
+        mode: 写入 CSV 的控制方式（"ai" / "manual"）
+        """
+        temperature_logger = self.temperature_logger
+        if temperature_logger is None:
+            return
+        if temperature is None:
+            temperature = self.get_current_temperature()
+        temperature_logger.record(temperature, self.current_current, self.current_voltage, mode=mode)
 
     def get_current_temperature(self):
-        """返回当前记录的温度值"""
-        return self.current_temperature
+        """返回缓冲区中最新的实际温度，没有有效样本时返回上一次记录的温度值"""
+        infrared_temperature = self.ir_acquisition.latest_temperature(max_age=3 * self.ir_acquisition.period)
+        if infrared_temperature is None:
+            return self.current_temperature
+        return infrared_temperature * 0.88 + 9.87
 
     def get_current_current(self):
         return self.current_current
@@ -136,7 +167,8 @@ class PowerControlPanel(QWidget):
         # 停止温度记录
         self.stop_temperature_logging()
 
-        # 关闭温度传感器
+        # 停止采集线程后关闭温度传感器
+        self.ir_acquisition.stop()
         self.temperature_sensor.close()
         event.accept()
 
@@ -154,8 +186,8 @@ class PowerControlPanel(QWidget):
         self.timer.start(1000)
 
     def update_temperature(self):
-        """更新当前温度显示，并更新实例属性self.current_temperature"""
-        infrared_temperature = self.temperature_sensor.get_temperature()
+        """更新当前温度显示，并更新实例属性self.current_temperature（只读取缓冲区，不访问传感器）"""
+        infrared_temperature = self.ir_acquisition.latest_temperature(max_age=3 * self.ir_acquisition.period)
         if infrared_temperature is not None:
             actual_temperature = infrared_temperature * 0.88 + 9.87
             # 更新保存的温度数据
@@ -244,9 +276,8 @@ class PowerControlPanel(QWidget):
         # 计算红外目标温度设定值
         infrared_temperature_setpoint = (self.target_temperature - 9.87) / 0.88
 
-        # 在 ai_log.txt 中记录 setpoint 和调用信息
-        with open("ai_log.txt", "a") as log_file:
-            log_file.write(f"# Setpoint: {infrared_temperature_setpoint}, Heating Rate: {self.heating_rate}, Called from main_aototest: {'--auto-input' in sys.argv}\n")
+        # 在 AI 记录中标记新的一次运行（setpoint 和加热速率）
+        self.ai_log.start_run(infrared_temperature_setpoint, self.heating_rate)
 
         # 显示计算出的红外目标温度
         self.control_panel.set_infrared_target_temperature_display(infrared_temperature_setpoint)
@@ -263,10 +294,14 @@ class PowerControlPanel(QWidget):
             self.ai = AI_Controller(
                 setpoint=infrared_temperature_setpoint,
                 output_limits=(min_current, max_current),
-                log_function=lambda *args: log_ai_computation("ai_log.txt", *args),
-                max_change_rate=self.max_change_rate,
-                heating_rate=self.heating_rate
+                log_function=lambda *args: log_ai_computation(self.ai_log, *args),
+                max_change_rate=self.max_change_rate * self.control_period,  # 每个控制周期的最大变化量
+                heating_rate=self.heating_rate,
+                backend=self.ai_backend,
+                use_lookup_table=self.use_lookup_table
             )
+            self.lookahead = LookaheadController(self.ai, dt=self.control_period) if self.use_lookahead else None
+            self.start_latency_monitor()
             self.control_thread = threading.Thread(target=self.control_loop)
 
         # 重置停止请求标志
@@ -288,6 +323,8 @@ class PowerControlPanel(QWidget):
 
     def stop_control(self):
         """停止电源控制。如果 preserve_current 为 True，则保留当前电流，不进行逐步降低。"""
+        # 先等待流水线中已提交的指令执行完毕，之后直接访问电源
+        self.close_io_pipeline()
         # 逐步降低电流
         while self.current_current > 0:
             self.current_current -= self.max_change_rate * 2  # 每次减少的电流量
@@ -297,8 +334,7 @@ class PowerControlPanel(QWidget):
         # 停止电源输出
         self.power_control.stop_output()
 
-        with open("ai_log.txt", "a") as log_file:
-            log_file.write("\n")  # 写入一个空行
+        self.ai_log.segment_break()  # 数据间断
         print("Power control has been stopped.")
 
     def request_adjust_current(self, target_current):
@@ -321,7 +357,7 @@ class PowerControlPanel(QWidget):
         不依赖温度读取结果，直接根据用户设定目标调节当前电流。
         """
         diff = self.adjust_target_current - self.current_current
-        step_size = self.max_change_rate  # 每步调节的电流量
+        step_size = self.max_change_rate * self.control_period  # 每个控制周期调节的电流量
 
         # 如果当前电流与目标电流差距较大，则按步长调整
         if abs(diff) > step_size:
@@ -330,17 +366,58 @@ class PowerControlPanel(QWidget):
                 self.current_current += step_size
             else:
                 self.current_current -= step_size
-            self.power_control.set_power(self.voltage, self.current_current, 0)
+            self.set_power_output(self.current_current)
         else:
             # 差距较小时直接设置为目标电流
             self.current_current = self.adjust_target_current
-            self.power_control.set_power(self.voltage, self.current_current, 0)
+            self.set_power_output(self.current_current)
             if not self.has_printed_reached_current:
                 print("Successfully adjusted current to target value.")
                 self.has_printed_reached_current = True
 
+    def set_power_output(self, current):
+        """设置电流：I/O 流水线运行时异步提交，否则直接写入电源"""
+        if self.io is not None:
+            self.io.set_power(self.voltage, current)
+        else:
+            self.power_control.set_power(self.voltage, current, 0)
+
+    def close_io_pipeline(self):
+        if self.io is not None:
+            self.io.close()
+            self.io = None
+
+    def start_latency_monitor(self):
+        """为本次运行创建延迟统计，并挂到电源和温度传感器上"""
+        self.latency = LatencyMonitor("latency", period=self.control_period)
+        self.power_control.monitor = self.latency
+        self.temperature_sensor.monitor = self.latency
+
+    def stop_latency_monitor(self):
+        """输出延迟统计摘要并关闭 CSV"""
+        if self.latency is None:
+            return
+        self.power_control.monitor = None
+        self.temperature_sensor.monitor = None
+        print(self.latency.summary())
+        print("Latency log saved to:", self.latency.filename)
+        self.latency.close()
+        self.latency = None
+
     def control_loop(self):
         """主控制循环（在后台线程中运行，不阻塞 UI）"""
+        # 默认 1 Hz 控制周期，电压每 10 s 读取一次
+        self.scheduler = FixedRateScheduler(period=self.control_period)
+        self.scheduler.add_rate('voltage', 10.0)
+        try:
+            self.run_control_loop()
+        finally:
+            self.close_io_pipeline()
+            print(self.scheduler.summary())
+            print(self.power_control.session.summary())
+            self.stop_latency_monitor()
+
+    def run_control_loop(self):
         # 初始化当前电流
         self.current_current = self.power_control.get_current()
         self.power_control.stop_requested = False
@@ -363,29 +440,37 @@ class PowerControlPanel(QWidget):
 
         failed_reads = 0
         max_failed_reads = 10
-        loop_counter = 0  # 循环计数器
+        step_limit = self.ai.max_change_rate  # 每个控制周期的最大电流变化量
+        scheduler = self.scheduler
+        scheduler.start()
+
+        # 温度由采集线程持续读取，电流输出和电压回读在电源线程中执行
+        self.io = IOPipeline(self.power_control, self.ir_acquisition, self.latency)
 
         ### 引入最大运行时长 ###
         start_time = time.time()
         max_duration = float('inf')  # 你可以改成别的值，或做成可调
 
         while not self.stop_requested:
-            # 每隔10次循环获取一次电压
-            if loop_counter % 10 == 0:
-                self.current_voltage = self.power_control.get_voltage()
-            else:
-                self.current_voltage = "Not measured"
+            if self.latency is not None:
+                self.latency.start_tick()
 
-            # 获取温度数据（用于更新显示及后续处理）
-            infrared_temperature = self.temperature_sensor.get_temperature()
+            # 每隔10秒异步读取一次电压，读数到达的周期记录电压
+            if scheduler.due('voltage'):
+                self.io.request_voltage()
+            self.current_voltage = self.io.take_voltage()
+
+            # 获取温度数据（采集线程写入的最新样本）
+            infrared_temperature = self.io.get_temperature()
             if infrared_temperature is not None:
                 failed_reads = 0
                 actual_temperature = infrared_temperature * 0.88 + 9.87
                 self.current_temperature = actual_temperature
-                self.control_panel.update_temperature_display(
-                    actual_temperature, infrared_temperature,
-                    self.current_current, self.current_voltage
-                )
+                with stage(self.latency, 'gui_update'):
+                    self.control_panel.update_temperature_display(
+                        actual_temperature, infrared_temperature,
+                        self.current_current, self.current_voltage
+                    )
                 # 更新温度上升速率记录
                 current_time = time.time()
                 if self.last_valid_temperature is not None and self.last_valid_timestamp is not None:
@@ -423,6 +508,13 @@ class PowerControlPanel(QWidget):
                                     QApplication.quit()
                                 return
                         self.handle_manual_adjustment()
+                        self.record_sample(mode="manual")
+                    # 手动模式的每次迭代都是一个控制周期
+                    if self.latency is not None:
+                        self.latency.end_tick()
+                    scheduler.wait(lambda: self.stop_requested)
+                    if self.latency is not None:
+                        self.latency.start_tick()
             else:
                 # AI 控制模式
                 # 检查是否达到启动加热计时的条件
@@ -441,17 +533,22 @@ class PowerControlPanel(QWidget):
                             QApplication.quit()
                         return
                 if infrared_temperature is not None:
-                    # 获取 AI 原始预测值
-                    prediction = self.ai.ai_predict(current_value=infrared_temperature)
+                    with stage(self.latency, 'ai_predict'):
+                        if self.lookahead is not None:
+                            # 前瞻控制：候选轨迹已满足变化率和输出限制
+                            prediction = self.lookahead.step(infrared_temperature, self.current_current)
+                        else:
+                            # 获取 AI 原始预测值
+                            prediction = self.ai.ai_predict(current_value=infrared_temperature)
 
                     # 速率控制：判断 AI 预测值相对于当前值的变化是否超过最大变化率
                     delta_output = prediction - self.current_current
-                    if abs(delta_output) > self.max_change_rate:
-                        print(f"Warning: AI prediction change rate exceeded! Adjusting from {prediction} to within ±{self.max_change_rate} of {self.current_current}.")
+                    if abs(delta_output) > step_limit:
+                        print(f"Warning: AI prediction change rate exceeded! Adjusting from {prediction} to within ±{step_limit} of {self.current_current}.")
                         if delta_output > 0:
-                            prediction = self.current_current + self.max_change_rate
+                            prediction = self.current_current + step_limit
                         else:
-                            prediction = self.current_current - self.max_change_rate
+                            prediction = self.current_current - step_limit
 
                     # 限制预测输出范围
                     if prediction < self.ai.output_limits[0] or prediction > self.ai.output_limits[1]:
@@ -459,8 +556,10 @@ class PowerControlPanel(QWidget):
                         prediction = max(self.ai.output_limits[0], min(prediction, self.ai.output_limits[1]))
 
                     self.current_current = prediction
-                    self.power_control.set_power(self.voltage, self.current_current, 0)
-                    log_ai_computation("ai_log.txt", infrared_temperature, self.current_current, self.current_voltage)
+                    self.set_power_output(self.current_current)
+                    with stage(self.latency, 'log'):
+                        log_ai_computation(self.ai_log, infrared_temperature, self.current_current, self.current_voltage)
+                        self.record_sample(actual_temperature)
                 else:
                     # 当温度读取失败时，利用之前记录的温度上升速率和时间间隔进行虚拟AI控制
                     if self.last_valid_temperature is not None and self.last_valid_timestamp is not None:
@@ -469,18 +568,19 @@ class PowerControlPanel(QWidget):
                         # 利用温度上升速率预测当前温度
                         predicted_temperature = self.last_valid_temperature + self.last_temperature_rate * delta_t
                         # 使用预测温度作为输入，调用 AI 得到虚拟预测值
-                        virtual_predicted = self.ai.ai_predict(current_value=predicted_temperature)
+                        with stage(self.latency, 'ai_predict'):
+                            virtual_predicted = self.ai.ai_predict(current_value=predicted_temperature)
                         # 速率控制
                         diff = virtual_predicted - self.current_current
-                        if abs(diff) > self.max_change_rate:
-                            print(f"Warning: AI prediction change rate exceeded! Adjusting from {virtual_predicted} to within ±{self.max_change_rate} of {self.current_current}.")
-                            virtual_predicted += self.max_change_rate if diff > 0 else -self.max_change_rate
+                        if abs(diff) > step_limit:
+                            print(f"Warning: AI prediction change rate exceeded! Adjusting from {virtual_predicted} to within ±{step_limit} of {self.current_current}.")
+                            virtual_predicted += step_limit if diff > 0 else -step_limit
                         # 限制虚拟预测输出范围
                         if virtual_predicted < self.ai.output_limits[0] or virtual_predicted > self.ai.output_limits[1]:
                             print(f"Warning: Virtual prediction {virtual_predicted} is out of limits {self.ai.output_limits}, adjusting to acceptable range.")
                             virtual_predicted = max(self.ai.output_limits[0], min(virtual_predicted, self.ai.output_limits[1]))
                         self.current_current = virtual_predicted
-                        self.power_control.set_power(self.voltage, self.current_current, 0)
+                        self.set_power_output(self.current_current)
                         #print(f"Temperature reading failed! Utilizing virtual AI control for adjustment. Predicted temperature: {predicted_temperature:.2f}°C, virtual prediction: {virtual_predicted:.2f} A, current: {self.current_current:.2f} A")
                     else:
                         print("Temperature reading failed and no valid historical temperature data is available; unable to perform virtual AI control.")
@@ -491,8 +591,9 @@ class PowerControlPanel(QWidget):
                         self.control_panel.show_temperature_failure_warning()
                         failed_reads = 0
 
-            time.sleep(1)
-            loop_counter += 1
+            if self.latency is not None:
+                self.latency.end_tick()
+            scheduler.wait(lambda: self.stop_requested)
 
             # 检查是否超出最大运行时长
             if time.time() - start_time > max_duration:
@@ -502,12 +603,12 @@ class PowerControlPanel(QWidget):
                 break
 
         print("Exiting loop and shutting down program.")
+        print(f"AI prediction cache: {self.ai.cache_info()}")
         # 如果不是切换模式，则执行完全停止操作
         if not self.switching_mode and not self.exit_immediately:
             self.stop_control()  # 这会逐步降低电流并停止输出
         else:
-            with open("ai_log.txt", "a") as log_file:
-                log_file.write("\n")  # 写入一个空行
+            self.ai_log.segment_break()  # 数据间断
             print("Power control has been stopped.")
             print("Exiting loop: preserving current output.")
         self.stop_temperature_logging()
@@ -522,8 +623,10 @@ class PowerControlPanel(QWidget):
         self.power_control.set_power(self.voltage, self.current_current, 0)
         self.power_control.start_output()
 
+        scheduler = FixedRateScheduler(period=1.0)
+        scheduler.start()
         while not self.stop_requested:
-            infrared_temperature = self.temperature_sensor.get_temperature()
+            infrared_temperature = self.ir_acquisition.latest_temperature(max_age=3 * self.ir_acquisition.period)
             if infrared_temperature is not None:
                 actual_temperature = infrared_temperature * 0.88 + 9.87
                 self.control_panel.update_temperature_display(actual_temperature, infrared_temperature, self.current_current, None)
@@ -532,9 +635,11 @@ class PowerControlPanel(QWidget):
                 self.current_current += 0.05
                 self.current_current = min(self.current_current, self.target_current)
                 self.power_control.set_power(self.voltage, self.current_current, 0)
+            self.record_sample()
 
-            time.sleep(1)
+            scheduler.wait(lambda: self.stop_requested)
 
+        print(scheduler.summary())
         self.stop_control()
 
     def manual_control_loop(self):
@@ -543,6 +648,8 @@ class PowerControlPanel(QWidget):
             self.heating_time = float(self.control_panel.time_input.text())
         except:
             self.heating_time = None
+        scheduler = FixedRateScheduler(period=1.0)
+        scheduler.start()
         while not self.stop_requested:
             if self.adjust_requested:
                 # 开启计时
@@ -561,15 +668,15 @@ class PowerControlPanel(QWidget):
                             QApplication.quit()
                         return
                 self.handle_manual_adjustment()
-            time.sleep(1)
+            scheduler.wait(lambda: self.stop_requested)
         
+        print(scheduler.summary())
         print("Exiting loop and shutting down program.")
         # 如果不是切换模式，则执行完全停止操作
         if not self.switching_mode and not self.exit_immediately:
             self.stop_control()  # 这会逐步降低电流并停止输出
         else:
-            with open("ai_log.txt", "a") as log_file:
-                log_file.write("\n")  # 写入一个空行
+            self.ai_log.segment_break()  # 数据间断
             print("Power control has been stopped.")
             print("Exiting loop: preserving current output.")
         self.stop_temperature_logging()
@@ -632,6 +739,10 @@ if __name__ == '__main__':
     auto_temperature = float(sys.argv[sys.argv.index('--temperature') + 1]) if '--temperature' in sys.argv else 0.0
     auto_time = float(sys.argv[sys.argv.index('--time') + 1]) if '--time' in sys.argv else 0.0
     auto_heating_rate = float(sys.argv[sys.argv.index('--heating-rate') + 1]) if '--heating-rate' in sys.argv else 1.0
+    ai_backend = sys.argv[sys.argv.index('--backend') + 1] if '--backend' in sys.argv else "keras"
+    use_lookup_table = '--lookup-table' in sys.argv
+    use_lookahead = '--lookahead' in sys.argv
+    control_period = float(sys.argv[sys.argv.index('--control-period') + 1]) if '--control-period' in sys.argv else 1.0
 
     window = PowerControlPanel(
         auto_input=auto_input,
@@ -639,7 +750,11 @@ if __name__ == '__main__':
         auto_current=auto_current,
         auto_temperature=auto_temperature,
         auto_time=auto_time,
-        auto_heating_rate=auto_heating_rate
+        auto_heating_rate=auto_heating_rate,
+        ai_backend=ai_backend,
+        use_lookup_table=use_lookup_table,
+        use_lookahead=use_lookahead,
+        control_period=control_period
     )
     window.show()
     
@@ -0,0 +1,115 @@
+'''
+Modbus RTU 主站（读保持寄存器）：
+按帧长度读取完整响应（首字节超时 + 字符间超时），校验 CRC、从站地址和功能码，
+同一条 RS-485 总线上的多个从站共用一个客户端，事务之间加锁互斥。
+'''
+import struct
+import threading
+
+READ_HOLDING_REGISTERS = 0x03
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data):
+    """Modbus CRC-16（多项式 0xA001，初值 0xFFFF），帧中按低字节在前发送"""
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def build_frame(payload):
+    """在 payload 后追加 CRC"""
+    return bytes(payload) + struct.pack('<H', crc16(payload))
+
+
+class ModbusError(IOError):
+    """超时、帧不完整、CRC 错误或从站返回异常码"""
+
+
+class ModbusRTUClient:
+    def __init__(self, ser, slave_id=1, timeout=0.5, inter_char_timeout=None):
+        """
+        参数:
+        - ser: 已打开的 serial.Serial
+        - slave_id: 默认从站地址
+        - timeout: 发送请求后等待第一个响应字节的时间 (s)
+        - inter_char_timeout: 字符间超时 (s)。USB 转串口适配器会把字节成批转发，
+                              严格的 3.5 字符时间容易误判，默认取 20 ms
+        """
+        self.ser = ser
+        self.slave_id = slave_id
+        self.timeout = timeout
+        self.inter_char_timeout = 0.02 if inter_char_timeout is None else inter_char_timeout
+        self.char_time = 11.0 / ser.baudrate  # 1 起始位 + 8 数据位 + 校验/停止位
+        self.lock = threading.Lock()  # 同一总线上一次只能进行一个事务
+        self.transactions = 0
+        self.errors = 0
+
+    def _read_exact(self, size, first=False):
+        """
+        读取 size 个字节，收齐后立即返回。
+        first 为 True 时等待从站开始应答，否则按帧传输时间加字符间超时限定。
+        """
+        if first:
+            self.ser.timeout = self.timeout + size * self.char_time
+        else:
+            self.ser.timeout = size * self.char_time + self.inter_char_timeout
+        self.ser.inter_byte_timeout = self.inter_char_timeout
+        data = self.ser.read(size)
+        if len(data) != size:
+            raise ModbusError(f"Timeout: expected {size} bytes, received {len(data)}")
+        return data
+
+    def read_holding_registers(self, address, count=1, slave_id=None):
+        """
+        读取连续的保持寄存器。
+
+        返回:
+        - 寄存器值列表（无符号 16 位）
+        """
+        slave_id = self.slave_id if slave_id is None else slave_id
+        request = build_frame(struct.pack('>BBHH', slave_id, READ_HOLDING_REGISTERS, address, count))
+        with self.lock:
+            self.transactions += 1
+            try:
+                self.ser.reset_input_buffer()  # 丢弃上一次事务残留的字节
+                self.ser.write(request)
+                header = self._read_exact(2, first=True)
+                if header[1] == READ_HOLDING_REGISTERS | 0x80:
+                    frame = header + self._read_exact(3)
+                    self._check_crc(frame)
+                    raise ModbusError(f"Slave {slave_id} exception code {frame[2]}")
+                length = self._read_exact(1)
+                frame = header + length + self._read_exact(length[0] + 2)
+            except ModbusError:
+                self.errors += 1
+                raise
+
+        try:
+            self._check_crc(frame)
+            if frame[0] != slave_id or frame[1] != READ_HOLDING_REGISTERS:
+                raise ModbusError(f"Unexpected response header: {frame[:2].hex(' ')}")
+            if frame[2] != 2 * count:
+                raise ModbusError(f"Unexpected byte count {frame[2]} for {count} registers")
+        except ModbusError:
+            self.errors += 1
+            raise
+        return list(struct.unpack(f'>{count}H', frame[3:3 + 2 * count]))
+
+    @staticmethod
+    def _check_crc(frame):
+        if crc16(frame[:-2]) != struct.unpack('<H', frame[-2:])[0]:
+            raise ModbusError(f"CRC mismatch in response: {frame.hex(' ')}")
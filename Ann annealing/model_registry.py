@@ -0,0 +1,156 @@
+'''
+模型注册表：在第一次使用 AI 时才加载模型和归一化器，路径相对于本程序目录解析，
+并可在后台线程中预热（加载 + 一次推理），同时记录加载和首次推理耗时。
+'''
+import os
+import threading
+import time
+from AI_Model.trajectory import build_future_temperature
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODEL_FILE = 'model.h5'
+SCALER_VALUES_FILE = 'scaler_values.joblib'
+SCALER_OUTPUTS_FILE = 'scaler_outputs.joblib'
+WEIGHTS_FILE = 'model_weights.npz'
+
+# 各后端依赖的文件，任一文件变化都会触发重新加载
+ARTIFACT_FILES = {
+    "keras": (MODEL_FILE, SCALER_VALUES_FILE, SCALER_OUTPUTS_FILE),
+    "numpy": (WEIGHTS_FILE,),
+}
+
+# 可用后端："numpy-<精度>" 使用降低精度的 NumPy 推理
+BACKENDS = ("keras", "numpy", "numpy-float32")
+
+
+def split_backend(backend):
+    """把后端名拆分为 (基础后端, 精度)，例如 "numpy-float32" -> ("numpy", "float32")"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown AI backend: {backend}")
+    name, _, precision = backend.partition("-")
+    return name, precision or "float64"
+
+
+class KerasBackend:
+    """Keras 模型 + MinMax 归一化器，输入为未归一化的未来温度矩阵"""
+
+    def __init__(self, model_path, scaler_values_path, scaler_outputs_path):
+        from tensorflow.keras.models import load_model
+        from joblib import load
+        self.scaler_values = load(scaler_values_path)
+        self.scaler_outputs = load(scaler_outputs_path)
+        self.model = load_model(model_path)
+
+    def predict(self, future_temperature):
+        future_values_scaled = self.scaler_values.transform(future_temperature)
+        # 整批一次前向计算，避免 Keras 按默认 batch_size=32 拆分
+        prediction_scaled = self.model.predict(future_values_scaled, batch_size=len(future_values_scaled), verbose=0)
+        return self.scaler_outputs.inverse_transform(prediction_scaled)
+
+
+class ModelRegistry:
+    def __init__(self, base_dir=BASE_DIR, check_interval=5.0):
+        self.base_dir = base_dir
+        self.check_interval = check_interval  # 检查模型文件是否更新的最小间隔 (s)
+        self._lock = threading.Lock()
+        self._backends = {}
+        self._signatures = {}
+        self._last_check = {}
+        self._warmup_threads = {}
+        self.versions = {}  # 后端名 -> 版本号，每次（重新）加载加 1
+        self.timings = {}  # 后端名 -> {'load': 秒, 'first_inference': 秒}
+
+    def path(self, filename):
+        return os.path.join(self.base_dir, filename)
+
+    def _signature(self, backend):
+        signature = []
+        for filename in ARTIFACT_FILES[split_backend(backend)[0]]:
+            try:
+                stat = os.stat(self.path(filename))
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _load(self, backend):
+        name, precision = split_backend(backend)
+        if name == "keras":
+            return KerasBackend(self.path(MODEL_FILE), self.path(SCALER_VALUES_FILE), self.path(SCALER_OUTPUTS_FILE))
+        from AI_Model.numpy_model import NumpyModel
+        return NumpyModel.load(self.path(WEIGHTS_FILE), precision)
+
+    def get(self, backend):
+        """返回已加载的后端，第一次调用或模型文件更新后加载（线程安全）"""
+        with self._lock:
+            now = time.monotonic()
+            if backend in self._backends and now - self._last_check.get(backend, 0.0) >= self.check_interval:
+                self._last_check[backend] = now
+                if self._signature(backend) != self._signatures[backend]:
+                    print(f"AI model files changed, reloading {backend} backend.")
+                    del self._backends[backend]
+            if backend not in self._backends:
+                start = time.perf_counter()
+                signature = self._signature(backend)
+                self._backends[backend] = self._load(backend)
+                self._signatures[backend] = signature
+                self._last_check[backend] = now
+                self.versions[backend] = self.versions.get(backend, 0) + 1
+                self.timings.setdefault(backend, {})['load'] = time.perf_counter() - start
+            return self._backends[backend]
+
+    def version(self, backend):
+        """当前加载的模型版本号（未加载时为 0）"""
+        return self.versions.get(backend, 0)
+
+    def is_loaded(self, backend):
+        return backend in self._backends
+
+    def predict(self, backend, future_temperature):
+        """使用指定后端预测电流，首次推理耗时记录到 timings"""
+        model = self.get(backend)
+        timing = self.timings.setdefault(backend, {})
+        if 'first_inference' in timing:
+            return model.predict(future_temperature)
+        start = time.perf_counter()
+        prediction = model.predict(future_temperature)
+        timing.setdefault('first_inference', time.perf_counter() - start)
+        return prediction
+
+    def warm_up(self, backend, setpoint=300.0, heating_rate=1.0):
+        """在后台线程中加载模型并执行一次推理，不阻塞 GUI"""
+        thread = self._warmup_threads.get(backend)
+        if thread is not None:
+            return thread
+
+        def run():
+            try:
+                self.predict(backend, build_future_temperature(setpoint, setpoint, heating_rate))
+                print(self.report(backend))
+            except Exception as e:
+                print(f"AI model warm-up failed ({backend}): {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        self._warmup_threads[backend] = thread
+        thread.start()
+        return thread
+
+    def wait_until_ready(self, backend, timeout=None):
+        """等待预热线程结束，返回模型是否已加载"""
+        thread = self._warmup_threads.get(backend)
+        if thread is not None:
+            thread.join(timeout)
+        return self.is_loaded(backend)
+
+    def report(self, backend):
+        timing = self.timings.get(backend, {})
+        load_time = timing.get('load')
+        first_inference = timing.get('first_inference')
+        load_str = f"{load_time * 1000:.1f} ms" if load_time is not None else "not loaded"
+        inference_str = f"{first_inference * 1000:.1f} ms" if first_inference is not None else "not run"
+        return f"AI model ({backend}): load {load_str}, first inference {inference_str}"
+
+
+# 全局注册表，AI_Controller 与 main_ai 共用
+registry = ModelRegistry()
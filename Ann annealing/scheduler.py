@@ -0,0 +1,105 @@
+'''
+基于单调时钟截止时间的固定频率调度器：
+周期不受每次循环处理时间影响，不会累积漂移；支持多个子频率（如 0.1 Hz 电压读取）、
+超时时跳过或追赶两种策略，并统计唤醒抖动。
+'''
+import time
+from collections import deque
+import numpy as np
+
+
+class FixedRateScheduler:
+    def __init__(self, period=1.0, policy="skip", window=600, sleep_slice=0.1):
+        """
+        参数:
+        - period: 主周期 (s)
+        - policy: 超时策略，"skip" 跳过错过的周期并对齐到下一个截止时间，
+                  "catch_up" 立即连续执行以补回错过的周期
+        - window: 抖动统计保留的最近样本数
+        - sleep_slice: 等待时的最大单次睡眠 (s)，便于及时响应停止请求
+        """
+        if policy not in ("skip", "catch_up"):
+            raise ValueError(f"Unknown overrun policy: {policy}")
+        self.period = period
+        self.policy = policy
+        self.sleep_slice = sleep_slice
+        self.rates = {}  # 子频率名 -> [周期, 下一次截止时间]
+        self.lateness = deque(maxlen=window)  # 实际唤醒时间 - 截止时间 (s)
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self._deadline = None
+
+    def start(self):
+        """以当前时间为起点，第一个截止时间为一个周期之后"""
+        now = time.monotonic()
+        self._deadline = now + self.period
+        for rate in self.rates.values():
+            rate[1] = now
+
+    @property
+    def deadline(self):
+        """下一个截止时间（单调时钟），尚未开始时为 None"""
+        return self._deadline
+
+    def add_rate(self, name, period):
+        """添加子频率，添加后第一次 due(name) 立即返回 True"""
+        self.rates[name] = [period, time.monotonic()]
+
+    def due(self, name):
+        """子频率是否到期，到期时推进其截止时间"""
+        period, deadline = self.rates[name]
+        now = time.monotonic()
+        if now < deadline:
+            return False
+        missed = int((now - deadline) // period)
+        self.rates[name][1] = deadline + (missed + 1) * period
+        return True
+
+    def wait(self, should_stop=None):
+        """
+        等待到下一个截止时间。
+        should_stop: 可选的回调，返回 True 时提前结束等待并返回 False。
+        """
+        if self._deadline is None:
+            self.start()
+
+        now = time.monotonic()
+        if now > self._deadline:
+            # 上一周期的处理时间超过了截止时间
+            self.overruns += 1
+            if self.policy == "skip":
+                missed = int((now - self._deadline) // self.period) + 1
+                self.skipped += missed
+                self._deadline += missed * self.period
+
+        while now < self._deadline:
+            if should_stop is not None and should_stop():
+                return False
+            time.sleep(min(self._deadline - now, self.sleep_slice))
+            now = time.monotonic()
+
+        self.lateness.append(now - self._deadline)
+        self.ticks += 1
+        self._deadline += self.period
+        return True
+
+    def jitter_stats(self):
+        """返回唤醒延迟统计 (ms) 以及超时、跳过的周期数"""
+        values = np.array(self.lateness) * 1000
+        stats = {'ticks': self.ticks, 'overruns': self.overruns, 'skipped': self.skipped}
+        if len(values):
+            stats.update({
+                'mean_ms': float(np.mean(values)),
+                'p95_ms': float(np.percentile(values, 95)),
+                'max_ms': float(np.max(values)),
+            })
+        return stats
+
+    def summary(self):
+        stats = self.jitter_stats()
+        text = f"Scheduler ({1 / self.period:g} Hz, {self.policy}): {stats['ticks']} ticks, " \
+               f"{stats['overruns']} overruns, {stats['skipped']} skipped"
+        if 'mean_ms' in stats:
+            text += f", jitter mean {stats['mean_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, max {stats['max_ms']:.2f} ms"
+        return text
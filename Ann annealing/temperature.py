@@ -1,23 +1,43 @@
 import serial
 import serial.tools.list_ports
-import time
 from collections import deque
+from latency import stage
+from modbus import ModbusRTUClient, ModbusError
 
 class TemperatureSensor:
-    def __init__(self, device_name="USB-SERIAL CH340", baudrate=9600, max_temp_change=10, stability_threshold=5, stable_range=5):
-        # 动态查找串口
-        port = self.find_serial_port_by_device_name(device_name)
-        if port is None:
-            print(f"Warning: Device {device_name} not found, enter no temperature sensor mode.")
-            self.ser = None
+    def __init__(self, device_name="USB-SERIAL CH340", baudrate=9600, max_temp_change=10, stability_threshold=5, stable_range=5,
+                 slave_id=1, register=0, register_count=1, timeout=0.5, bus=None):
+        """
+        参数:
+        - slave_id: 红外测温头的 Modbus 从站地址
+        - register: 温度寄存器地址；register_count 大于 1 时一次事务读取之后的寄存器（如状态、发射率），
+                    结果保存在 self.registers
+        - timeout: 等待应答的时间 (s)
+        - bus: 已有的 ModbusRTUClient，多个测温头共用一条 RS-485 总线时传入，此时不再查找串口
+        """
+        self.slave_id = slave_id
+        self.register = register
+        self.register_count = register_count
+        self.registers = None  # 最近一次读取的全部寄存器值
+        if bus is not None:
+            self.ser = bus.ser
+            self.client = bus
         else:
-            self.ser = serial.Serial(port, baudrate)
-        self.temp_send = bytes.fromhex('01 03 00 00 00 01 84 0A')
+            # 动态查找串口
+            port = self.find_serial_port_by_device_name(device_name)
+            if port is None:
+                print(f"Warning: Device {device_name} not found, enter no temperature sensor mode.")
+                self.ser = None
+                self.client = None
+            else:
+                self.ser = serial.Serial(port, baudrate)
+                self.client = ModbusRTUClient(self.ser, slave_id, timeout=timeout)
         self.max_temp_change = max_temp_change
         self.stability_threshold = stability_threshold  # 连续稳定读数的数量
         self.stable_range = stable_range  # 稳定范围
         self.last_temp = None
         self.history = deque(maxlen=stability_threshold)  # 用队列记录最近的温度读数
+        self.monitor = None  # 可选的 LatencyMonitor，用于统计读取耗时
 
     def find_serial_port_by_device_name(self, device_name):
         """根据设备名称查找串口"""
@@ -28,34 +48,10 @@ class TemperatureSensor:
         return None
 
     def extract_temperature(self, hex_str):
+        """从十六进制响应字符串中取出温度并进行跳变过滤"""
         try:
             if len(hex_str) >= 10:
-                temp_hex = hex_str[6:10]
-                temperature = int(temp_hex, 16)
-
-                # 如果是第一次读取温度，直接接受
-                if self.last_temp is None:
-                    self.last_temp = temperature
-                    self.history.append(temperature)
-                    return temperature
-
-                # 检查当前温度与上次的跳变是否超出范围
-                if abs(temperature - self.last_temp) > self.max_temp_change:
-                    print(f"Temperature jump too large: {self.last_temp} -> {temperature}")
-                    # 将跳变后的温度添加到历史记录
-                    self.history.append(temperature)
-
-                    # 检查历史记录是否稳定
-                    if len(self.history) == self.stability_threshold and self.is_stable():
-                        self.last_temp = temperature
-                        print(f"Stabilized temperature after jump: {temperature}")
-                        return temperature
-                    return None
-
-                # 如果没有跳变，更新历史记录并返回温度
-                self.history.append(temperature)
-                self.last_temp = temperature
-                return temperature
+                return self.filter_temperature(int(hex_str[6:10], 16))
             else:
                 print("Received hex string is too short.")
                 return None
@@ -63,6 +59,32 @@ class TemperatureSensor:
             print(f"Error extracting temperature: {e}")
             return None
 
+    def filter_temperature(self, temperature):
+        """跳变过滤：与上次读数相差过大时，只有在最近读数稳定后才接受"""
+        # 如果是第一次读取温度，直接接受
+        if self.last_temp is None:
+            self.last_temp = temperature
+            self.history.append(temperature)
+            return temperature
+
+        # 检查当前温度与上次的跳变是否超出范围
+        if abs(temperature - self.last_temp) > self.max_temp_change:
+            print(f"Temperature jump too large: {self.last_temp} -> {temperature}")
+            # 将跳变后的温度添加到历史记录
+            self.history.append(temperature)
+
+            # 检查历史记录是否稳定
+            if len(self.history) == self.stability_threshold and self.is_stable():
+                self.last_temp = temperature
+                print(f"Stabilized temperature after jump: {temperature}")
+                return temperature
+            return None
+
+        # 如果没有跳变，更新历史记录并返回温度
+        self.history.append(temperature)
+        self.last_temp = temperature
+        return temperature
+
     def is_stable(self):
         """检查历史记录中的温度是否在稳定范围内"""
         if len(self.history) < self.stability_threshold:
@@ -72,21 +94,33 @@ class TemperatureSensor:
         return (max_temp - min_temp) <= self.stable_range
 
     def get_temperature(self):
+        with stage(self.monitor, 'ir_read'):
+            return self._get_temperature()
+
+    def _get_temperature(self):
         if self.ser is None:
             # 没有连接温度传感器，直接返回None
             return None
 
         if self.ser.is_open:
-            self.ser.write(self.temp_send)
-            time.sleep(0.1)
-
-            buffer_data = self.ser.in_waiting
-            if buffer_data:
-                return_data = self.ser.read(buffer_data)
-                return_data_hex = return_data.hex()
-                return self.extract_temperature(return_data_hex)
+            registers = self.read_registers(self.register, self.register_count)
+            if registers is not None:
+                return self.filter_temperature(registers[0])
         return None
 
+    def read_registers(self, address, count=1):
+        """读取本测温头的连续寄存器，失败时返回 None"""
+        if self.client is None:
+            return None
+        try:
+            registers = self.client.read_holding_registers(address, count, self.slave_id)
+        except (ModbusError, serial.SerialException) as e:
+            print(f"IR sensor {self.slave_id} read failed: {e}")
+            return None
+        if address == self.register:
+            self.registers = registers
+        return registers
+
     def close(self):
         if self.ser and self.ser.is_open:
             self.ser.close()
@@ -1,42 +1,162 @@
 import os
 import time
 import csv  # 新增导入 csv 模块
+import threading
 from datetime import datetime
+from scheduler import FixedRateScheduler
+
+FSYNC_POLICIES = ("never", "rotate", "always")
+
 
 class TemperatureLogger:
-    def __init__(self, filename_prefix="anneal", header_info=None):
+    def __init__(self, filename_prefix="anneal", header_info=None, flush_interval=5.0, fsync="rotate",
+                 max_bytes=50 * 1024 * 1024, max_seconds=None, log_dir=None):
+        """
+        参数:
+        - flush_interval: 缓存的记录每隔多少秒批量写入文件
+        - fsync: "never" 只交给操作系统缓存；"rotate" 在切换文件和关闭时 fsync；"always" 每次批量写入后 fsync
+        - max_bytes / max_seconds: 文件超过大小或时长后切换到新文件（None 表示不限制）；
+          header_info 只写在第一个文件中，_partN 文件只有字段行，需与主文件一起读取（见 run_archive.group_run_files）
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
         # 创建日志文件夹路径
-        log_dir = os.path.join(os.path.dirname(__file__), 'temperature_log')
+        if log_dir is None:
+            log_dir = os.path.join(os.path.dirname(__file__), 'temperature_log')
         os.makedirs(log_dir, exist_ok=True)  # 如果文件夹不存在则创建
+        self.log_dir = log_dir
 
         # 动态生成文件名，包含时间戳，文件扩展名改为 .csv
         current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.filename = os.path.join(log_dir, f"{filename_prefix}_{current_time}.csv")
+        self.base_name = f"{filename_prefix}_{current_time}"
+        self.header_info = header_info
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
 
-        # 写入 CSV 文件头，先写入自定义标题信息（如果有），再写入标准字段行
-        with open(self.filename, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            if header_info is not None:
-                writer.writerow([header_info])
-            writer.writerow(['Timestamp', 'Temperature', 'Output', 'Voltage'])
+        self.part = 0
+        self.filenames = []
+        self._rows = []  # 尚未写入文件的记录
+        self._lock = threading.Lock()  # 保护 _rows
+        self._file_lock = threading.Lock()  # 保护文件的写入、切换和关闭
+        self._file = None
+        self._writer = None
+        self._file_opened = None
+        self._closed = False  # stop() 之后到达的记录直接追加到最后一个文件
+        self._start = time.monotonic()  # Monotonic 列的零点
+        self._open_file()
 
         self.last_temp = None
         self.last_time = None
+        self.rows_written = 0
         self.stop_logging = False  # 用于控制日志记录停止
+        self._flusher = None
+        self._wake = threading.Event()
 
-    def log_temperature(self, temperature, output, voltage):
-        # 获取当前时间，作为日志记录的时间戳
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        # 将数据写入 CSV 文件，每次记录一行
-        with open(self.filename, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([current_time, f"{temperature:.2f}", f"{output:.2f}", voltage])
+    @property
+    def filename(self):
+        """当前正在写入的文件"""
+        return self.filenames[-1]
+
+    def _open_file(self):
+        suffix = "" if self.part == 0 else f"_part{self.part}"
+        filename = os.path.join(self.log_dir, f"{self.base_name}{suffix}.csv")
+        self._file = open(filename, mode='w', newline='')
+        self._writer = csv.writer(self._file)
+        # 先写入自定义标题信息（如果有，只写在主文件中），再写入标准字段行
+        if self.header_info is not None and self.part == 0:
+            self._writer.writerow([self.header_info])
+        self._writer.writerow(['Timestamp', 'Monotonic', 'Temperature', 'Output', 'Voltage', 'Mode'])
+        self._file_opened = time.monotonic()
+        self.filenames.append(filename)
 
+    def _close_file(self, sync):
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def record(self, temperature, output, voltage, wall_time=None, monotonic=None, mode=""):
+        """
+        记录一个样本（只放入内存缓存，不访问文件），由产生数据的控制循环调用。
+        wall_time / monotonic: 样本的采集时间，默认为调用时刻
+        mode: 控制方式（"ai" / "manual"），训练数据导入时跳过 manual 行
+        """
+        wall_time = time.time() if wall_time is None else wall_time
+        monotonic = time.monotonic() if monotonic is None else monotonic
+        if isinstance(voltage, str):
+            voltage_str = voltage
+        elif voltage is None:
+            voltage_str = "None"
+        else:
+            voltage_str = f"{voltage:.3f}"
+        timestamp = datetime.fromtimestamp(wall_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        row = [timestamp, f"{monotonic - self._start:.3f}", f"{temperature:.2f}", f"{output:.2f}", voltage_str, mode]
+        with self._lock:
+            if not self._closed:
+                self._rows.append(row)
+                row = None
+        if row is not None:
+            # stop() 之后才到达（控制循环与停止记录同时发生），不丢弃，追加到最后一个文件
+            with self._file_lock:
+                with open(self.filename, mode='a', newline='') as f:
+                    csv.writer(f).writerow(row)
+                self.rows_written += 1
         self.last_temp = temperature
-        self.last_time = time.time()
+        self.last_time = wall_time
+
+    def log_temperature(self, temperature, output, voltage):
+        self.record(temperature, output, voltage)
+
+    def flush(self, sync=None):
+        """把缓存的记录写入文件；sync 为 None 时按 fsync 策略决定是否 fsync"""
+        with self._file_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            self._write_rows(rows, sync)
+
+    def _write_rows(self, rows, sync=None):
+        """写入记录（调用方持有 _file_lock）"""
+        if self._file is None:
+            return
+        if rows:
+            # 只在有新记录要写时切换文件，避免留下只有表头的空文件
+            if self._should_rotate():
+                self._close_file(self.fsync != "never")
+                self.part += 1
+                self._open_file()
+            self._writer.writerows(rows)
+            self.rows_written += len(rows)
+        self._file.flush()
+        if sync or (sync is None and self.fsync == "always"):
+            os.fsync(self._file.fileno())
+
+    def _should_rotate(self):
+        if self.max_bytes is not None and self._file.tell() >= self.max_bytes:
+            return True
+        return self.max_seconds is not None and time.monotonic() - self._file_opened >= self.max_seconds
+
+    def start(self):
+        """启动后台写入线程，每 flush_interval 秒批量写入一次"""
+        self._flusher = threading.Thread(target=self._flush_loop, name="temperature-logger", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self.stop_logging:
+            self._wake.wait(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Temperature log write failed: {e}")
 
     def start_logging(self, temperature_cb, output_cb, voltage_cb, interval=1):
-        """使用回调函数获取最新温度、电流和电压信息，并以 CSV 形式记录"""
+        """使用回调函数获取最新温度、电流和电压信息，并以 CSV 形式记录（没有控制循环调用 record 时使用）"""
+        if self._flusher is None:
+            self.start()
+        scheduler = FixedRateScheduler(period=interval)
+        scheduler.start()
         try:
             while not self.stop_logging:
                 # 调用回调函数获取最新值
@@ -44,18 +164,23 @@ class TemperatureLogger:
                 current_output = output_cb() if callable(output_cb) else output_cb
                 current_voltage = voltage_cb() if callable(voltage_cb) else voltage_cb
 
-                # 判断 current_voltage 的类型并进行格式化处理
-                if isinstance(current_voltage, str):
-                    voltage_str = current_voltage
-                else:
-                    voltage_str = f"{current_voltage:.3f}"
-
                 if current_temperature is not None:
-                    self.log_temperature(current_temperature, current_output, voltage_str)
-                time.sleep(interval)
+                    self.record(current_temperature, current_output, current_voltage)
+                scheduler.wait(lambda: self.stop_logging)
         except KeyboardInterrupt:
             print("Logging stopped by user.")
 
     def stop(self):
-        """停止日志记录"""
+        """停止日志记录：写入剩余记录并关闭文件；之后到达的 record() 直接追加到最后一个文件"""
         self.stop_logging = True  # 设置标志位为 True，以停止日志记录
+        self._wake.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        with self._file_lock:
+            # 在同一把锁内取出剩余记录并关闭文件，迟到的记录一定排在这些记录之后
+            with self._lock:
+                self._closed = True
+                rows, self._rows = self._rows, []
+            self._write_rows(rows)
+            if self._file is not None:
+                self._close_file(self.fsync != "never")
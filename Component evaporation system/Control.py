@@ -1,3 +1,4 @@
+import os
 import sys
 import time
 import csv
@@ -13,6 +14,9 @@ from QCM import QCMDataCollector
 from Power import PowerController
 from logic import EvaporationLogic
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.telemetry_store import TelemetryStore
+
 # 设置全局字体支持中文
 rcParams['font.sans-serif'] = ['SimHei']
 rcParams['axes.unicode_minus'] = False
@@ -169,6 +173,8 @@ class ControlPanel(QWidget):
         self.logic = None
         self.qcm_collector = None
         self.power_thread = None
+        self.telemetry = None  # QCM 信号写入统一遥测存储
+        self.telemetry_store = None
 
     def start_evaporation(self):
         try:
@@ -189,12 +195,40 @@ class ControlPanel(QWidget):
         )
         self.power_thread.start()
 
+        # 记录本次蒸镀的 QCM 膜厚、速率和频率；上一次蒸镀的记录先结束并关闭
+        self.close_telemetry()
+        try:
+            self.telemetry_store = TelemetryStore()
+            run_id = self.telemetry_store.create_run(
+                'evaporation', molecule=self.molecule_name, experiment_time=self.experiment_time,
+                max_voltage=max_voltage, max_current=max_current, target_current=target_current)
+            self.telemetry = self.telemetry_store.writer(run_id)
+        except Exception as e:
+            print(f"无法打开遥测存储: {e}")
+
         self.qcm_collector = QCMDataCollector()
         self.qcm_collector.thickness_signal.connect(self.update_thickness)
         self.qcm_collector.rate_signal.connect(self.update_rate)
         self.qcm_collector.frequency_signal.connect(self.update_frequency)
         self.qcm_collector.start()
 
+    def close_telemetry(self):
+        """结束本次蒸镀的遥测记录（写入最终电流）并关闭存储；出错时只打印，不影响调用方"""
+        telemetry, self.telemetry = self.telemetry, None
+        store, self.telemetry_store = self.telemetry_store, None
+        try:
+            if telemetry is not None:
+                store.set_attrs(telemetry.run_id, final_current=self.power_controller.target_current)
+                telemetry.close()
+        except Exception as e:
+            print(f"保存遥测记录时出错: {e}")
+        finally:
+            if store is not None:
+                try:
+                    store.close()
+                except Exception as e:
+                    print(f"关闭遥测存储时出错: {e}")
+
     def show_history(self):
         dlg = HistoryDialog()
         dlg.exec_()
@@ -214,6 +248,8 @@ class ControlPanel(QWidget):
 
         self.canvas.draw()
         self.thickness_label.setText(f"膜厚: {thickness:.2f} Å")
+        if self.telemetry is not None:
+            self.telemetry.add('thickness', thickness)
 
     @pyqtSlot(float)
     def update_rate(self, rate):
@@ -230,6 +266,8 @@ class ControlPanel(QWidget):
 
         self.canvas.draw()
         self.rate_label.setText(f"速率: {rate:.2f} Å/min")
+        if self.telemetry is not None:
+            self.telemetry.add('rate', rate)
 
         if self.logic:
             self.logic.add_rate(rate)
@@ -237,6 +275,11 @@ class ControlPanel(QWidget):
     @pyqtSlot(str)
     def update_frequency(self, frequency):
         self.freq_label.setText(f"频率: {frequency} Hz")
+        if self.telemetry is not None:
+            try:
+                self.telemetry.add('frequency', float(frequency))
+            except ValueError:
+                pass
 
     def closeEvent(self, event):
         print("窗口关闭中，归零电流...")
@@ -258,8 +301,12 @@ class ControlPanel(QWidget):
         except Exception as e:
             print(f"关闭电源时出错: {e}")
         finally:
-            self.power_controller.close()
-            event.accept()
+            # 先关闭电源；遥测记录出错不应影响电源的关闭
+            try:
+                self.power_controller.close()
+            finally:
+                self.close_telemetry()
+                event.accept()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
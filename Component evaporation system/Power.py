@@ -1,14 +1,20 @@
-import pyvisa
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.scpi import SCPISession
+from common.instrument_broker import open_instrument
+
 class PowerController:
     def __init__(self, resource_name):
         """
         初始化电源控制器
         :param resource_name: 设备资源字符串 (例如 'USB0::0x2EC7::0x320C::123456::INSTR')
         """
-        self.rm = pyvisa.ResourceManager()
+        self.rm = None  # 直接打开 VISA 资源时的资源管理器，通过代理访问时为 None
         self.instrument = None
+        self.session = None  # SCPI 会话，连接后创建
         self.resource_name = resource_name
         self.target_current = 0.0  # 目标电流
         self.max_voltage = 0.0  # 最大电压
@@ -17,7 +23,9 @@ class PowerController:
     def connect(self):
         """连接到电源设备"""
         try:
-            self.instrument = self.rm.open_resource(self.resource_name)
+            # 代理进程运行时通过代理访问电源（并取得独占租约），否则直接打开 VISA 资源
+            self.instrument, self.rm = open_instrument(self.resource_name, "Component evaporation system")
+            self.session = SCPISession(self.instrument)
             print(f"已连接到设备: {self.resource_name}")
         except Exception as e:
             print(f"无法连接到设备: {e}")
@@ -26,7 +34,7 @@ class PowerController:
     def initialize(self):
         """初始化设备为远程控制模式"""
         if self.instrument:
-            self.instrument.write('SYST:REM')
+            self.session.write('SYST:REM')
             print("设备已设置为远程控制模式")
 
     def set_voltage_current(self, voltage, current):
@@ -40,11 +48,12 @@ class PowerController:
             if current > self.max_current_limit:
                 current = self.max_current_limit
                 print(f"警告: 电流超出最大限制，调整为最大电流 {self.max_current_limit:.2f} A")
-            self.instrument.write(f'VOLT {voltage}')
-            self.instrument.write(f'CURR {current}')
+            # 只发送改变了的参数，值未改变时不发送也不打印
+            changed = self.session.set({'VOLT': voltage, 'CURR': current})
             self.target_current = current
             self.max_voltage = voltage
-            print(f"设置电压: {voltage} V, 设置电流: {current:.2f} A")
+            if changed:
+                print(f"设置电压: {voltage} V, 设置电流: {current:.2f} A")
 
     def set_max_current_limit(self, max_current):
         """
@@ -62,7 +71,7 @@ class PowerController:
         """
         if self.instrument:
             current = 0
-            self.instrument.write('OUTP ON')  # 打开电源输出
+            self.session.set({'OUTP': 'ON'}, force=True)  # 打开电源输出
             while current < max_current:
                 current = min(current + step, max_current, self.max_current_limit)
                 self.set_voltage_current(self.max_voltage, current)
@@ -75,7 +84,7 @@ class PowerController:
         """
         if self.instrument:
             try:
-                current = float(self.instrument.query('MEAS:CURR?'))
+                current = self.session.query_float('MEAS:CURR?')
                 print(f"读取当前电流: {current:.2f} A")
                 return current
             except Exception as e:
@@ -86,13 +95,15 @@ class PowerController:
     def turn_off(self):
         """关闭电源输出"""
         if self.instrument:
-            self.instrument.write('OUTP OFF')
+            self.session.set({'OUTP': 'OFF'}, force=True)
             print("电源输出已关闭")
 
     def close(self):
         """释放资源"""
         if self.instrument:
+            print(self.session.summary())
             self.instrument.close()
             print("设备已关闭")
-        self.rm.close()
-        print("资源管理器已释放")
+        if self.rm:
+            self.rm.close()
+            print("资源管理器已释放")
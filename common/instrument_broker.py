@@ -0,0 +1,437 @@
+'''
+本地仪器代理：由一个常驻进程独占打开 VISA 仪器，多个程序通过本地套接字访问。
+- 仪器连接在客户端进程重启（例如 main_autotest 反复启动 main_ai）之间保持打开
+- 每个客户端有独立的指令队列，同一台仪器的各客户端队列轮流执行
+- 写入需要先取得租约，同一时刻只有一个程序能驱动电源；客户端断开时自动释放
+- 客户端的写入不等待应答（流水线），错误在下一次查询或 flush 时抛出
+- --simulate 使用内置的模拟电源，便于在没有仪器时运行
+- 连接用本机的密钥认证（环境变量 SDL_BROKER_AUTHKEY，或首次使用时生成的仅当前用户可读的密钥文件），
+  消息以 JSON 传输，不反序列化 pickle 数据
+
+启动：python instrument_broker.py [--simulate] [--port 18861]
+'''
+import argparse
+import itertools
+import json
+import os
+import secrets
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+DEFAULT_ADDRESS = ('localhost', 18861)
+AUTHKEY_ENV = 'SDL_BROKER_AUTHKEY'
+AUTHKEY_PATH = os.path.join(os.path.expanduser('~'), '.sdl_instrument_broker_key')
+
+
+class BrokerError(Exception):
+    """代理返回的错误（租约冲突、仪器通信失败等）"""
+
+
+def default_authkey(path=AUTHKEY_PATH):
+    """本机的认证密钥：优先取环境变量，否则读取密钥文件，文件不存在时生成（权限 0600）"""
+    key = os.environ.get(AUTHKEY_ENV)
+    if key:
+        return key.encode()
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, 'rb') as f:
+            return f.read().strip()
+    key = secrets.token_hex(32).encode()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def _send_message(conn, message):
+    conn.send_bytes(json.dumps(message).encode())
+
+
+def _recv_message(conn):
+    return json.loads(conn.recv_bytes())
+
+
+class SimulatedPowerSupply:
+    """模拟电源，支持 VOLT/CURR/OUTP 设置和 MEAS 查询，指令可用分号连接"""
+
+    def __init__(self, resource_name="SIM::POWER"):
+        self.resource_name = resource_name
+        self.voltage = 0.0
+        self.current = 0.0
+        self.output = False
+        self.remote = False
+        self.timeout = 2000
+        self.read_termination = '\n'
+        self.write_termination = '\n'
+
+    def _execute(self, command):
+        command = command.strip().lstrip(':')
+        header, _, value = command.partition(' ')
+        header = header.upper()
+        if header == 'VOLT':
+            self.voltage = float(value)
+        elif header == 'CURR':
+            self.current = float(value)
+        elif header == 'OUTP':
+            self.output = value.strip().upper() in ('ON', '1')
+        elif header == 'SYST:REM':
+            self.remote = True
+        elif header == '*IDN?':
+            return f"SIMULATED,POWER SUPPLY,0,{self.resource_name}"
+        elif header == 'MEAS:VOLT?':
+            return f"{self.voltage if self.output else 0.0:.3f}"
+        elif header == 'MEAS:CURR?':
+            return f"{self.current if self.output else 0.0:.3f}"
+        else:
+            raise ValueError(f"Unknown command: {command}")
+        return None
+
+    def write(self, message):
+        for command in message.split(';'):
+            self._execute(command)
+        return len(message)
+
+    def query(self, message):
+        responses = [r for r in (self._execute(c) for c in message.split(';')) if r is not None]
+        return ';'.join(responses) + self.read_termination
+
+    def close(self):
+        pass
+
+
+def open_visa_resource(resource_name):
+    import pyvisa
+    resource = pyvisa.ResourceManager().open_resource(resource_name)
+    resource.read_termination = '\n'
+    resource.write_termination = '\n'
+    return resource
+
+
+class _ResourceWorker:
+    """独占一台仪器的线程：各客户端的指令队列轮流取一条执行"""
+
+    def __init__(self, name, instrument):
+        self.name = name
+        self.instrument = instrument
+        self.owner = None  # 持有租约的客户端 id
+        self.commands = 0
+        self._queues = OrderedDict()  # 客户端 id -> deque[job]
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"broker-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, client_id, job):
+        with self._cond:
+            self._queues.setdefault(client_id, deque()).append(job)
+            self._cond.notify()
+
+    def drop_client(self, client_id):
+        """丢弃客户端尚未执行的指令并释放其租约"""
+        with self._cond:
+            self._queues.pop(client_id, None)
+            if self.owner == client_id:
+                self.owner = None
+
+    def _next_job(self):
+        with self._cond:
+            while not self._closed and not any(self._queues.values()):
+                self._cond.wait()
+            if self._closed:
+                return None
+            for client_id, jobs in self._queues.items():
+                if jobs:
+                    self._queues.move_to_end(client_id)
+                    return jobs.popleft()
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                break
+            self.commands += 1
+            job()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(2.0)
+        self.instrument.close()
+
+
+class InstrumentBroker:
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, open_instrument=open_visa_resource):
+        """
+        参数:
+        - authkey: 连接认证密钥，默认为 default_authkey()
+        - open_instrument: 根据资源名打开仪器的函数，返回带 write/query/close 的对象
+        """
+        self.address = address
+        self.authkey = authkey or default_authkey()
+        self.open_instrument = open_instrument
+        self.workers = {}  # 资源名 -> _ResourceWorker
+        self.clients = {}  # 客户端 id -> 名称
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def _worker(self, resource_name):
+        with self._lock:
+            if resource_name not in self.workers:
+                self.workers[resource_name] = _ResourceWorker(resource_name, self.open_instrument(resource_name))
+                print(f"Opened instrument {resource_name}")
+            return self.workers[resource_name]
+
+    def serve_forever(self):
+        self._listener = Listener(self.address, authkey=self.authkey)
+        print(f"Instrument broker listening on {self.address[0]}:{self.address[1]}")
+        try:
+            while True:
+                try:
+                    conn = self._listener.accept()
+                except AuthenticationError:
+                    print("Rejected a connection with a wrong authentication key")
+                    continue
+                except OSError:
+                    break  # 监听已关闭
+                threading.Thread(target=self._serve_client, args=(conn, next(self._ids)), daemon=True).start()
+        finally:
+            self.close()
+
+    def _serve_client(self, conn, client_id):
+        send_lock = threading.Lock()
+
+        def reply(request_id, ok, result):
+            with send_lock:
+                try:
+                    _send_message(conn, (request_id, ok, result))
+                except (OSError, EOFError):
+                    pass  # 客户端已断开
+
+        self.clients[client_id] = f"client-{client_id}"
+        try:
+            while True:
+                try:
+                    request_id, op, resource_name, arg = _recv_message(conn)
+                except (EOFError, OSError, ValueError):
+                    break  # 断开，或收到的不是合法的 JSON 请求
+                if op == 'bye':
+                    break
+                try:
+                    self._handle(client_id, request_id, op, resource_name, arg, reply)
+                except Exception as e:
+                    reply(request_id, False, f"{type(e).__name__}: {e}")
+        finally:
+            for worker in list(self.workers.values()):
+                if worker.owner == client_id:
+                    print(f"{self.clients[client_id]} disconnected; released {worker.name}")
+                worker.drop_client(client_id)
+            self.clients.pop(client_id, None)
+            conn.close()
+
+    def _handle(self, client_id, request_id, op, resource_name, arg, reply):
+        if op == 'hello':
+            self.clients[client_id] = f"{arg} (#{client_id})"
+            reply(request_id, True, client_id)
+        elif op == 'status':
+            reply(request_id, True, {name: {'owner': self.clients.get(w.owner), 'commands': w.commands}
+                                     for name, w in self.workers.items()})
+        elif op == 'acquire':
+            worker = self._worker(resource_name)
+            with worker._cond:
+                if worker.owner not in (None, client_id):
+                    raise BrokerError(f"{resource_name} is in use by {self.clients.get(worker.owner)}")
+                worker.owner = client_id
+            reply(request_id, True, None)
+        elif op == 'release':
+            worker = self._worker(resource_name)
+            with worker._cond:
+                if worker.owner == client_id:
+                    worker.owner = None
+            reply(request_id, True, None)
+        elif op in ('write', 'query'):
+            worker = self._worker(resource_name)
+            if op == 'write' and worker.owner != client_id:
+                raise BrokerError(f"{resource_name} is not leased by this client")
+
+            def job():
+                try:
+                    if op == 'write' and worker.owner != client_id:
+                        raise BrokerError(f"Lease on {resource_name} was lost")
+                    result = getattr(worker.instrument, op)(arg)
+                    reply(request_id, True, result if op == 'query' else None)
+                except Exception as e:
+                    reply(request_id, False, f"{type(e).__name__}: {e}")
+
+            worker.submit(client_id, job)
+        else:
+            raise BrokerError(f"Unknown operation: {op}")
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        for worker in list(self.workers.values()):
+            worker.close()
+        self.workers.clear()
+
+
+class BrokerClient:
+    def __init__(self, name, address=DEFAULT_ADDRESS, authkey=None):
+        """连接代理；代理未运行时抛出 ConnectionRefusedError"""
+        self.name = name
+        self._conn = Client(address, authkey=authkey or default_authkey())
+        self._ids = itertools.count(1)
+        self._futures = {}
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_responses, name="broker-client", daemon=True)
+        self._reader.start()
+        self.client_id = self.call('hello', arg=name)
+
+    def _read_responses(self):
+        while True:
+            try:
+                request_id, ok, result = _recv_message(self._conn)
+            except (EOFError, OSError, ValueError):
+                break
+            future = self._futures.pop(request_id, None)
+            if future is not None:
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(BrokerError(result))
+        # 连接断开：尚未应答的请求全部失败
+        for future in list(self._futures.values()):
+            future.set_exception(BrokerError("Connection to instrument broker lost"))
+        self._futures.clear()
+
+    def request(self, op, resource_name=None, arg=None):
+        """发送请求，不等待应答，返回 Future"""
+        future = Future()
+        with self._send_lock:
+            request_id = next(self._ids)
+            self._futures[request_id] = future
+            try:
+                _send_message(self._conn, (request_id, op, resource_name, arg))
+            except (OSError, EOFError) as e:
+                self._futures.pop(request_id, None)
+                raise BrokerError(f"Connection to instrument broker lost: {e}")
+        return future
+
+    def call(self, op, resource_name=None, arg=None, timeout=None):
+        return self.request(op, resource_name, arg).result(timeout)
+
+    def open_resource(self, resource_name, acquire=True):
+        """返回 pyvisa 风格的远程资源；acquire 为 True 时取得写入租约，仪器被占用时抛出 BrokerError"""
+        if acquire:
+            self.call('acquire', resource_name)
+        return RemoteResource(self, resource_name, leased=acquire)
+
+    def status(self):
+        return self.call('status')
+
+    def close(self):
+        """通知代理断开（释放租约），等待连接关闭"""
+        try:
+            with self._send_lock:
+                _send_message(self._conn, (0, 'bye', None, None))
+        except (OSError, EOFError):
+            pass
+        self._reader.join(2.0)
+        self._conn.close()
+
+
+class RemoteResource:
+    """通过代理访问的仪器，接口与 pyvisa 资源的 write/query/close 一致"""
+
+    def __init__(self, client, resource_name, leased=False, owns_client=False):
+        self.client = client
+        self.resource_name = resource_name
+        self.leased = leased
+        self.owns_client = owns_client  # close 时是否同时断开客户端连接
+        # 终止符由代理端的仪器连接决定，这里保留属性以兼容 SCPISession 的设置
+        self.timeout = 2000  # ms，用于等待查询结果
+        self.read_termination = '\n'
+        self.write_termination = '\n'
+        self._pending = deque()  # 尚未确认的写入
+
+    def _check_pending(self, wait=False):
+        """检查已完成的写入；wait 为 True 时等待全部完成。出错的写入在此抛出"""
+        while self._pending and (wait or self._pending[0].done()):
+            future = self._pending.popleft()
+            future.result(self.timeout / 1000)
+
+    def write_async(self, message):
+        """发送写入，不检查之前的写入，返回该写入的 Future（失败时其中保存异常）"""
+        future = self.client.request('write', self.resource_name, message)
+        self._pending.append(future)
+        return future
+
+    def write(self, message):
+        # 先发送本条指令，再抛出之前写入的错误，避免因为前一条失败而丢掉本条
+        self.write_async(message)
+        self._check_pending()
+        return len(message)
+
+    def query(self, message):
+        future = self.client.request('query', self.resource_name, message)
+        self._check_pending(wait=True)
+        return future.result(self.timeout / 1000)
+
+    def flush(self, wait=True):
+        """等待所有写入被仪器执行；wait 为 False 时只抛出已完成写入中的错误"""
+        self._check_pending(wait)
+
+    def close(self):
+        try:
+            self.flush()
+            if self.leased:
+                self.client.call('release', self.resource_name, timeout=self.timeout / 1000)
+        finally:
+            if self.owns_client:
+                self.client.close()
+
+
+def open_instrument(resource_name, client_name, address=DEFAULT_ADDRESS, authkey=None):
+    """
+    代理运行时通过代理打开仪器并取得租约，否则直接用 pyvisa 打开（此时不受租约约束，打印警告）。
+
+    返回:
+    - (instrument, resource_manager)，通过代理打开时 resource_manager 为 None
+    """
+    try:
+        client = BrokerClient(client_name, address, authkey)
+    except ConnectionRefusedError:
+        print(f"Warning: instrument broker is not running; opening {resource_name} directly. "
+              f"Other programs are not prevented from driving it at the same time.")
+        import pyvisa
+        rm = pyvisa.ResourceManager()
+        return rm.open_resource(resource_name), rm
+    try:
+        client.call('acquire', resource_name)
+    except Exception:
+        client.close()
+        raise
+    print(f"Using instrument broker for {resource_name}")
+    return RemoteResource(client, resource_name, leased=True, owns_client=True), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local instrument broker")
+    parser.add_argument('--port', type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument('--simulate', action='store_true', help="Serve simulated power supplies instead of VISA devices")
+    args = parser.parse_args()
+    broker = InstrumentBroker((DEFAULT_ADDRESS[0], args.port),
+                              open_instrument=SimulatedPowerSupply if args.simulate else open_visa_resource)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        print("Instrument broker stopped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+'''
+SCPI 会话层（Ann annealing 与 Component evaporation system 的电源控制共用）：
+- 缓存最近一次设置的参数，值未改变时不再发送
+- 同一次设置中改变的多个参数合并为一条以分号连接的消息
+- 查询使用 query()，由会话统一配置终止符和超时，不再写入后固定等待
+- 统计发送的字节数、指令数和消息数，便于观察 USB-TMC 流量
+- 通过仪器代理流水线写入时，失败的写入只清除它自己携带的缓存
+'''
+import threading
+
+
+def format_value(value):
+    """数值统一格式化，保证缓存比较和发送内容一致（25.0 -> "25"，1.2340 -> "1.234"）"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return format(float(value), '.6g')
+    return str(value)
+
+
+class SCPISession:
+    def __init__(self, instrument, timeout=2000, read_termination='\n', write_termination='\n'):
+        """
+        参数:
+        - instrument: pyvisa 资源
+        - timeout: 查询超时 (ms)
+        - read_termination / write_termination: 读写终止符
+        """
+        self.instrument = instrument
+        self.instrument.timeout = timeout
+        self.instrument.read_termination = read_termination
+        self.instrument.write_termination = write_termination
+        self.write_termination = write_termination
+        self.state = {}  # 指令头 -> 最近一次发送的值
+        self.lock = threading.RLock()  # 控制线程和电源 I/O 线程可能同时访问
+        self.bytes_sent = 0
+        self.commands_sent = 0  # 单条 SCPI 指令数（合并消息中的每条指令分别计数）
+        self.messages_sent = 0  # 实际的写入次数
+        self.queries = 0
+        self.suppressed = 0  # 因值未改变而省略的指令数
+        self._inflight = []  # 流水线写入：(Future, [(指令头, 值)])
+
+    def _count(self, message, commands):
+        self.bytes_sent += len(message) + len(self.write_termination)
+        self.commands_sent += commands
+        self.messages_sent += 1
+
+    def _send(self, message, commands=1):
+        self.instrument.write(message)
+        self._count(message, commands)
+
+    def _discard_failed(self):
+        """清除已失败的流水线写入所设置的缓存（值已被之后的设置覆盖的除外）"""
+        inflight = []
+        for future, sent in self._inflight:
+            if not future.done():
+                inflight.append((future, sent))
+            elif future.exception() is not None:
+                for header, value in sent:
+                    if self.state.get(header) == value:
+                        del self.state[header]
+        self._inflight = inflight
+
+    def write(self, message):
+        """直接发送指令，不经过缓存"""
+        with self.lock:
+            try:
+                self._send(message)
+            finally:
+                self._discard_failed()
+
+    def set(self, settings, force=False):
+        """
+        设置参数，只发送与缓存不同的部分。
+
+        参数:
+        - settings: {指令头: 值}，按字典顺序发送，例如 {'VOLT': 25, 'CURR': 1.2}
+        - force: 为 True 时忽略缓存全部发送（例如设备状态可能被面板修改过）
+
+        返回:
+        - 是否实际发送了指令
+        """
+        with self.lock:
+            self._discard_failed()
+            changed = []
+            for header, value in settings.items():
+                value = format_value(value)
+                if force or self.state.get(header) != value:
+                    changed.append((header, value))
+                else:
+                    self.suppressed += 1
+            if not changed:
+                return False
+            # 每条指令以 ":" 开头，从根路径解析，不受前一条指令路径的影响
+            message = ';:'.join(f"{header} {value}" for header, value in changed)
+            write_async = getattr(self.instrument, 'write_async', None)
+            if write_async is not None:
+                # 通过代理流水线写入：先记录本次写入，之前的写入出错时只清除那次写入的缓存
+                self._inflight.append((write_async(message), changed))
+                self._count(message, len(changed))
+                self.state.update(changed)
+                try:
+                    self.instrument.flush(wait=False)
+                finally:
+                    self._discard_failed()
+                return True
+            try:
+                self._send(message, len(changed))
+            except Exception:
+                # 写入失败时设备状态未知，清除相关缓存
+                for header, _ in changed:
+                    self.state.pop(header, None)
+                raise
+            self.state.update(changed)
+            return True
+
+    def query(self, message):
+        """发送查询并读取一行返回值（已去除空白）"""
+        with self.lock:
+            try:
+                response = self.instrument.query(message)
+            finally:
+                self._discard_failed()
+            self._count(message, 1)
+            self.queries += 1
+            return response.strip()
+
+    def query_float(self, message):
+        return float(self.query(message))
+
+    def invalidate(self, header=None):
+        """清除缓存，下一次 set 会重新发送"""
+        with self.lock:
+            if header is None:
+                self.state.clear()
+                self._inflight.clear()
+            else:
+                self.state.pop(header, None)
+
+    def stats(self):
+        return {
+            'bytes_sent': self.bytes_sent,
+            'commands_sent': self.commands_sent,
+            'messages_sent': self.messages_sent,
+            'queries': self.queries,
+            'suppressed': self.suppressed,
+        }
+
+    def summary(self):
+        return (f"SCPI traffic: {self.messages_sent} messages ({self.commands_sent} commands, "
+                f"{self.queries} queries), {self.bytes_sent} bytes sent, {self.suppressed} redundant writes suppressed")
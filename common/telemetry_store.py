@@ -0,0 +1,462 @@
+'''
+实验室遥测数据的统一存储：
+- 每个通道的数据按块保存为 .npy（两列：时间 (s, Unix 时间或相对时间)、数值）
+- SQLite 索引记录运行（run_id、子系统、时间范围、属性如 setpoint / heating_rate）和数据块（通道、时间范围）
+- 查询直接走索引，例如 find_runs(subsystem='anneal', setpoint=300, heating_rate=1.0)，
+  read() 只加载与时间范围重叠的数据块，返回 NumPy 数组
+- 提供现有各类记录文件的导入函数，以及供实时写入（如 QCM 信号）的 RunWriter
+
+用法:
+- python telemetry_store.py ingest               导入仓库中现有的全部记录文件
+- python telemetry_store.py runs [key=value ...]  按子系统/属性列出运行，例如 subsystem=anneal setpoint=300
+'''
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+REPO_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DEFAULT_ROOT = os.path.join(REPO_ROOT, 'telemetry')
+CHUNK_SIZE = 4096  # 每个数据块的最大行数
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    subsystem TEXT NOT NULL,
+    source TEXT,
+    start_time REAL,
+    end_time REAL,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS run_attrs (
+    run_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    num REAL,
+    text TEXT,
+    PRIMARY KEY (run_id, key)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    run_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    t_start REAL,
+    t_end REAL,
+    n INTEGER,
+    path TEXT NOT NULL,
+    PRIMARY KEY (run_id, channel, seq)
+);
+CREATE INDEX IF NOT EXISTS runs_subsystem ON runs (subsystem, start_time);
+CREATE INDEX IF NOT EXISTS attrs_key ON run_attrs (key, num, text);
+CREATE INDEX IF NOT EXISTS chunks_time ON chunks (channel, t_start, t_end);
+"""
+
+
+def _safe_name(name):
+    return re.sub(r'[^0-9A-Za-z._-]+', '_', name)
+
+
+class TelemetryStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        os.makedirs(os.path.join(root, 'chunks'), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+
+    # ---- 写入 ----
+
+    def has_run(self, run_id):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM runs WHERE run_id = ?", (run_id,)).fetchone() is not None
+
+    def create_run(self, subsystem, run_id=None, source=None, start_time=None, replace=False, **attrs):
+        """
+        登记一次运行，返回 run_id。
+        attrs: 运行属性（数值或字符串），可用于 find_runs 查询
+        """
+        if run_id is None:
+            run_id = f"{subsystem}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        with self._lock:
+            if replace:
+                self.delete_run(run_id)
+            self._db.execute("INSERT INTO runs (run_id, subsystem, source, start_time, end_time, created) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (run_id, subsystem, source, start_time, start_time, time.time()))
+            self.set_attrs(run_id, **attrs)
+            self._db.commit()
+        return run_id
+
+    def set_attrs(self, run_id, **attrs):
+        with self._lock:
+            for key, value in attrs.items():
+                if value is None:
+                    continue
+                if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+                    num, text = float(value), None
+                else:
+                    num, text = None, str(value)
+                self._db.execute("INSERT OR REPLACE INTO run_attrs (run_id, key, num, text) VALUES (?, ?, ?, ?)",
+                                 (run_id, key, num, text))
+            self._db.commit()
+
+    def append(self, run_id, channel, times, values):
+        """追加一个通道的数据（按 CHUNK_SIZE 切分成数据块）"""
+        data = np.column_stack([np.asarray(times, dtype=float), np.asarray(values, dtype=float)])
+        if len(data) == 0:
+            return
+        run_dir = os.path.join(self.root, 'chunks', _safe_name(run_id))
+        os.makedirs(run_dir, exist_ok=True)
+        with self._lock:
+            row = self._db.execute("SELECT MAX(seq) FROM chunks WHERE run_id = ? AND channel = ?",
+                                   (run_id, channel)).fetchone()
+            seq = 0 if row[0] is None else row[0] + 1
+            for start in range(0, len(data), CHUNK_SIZE):
+                chunk = data[start:start + CHUNK_SIZE]
+                path = os.path.join('chunks', _safe_name(run_id), f"{_safe_name(channel)}_{seq:05d}.npy")
+                np.save(os.path.join(self.root, path), chunk)
+                t_start, t_end = float(np.nanmin(chunk[:, 0])), float(np.nanmax(chunk[:, 0]))
+                self._db.execute("INSERT INTO chunks (run_id, channel, seq, t_start, t_end, n, path) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)", (run_id, channel, seq, t_start, t_end, len(chunk), path))
+                self._db.execute("UPDATE runs SET start_time = MIN(COALESCE(start_time, ?), ?), "
+                                 "end_time = MAX(COALESCE(end_time, ?), ?) WHERE run_id = ?",
+                                 (t_start, t_start, t_end, t_end, run_id))
+                seq += 1
+            self._db.commit()
+
+    def writer(self, run_id, chunk_size=512):
+        """返回逐点写入的缓冲写入器"""
+        return RunWriter(self, run_id, chunk_size)
+
+    def delete_run(self, run_id):
+        with self._lock:
+            for (path,) in self._db.execute("SELECT path FROM chunks WHERE run_id = ?", (run_id,)).fetchall():
+                try:
+                    os.remove(os.path.join(self.root, path))
+                except FileNotFoundError:
+                    pass
+            for table in ('chunks', 'run_attrs', 'runs'):
+                self._db.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+            self._db.commit()
+
+    # ---- 查询 ----
+
+    def find_runs(self, subsystem=None, channel=None, start=None, end=None, tolerance=1e-6, **attrs):
+        """
+        按索引查找运行。
+        - start / end: 运行时间范围需与 [start, end] 重叠
+        - attrs: 属性条件，数值在 tolerance 内相等即匹配，例如 setpoint=300, heating_rate=1.0
+
+        返回:
+        - 运行信息字典列表（含全部属性），按开始时间排序
+        """
+        sql = "SELECT r.run_id FROM runs r WHERE 1 = 1"
+        params = []
+        if subsystem is not None:
+            sql += " AND r.subsystem = ?"
+            params.append(subsystem)
+        if start is not None:
+            sql += " AND r.end_time >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND r.start_time <= ?"
+            params.append(end)
+        if channel is not None:
+            sql += " AND EXISTS (SELECT 1 FROM chunks c WHERE c.run_id = r.run_id AND c.channel = ?)"
+            params.append(channel)
+        for key, value in attrs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                sql += " AND EXISTS (SELECT 1 FROM run_attrs a WHERE a.run_id = r.run_id AND a.key = ? AND ABS(a.num - ?) <= ?)"
+                params.extend([key, float(value), tolerance])
+            else:
+                sql += " AND EXISTS (SELECT 1 FROM run_attrs a WHERE a.run_id = r.run_id AND a.key = ? AND a.text = ?)"
+                params.extend([key, str(value)])
+        sql += " ORDER BY r.start_time"
+        with self._lock:
+            run_ids = [row[0] for row in self._db.execute(sql, params).fetchall()]
+        return [self.run_info(run_id) for run_id in run_ids]
+
+    def run_info(self, run_id):
+        with self._lock:
+            row = self._db.execute("SELECT run_id, subsystem, source, start_time, end_time FROM runs WHERE run_id = ?",
+                                   (run_id,)).fetchone()
+            if row is None:
+                raise KeyError(run_id)
+            info = dict(zip(('run_id', 'subsystem', 'source', 'start_time', 'end_time'), row))
+            for key, num, text in self._db.execute("SELECT key, num, text FROM run_attrs WHERE run_id = ?", (run_id,)):
+                info[key] = num if num is not None else text
+            info['channels'] = self.channels(run_id)
+        return info
+
+    def channels(self, run_id):
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT DISTINCT channel FROM chunks WHERE run_id = ? ORDER BY channel", (run_id,))]
+
+    def read(self, run_id, channel, start=None, end=None):
+        """读取一个通道，返回 (times, values)；只加载与 [start, end] 重叠的数据块"""
+        sql = "SELECT path FROM chunks WHERE run_id = ? AND channel = ?"
+        params = [run_id, channel]
+        if start is not None:
+            sql += " AND t_end >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND t_start <= ?"
+            params.append(end)
+        with self._lock:
+            paths = [row[0] for row in self._db.execute(sql + " ORDER BY seq", params)]
+        if not paths:
+            return np.zeros(0), np.zeros(0)
+        data = np.concatenate([np.load(os.path.join(self.root, path)) for path in paths])
+        mask = np.ones(len(data), dtype=bool)
+        if start is not None:
+            mask &= data[:, 0] >= start
+        if end is not None:
+            mask &= data[:, 0] <= end
+        return data[mask, 0], data[mask, 1]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RunWriter:
+    """逐点写入，攒满 chunk_size 行后写入一个数据块"""
+
+    def __init__(self, store, run_id, chunk_size=512):
+        self.store = store
+        self.run_id = run_id
+        self.chunk_size = chunk_size
+        self._buffers = {}  # 通道 -> [(time, value)]
+        self._lock = threading.Lock()
+
+    def add(self, channel, value, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            buffer = self._buffers.setdefault(channel, [])
+            buffer.append((timestamp, value))
+            if len(buffer) < self.chunk_size:
+                return
+            self._buffers[channel] = []
+        self.store.append(self.run_id, channel, [t for t, _ in buffer], [v for _, v in buffer])
+
+    def flush(self):
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        for channel, buffer in buffers.items():
+            if buffer:
+                self.store.append(self.run_id, channel, [t for t, _ in buffer], [v for _, v in buffer])
+
+    def close(self):
+        self.flush()
+
+
+# ---- 现有记录文件的导入 ----
+
+_SETPOINT_RE = re.compile(r'Setpoint:\s*([-+0-9.eE]+).*?Heating Rate:\s*([-+0-9.eE]+)(?:.*?main_aototest:\s*(\w+))?')
+_PART_RE = re.compile(r'_part(\d+)$')  # TemperatureLogger 切换文件后的 _partN 后缀
+
+
+def _parse_timestamp(text):
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(text.strip(), fmt).timestamp()
+        except ValueError:
+            continue
+    return np.nan
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def group_temperature_csvs(paths):
+    """按运行分组 CSV：{运行名: [主文件, _part1, _part2, ...]}"""
+    groups = {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        match = _PART_RE.search(stem)
+        groups.setdefault(_PART_RE.sub('', stem), []).append((int(match.group(1)) if match else 0, path))
+    return {name: [path for _, path in sorted(files)] for name, files in groups.items()}
+
+
+def ingest_temperature_csv(store, paths, replace=False):
+    """
+    导入 temperature_log/*.csv（TemperatureLogger 的输出），子系统 anneal。
+    paths: 一次运行的文件，可以是单个路径，或主文件和 _partN 文件的列表（按顺序合并为同一次运行）
+    """
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    name = _PART_RE.sub('', os.path.splitext(os.path.basename(paths[0]))[0])
+    run_id = f"anneal-{name}"
+    if store.has_run(run_id) and not replace:
+        return None
+    attrs = {}
+    rows = []
+    for path in paths:
+        header = ['Timestamp', 'Temperature', 'Output', 'Voltage']
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if not row:
+                    continue
+                if row[0].startswith('#'):
+                    match = _SETPOINT_RE.search(','.join(row))
+                    if match:
+                        attrs['setpoint'] = float(match.group(1))
+                        attrs['heating_rate'] = float(match.group(2))
+                        if match.group(3) is not None:
+                            attrs['auto_test'] = match.group(3)
+                    continue
+                if row[0] == 'Timestamp':
+                    header = row
+                    continue
+                rows.append(dict(zip(header, row)))
+    run_id = store.create_run('anneal', run_id, source=os.path.abspath(paths[0]), replace=replace, **attrs)
+    times = np.array([_parse_timestamp(r['Timestamp']) for r in rows])
+    for column, channel in (('Temperature', 'temperature'), ('Output', 'current'), ('Voltage', 'voltage')):
+        store.append(run_id, channel, times, [_to_float(r.get(column)) for r in rows])
+    return run_id
+
+
+def ingest_ai_log(store, path, replace=False):
+    """
+    导入 AI 计算记录（ai_log.airec 或 ai_log.txt），每个 RUN_START 为一次运行，子系统 ai。
+    文本日志没有绝对时间，时间为按 Time Interval 累加的相对秒数（属性 time_base=relative）。
+    """
+    sys.path.insert(0, os.path.join(REPO_ROOT, 'Ann annealing', 'AI_Model'))
+    import ai_records
+    if ai_records.is_record_file(path):
+        records = np.asarray(ai_records.open_records(path))
+        time_base = 'unix'
+    else:
+        records = ai_records.read_text_log(path)
+        time_base = 'relative'
+    stem = os.path.splitext(os.path.basename(path))[0]
+    run_ids = []
+    boundaries = np.flatnonzero(records['kind'] == ai_records.RUN_START).tolist()
+    starts = [0] + boundaries if not boundaries or boundaries[0] != 0 else boundaries
+    for index, start in enumerate(starts):
+        stop = starts[index + 1] if index + 1 < len(starts) else len(records)
+        part = records[start:stop]
+        samples = part[part['kind'] == ai_records.SAMPLE]
+        if len(samples) == 0:
+            continue
+        run_id = f"ai-{stem}-{index:04d}"
+        if store.has_run(run_id) and not replace:
+            continue
+        attrs = {'time_base': time_base}
+        if part[0]['kind'] == ai_records.RUN_START:
+            attrs['setpoint'] = float(part[0]['current_value'])
+            attrs['heating_rate'] = float(part[0]['output'])
+        store.create_run('ai', run_id, source=os.path.abspath(path), replace=replace, **attrs)
+        times = samples['wall_time'] if time_base == 'unix' else np.cumsum(samples['interval'])
+        for channel in ('current_value', 'output', 'voltage', 'interval'):
+            store.append(run_id, channel, times, samples[channel])
+        run_ids.append(run_id)
+    return run_ids
+
+
+def ingest_pid_log(store, path, replace=False):
+    """导入 manipulator/pid_log.txt（"时间 - 键: 值, ..." 格式），子系统 manipulator"""
+    run_id = f"manipulator-{os.path.splitext(os.path.basename(path))[0]}"
+    if store.has_run(run_id) and not replace:
+        return None
+    columns = {}
+    times = []
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            timestamp, sep, body = line.strip().partition(' - ')
+            if not sep:
+                continue
+            t = _parse_timestamp(timestamp)
+            if np.isnan(t):
+                continue
+            index = len(times)
+            times.append(t)
+            for part in body.split(', '):
+                key, _, value = part.partition(': ')
+                channel = _safe_name(key.strip().lower()).replace('-', '_')
+                columns.setdefault(channel, [np.nan] * index).append(_to_float(value))
+            for values in columns.values():
+                if len(values) < len(times):
+                    values.append(np.nan)
+    run_id = store.create_run('manipulator', run_id, source=os.path.abspath(path), replace=replace)
+    for channel, values in columns.items():
+        store.append(run_id, channel, times, values)
+    return run_id
+
+
+_CHINESE_DATE_RE = re.compile(r'(\d+)年(\d+)月(\d+)日\s*(\d+)[:：](\d+)')
+
+
+def ingest_evaporation_history(store, path, replace=False):
+    """导入 evaporation_history.csv（分子编号、实验时刻、最终电流），每行一次运行，子系统 evaporation"""
+    run_ids = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            molecule, date_text, current = row[0].strip(), row[1].strip(), _to_float(row[2])
+            match = _CHINESE_DATE_RE.search(date_text)
+            timestamp = datetime(*map(int, match.groups())).timestamp() if match else np.nan
+            run_id = f"evaporation-{_safe_name(molecule)}-{_safe_name(date_text)}"
+            if store.has_run(run_id) and not replace:
+                continue
+            store.create_run('evaporation', run_id, source=os.path.abspath(path), replace=replace,
+                             molecule=molecule, experiment_time=date_text, final_current=current)
+            store.append(run_id, 'current', [timestamp], [current])
+            run_ids.append(run_id)
+    return run_ids
+
+
+def ingest_all(store, replace=False):
+    """导入仓库中现有的全部记录文件，返回导入的运行数"""
+    import glob
+    count = 0
+    annealing = os.path.join(REPO_ROOT, 'Ann annealing')
+    paths = [path for path in sorted(glob.glob(os.path.join(annealing, 'temperature_log', '*.csv')))
+             if not os.path.basename(path).startswith('latency_')]
+    for files in group_temperature_csvs(paths).values():
+        count += ingest_temperature_csv(store, files, replace) is not None
+    for name in ('ai_log.airec', 'ai_log.txt'):
+        path = os.path.join(annealing, name)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            count += len(ingest_ai_log(store, path, replace))
+    path = os.path.join(REPO_ROOT, 'manipulator', 'pid_log.txt')
+    if os.path.exists(path):
+        count += ingest_pid_log(store, path, replace) is not None
+    path = os.path.join(REPO_ROOT, 'Component evaporation system', 'evaporation_history.csv')
+    if os.path.exists(path):
+        count += len(ingest_evaporation_history(store, path, replace))
+    return count
+
+
+def _parse_query_value(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+if __name__ == "__main__":
+    store = TelemetryStore()
+    if len(sys.argv) >= 2 and sys.argv[1] == 'ingest':
+        start = time.perf_counter()
+        count = ingest_all(store, replace='--replace' in sys.argv)
+        print(f"Ingested {count} runs into {store.root} in {time.perf_counter() - start:.2f} s")
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'runs':
+        query = dict(arg.split('=', 1) for arg in sys.argv[2:])
+        subsystem = query.pop('subsystem', None)
+        runs = store.find_runs(subsystem, **{k: _parse_query_value(v) for k, v in query.items()})
+        for info in runs:
+            print(json.dumps(info, ensure_ascii=False, default=str))
+        print(f"{len(runs)} runs")
+    else:
+        print(__doc__)
+    store.close()
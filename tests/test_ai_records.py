@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Ann annealing'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Ann annealing', 'AI_Model'))
+import ai_records
+from log import log_to_file
+
+
+def test_parse_line_written_by_log_to_file(tmp_path):
+    log_path = str(tmp_path / 'ai_log.txt')
+    log_to_file(log_path, "Current Value: 312.50, Output: 1.250, Voltage: 24.800, Time Interval: 1.00 s")
+    log_to_file(log_path, "Current Value: 313.00, Output: 1.300, Voltage: Not measured, Time Interval: 1.01 s")
+    with open(log_path) as f:
+        lines = f.readlines()
+
+    assert ai_records.parse_log_line(lines[0]) == (312.5, 1.25, 24.8, 1.0)
+    current_value, output, voltage, interval = ai_records.parse_log_line(lines[1])
+    assert (current_value, output, interval) == (313.0, 1.3, 1.01) and voltage != voltage
+
+    records = ai_records.read_text_log(log_path)
+    assert (records['kind'] == ai_records.SAMPLE).all()
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Ann annealing', 'AI_Model'))
+import dataset_cache
+from data import process_data
+
+
+def _line(rng):
+    return (f"Current Value: {rng.uniform(200, 400):.2f}, Output: {rng.uniform(0, 3):.3f}, "
+            f"Voltage: {rng.uniform(0, 30):.3f}, Time Interval: 1.0 s\n")
+
+
+def _assert_same(cache, log_path):
+    cached = cache.load(verbose=False)
+    expected = process_data(str(log_path), verbose=False)
+    for got, want in zip(cached, expected):
+        np.testing.assert_array_equal(got, want)
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(dataset_cache, 'SEGMENT_BYTES', 300)
+
+
+def test_wrapped_log_truncated_at_segment_boundary(tmp_path, small_segments):
+    rng = np.random.default_rng(0)
+    log_path = tmp_path / 'ai_log.txt'
+    log_path.write_text(''.join(_line(rng) for _ in range(60)))
+    cache = dataset_cache.DatasetCache(str(log_path), str(tmp_path / 'cache'), chunk_lines=4)
+    _assert_same(cache, log_path)
+    assert cache.wrapped
+
+    # 截断到某一段的末尾：剩下的段内容未变，但第 0 行的窗口所用的最后一行变了
+    segment_end = dataset_cache.json.load(open(cache.meta_path))['segments'][6]['end']
+    with open(log_path, 'r+b') as f:
+        f.truncate(segment_end)
+    _assert_same(cache, log_path)
+
+
+def test_wrapped_log_random_edits_match_process_data(tmp_path, small_segments):
+    rng = np.random.default_rng(1)
+    for trial in range(20):
+        log_path = tmp_path / f'ai_log_{trial}.txt'
+        lines = [_line(rng) for _ in range(40)]
+        log_path.write_text(''.join(lines))
+        cache = dataset_cache.DatasetCache(str(log_path), str(tmp_path / 'cache'), chunk_lines=4)
+        _assert_same(cache, log_path)
+        for _ in range(4):
+            action = rng.integers(4)
+            if action == 0:
+                lines += [_line(rng) for _ in range(rng.integers(1, 10))]
+            elif action == 1:
+                lines = lines[:rng.integers(1, len(lines) + 1)]
+            elif action == 2:
+                lines[rng.integers(len(lines))] = _line(rng)
+            text = ''.join(lines)
+            if action == 3:
+                text += _line(rng)[:rng.integers(10, 40)]  # 不完整的末行
+            log_path.write_text(text)
+            _assert_same(cache, log_path)
@@ -0,0 +1,108 @@
+import os
+import socket
+import sys
+import threading
+from concurrent.futures import wait
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrument_broker import BrokerClient, BrokerError, InstrumentBroker, SimulatedPowerSupply
+from common.scpi import SCPISession
+
+
+class FaultyPowerSupply(SimulatedPowerSupply):
+    """记录收到的写入，第一次收到 fail_on 时等待 release 后写入失败"""
+
+    def __init__(self, resource_name, fail_on):
+        super().__init__(resource_name)
+        self.fail_on = fail_on
+        self.release = threading.Event()
+        self.received = []
+
+    def write(self, message):
+        self.received.append(message)
+        if message == self.fail_on:
+            self.fail_on = None
+            self.release.wait(5)
+            raise IOError("injected write error")
+        return super().write(message)
+
+
+AUTHKEY = b'test-broker-key'
+
+
+@pytest.fixture
+def broker():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        address = ('localhost', s.getsockname()[1])
+    instruments = {}
+
+    def open_instrument(name):
+        instruments[name] = FaultyPowerSupply(name, fail_on="VOLT 5")
+        return instruments[name]
+
+    server = InstrumentBroker(address, authkey=AUTHKEY, open_instrument=open_instrument)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        try:
+            client = BrokerClient("test", address, AUTHKEY)
+            break
+        except ConnectionRefusedError:
+            threading.Event().wait(0.02)
+    yield client, instruments, address
+    client.close()
+    server.close()
+
+
+def test_pipelined_write_error_drops_only_its_own_cache(broker):
+    client, instruments, _ = broker
+    resource = client.open_resource("SIM::POWER")
+    session = SCPISession(resource)
+
+    session.set({'VOLT': 5})
+    instrument = instruments["SIM::POWER"]
+    instrument.release.set()
+    wait([future for future, _ in session._inflight])
+
+    # 之前写入的错误在下一次设置时抛出，但本次的指令仍然被发送
+    with pytest.raises(BrokerError):
+        session.set({'CURR': 1})
+    resource.flush()
+    assert instrument.received == ["VOLT 5", "CURR 1"]
+    assert session.state == {'CURR': '1'}
+
+    # 失败写入的缓存已清除，相同的设置会重新发送
+    assert session.set({'VOLT': 5, 'CURR': 1})
+    resource.flush()
+    assert instrument.received[-1] == "VOLT 5"
+    assert instrument.voltage == 5.0 and instrument.current == 1.0
+    resource.close()
+
+
+class _Payload:
+    executed = False
+
+    def __reduce__(self):
+        return setattr, (_Payload, 'executed', True)
+
+
+def test_broker_does_not_unpickle_requests(broker):
+    _, _, address = broker
+    conn = Client(address, authkey=AUTHKEY)
+    conn.send((1, 'status', None, _Payload()))  # pickle 数据：代理应当断开而不是反序列化
+    with pytest.raises(EOFError):
+        conn.recv_bytes()
+    conn.close()
+    assert not _Payload.executed
+
+
+def test_broker_rejects_wrong_authkey(broker):
+    client, _, address = broker
+    with pytest.raises(AuthenticationError):
+        Client(address, authkey=b'wrong-key')
+    assert client.status() is not None  # 代理继续服务
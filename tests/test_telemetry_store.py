@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.telemetry_store import TelemetryStore, group_temperature_csvs, ingest_temperature_csv
+
+HEADER = "# Setpoint: 300, Heating Rate: 1.0, Called from main_aototest: False\n" \
+         "Timestamp,Monotonic,Temperature,Output,Voltage,Mode\n"
+
+
+def test_rotated_parts_are_ingested_as_one_run(tmp_path):
+    log_dir = tmp_path / 'temperature_log'
+    log_dir.mkdir()
+    for suffix, second in (('', 0), ('_part1', 1), ('_part2', 2)):
+        (log_dir / f'temperature_log_20260101_120000{suffix}.csv').write_text(
+            HEADER + f"2026-01-01 12:00:0{second}.000,{second}.000,300.00,1.00,25.000,ai\n")
+    paths = sorted(str(path) for path in log_dir.iterdir())
+
+    groups = group_temperature_csvs(paths)
+    assert list(groups) == ['temperature_log_20260101_120000']
+
+    store = TelemetryStore(str(tmp_path / 'telemetry'))
+    try:
+        run_id = ingest_temperature_csv(store, groups['temperature_log_20260101_120000'])
+        assert [run['run_id'] for run in store.find_runs(subsystem='anneal')] == [run_id]
+        times, _ = store.read(run_id, 'temperature')
+        assert len(times) == 3 and (times[1:] > times[:-1]).all()
+    finally:
+        store.close()